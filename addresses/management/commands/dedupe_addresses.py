@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from addresses.models import Address, AddressLines
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the content hash of the addresses and merge the duplicated `Address` and "
+        "`AddressLines` rows, repointing the references to the oldest row of each content."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="number of rows read and merged per transaction. Defaults to 1000."
+        )
+
+    def handle(self, *args, batch_size: int, **options):
+        merged = self.dedupe(
+            Address,
+            fields=['country', 'state', 'city', 'postal_code'],
+            references=[(AddressLines, 'address_id')],
+            batch_size=batch_size,
+        )
+        self.stdout.write(f"{merged} duplicated base addresses merged")
+
+        merged = self.dedupe(
+            AddressLines,
+            fields=['address__content_hash', 'line1', 'line2'],
+            references=[(get_user_model(), 'address_id')],
+            batch_size=batch_size,
+        )
+        self.stdout.write(f"{merged} duplicated address lines merged")
+
+    def dedupe(
+        self,
+        model: type[models.Model],
+        fields: list[str],
+        references: list[tuple[type[models.Model], str]],
+        batch_size: int,
+    ) -> int:
+        """walk the model table by primary key, in batches, computing the content hash of each
+        row. The first row of each content is kept and the next ones are merged into it.
+
+        Args:
+            model (type[Model]): `Address` or `AddressLines`.
+            fields (list[str]): the fields passed, in order, to `model.compute_content_hash`.
+            references (list[tuple[type[Model], str]]): the models and the fields to repoint.
+            batch_size (int): the number of rows per batch.
+
+        Returns:
+            int: the number of duplicated rows deleted.
+        """
+        merged = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values('pk', 'content_hash', *fields)[:batch_size]
+            )
+            if not rows:
+                return merged
+            last_pk = rows[-1]['pk']
+
+            hashes = {row['pk']: model.compute_content_hash(*(row[f] for f in fields)) for row in rows}
+            canonical = dict(
+                model.objects.filter(content_hash__in=hashes.values()).values_list('content_hash', 'pk')
+            )
+            duplicates: dict[int, list[int]] = {}
+            to_hash = []
+            for row in rows:
+                content_hash = hashes[row['pk']]
+                target = canonical.setdefault(content_hash, row['pk'])
+                if target != row['pk']:
+                    duplicates.setdefault(target, []).append(row['pk'])
+                elif row['content_hash'] != content_hash:
+                    to_hash.append(model(pk=row['pk'], content_hash=content_hash))
+
+            with transaction.atomic():
+                for target, pks in duplicates.items():
+                    for ref_model, ref_field in references:
+                        ref_model.objects.filter(**{f'{ref_field}__in': pks}).update(**{ref_field: target})
+                    model.objects.filter(pk__in=pks).delete()
+                    merged += len(pks)
+
+                model.objects.filter(pk__in=[obj.pk for obj in to_hash]).update(content_hash=None)
+                model.objects.bulk_update(to_hash, ['content_hash'], batch_size=batch_size)
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('addresses', '0002_alter_address_options_alter_addresslines_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='addresslines',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True, verbose_name='content hash'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+import unicodedata
+from hashlib import sha256
+
+from django.db import migrations
+
+
+def content_hash(*parts):
+    """frozen copy of `addresses.models.content_hash` as of this migration"""
+    normalized = '\x1f'.join(' '.join(unicodedata.normalize('NFKC', str(part)).split()).casefold() for part in parts)
+    return sha256(normalized.encode()).hexdigest()
+
+
+def rehash_lines(apps, schema_editor):
+    """the lines hash is now made from the base address hash instead of its id. The lines
+    whose base addresses are still duplicated get the same hash, they are left without one for
+    the `dedupe_addresses` command to merge them."""
+    AddressLines = apps.get_model('addresses', 'AddressLines')
+    rows = AddressLines.objects.filter(address__content_hash__isnull=False).values_list(
+        'pk', 'address__content_hash', 'line1', 'line2'
+    )
+    hashes: dict[str, int | None] = {}
+    for pk, address_hash, line1, line2 in rows.iterator(chunk_size=1000):
+        new_hash = content_hash(address_hash, line1, line2)
+        hashes[new_hash] = None if new_hash in hashes else pk
+
+    AddressLines.objects.update(content_hash=None)
+    to_hash = [AddressLines(pk=pk, content_hash=new_hash) for new_hash, pk in hashes.items() if pk is not None]
+    AddressLines.objects.bulk_update(to_hash, ['content_hash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('addresses', '0003_address_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(rehash_lines, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,67 @@
+import re
+import unicodedata
+from hashlib import sha256
 from typing import Any
 
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.utils.translation import gettext_lazy as _
 
 
+def normalize_address_part(value: str) -> str:
+    """normalize an address field to compare addresses by content, ignoring the case,
+    the unicode form and repeated whitespaces"""
+    value = unicodedata.normalize('NFKC', value or '')
+    return ' '.join(value.split()).casefold()
+
+
+def content_hash(*parts: Any) -> str:
+    """return the sha256 hex digest of the normalized parts"""
+    normalized = '\x1f'.join(normalize_address_part(str(part)) for part in parts)
+    return sha256(normalized.encode()).hexdigest()
+
+
+def save_deduplicated(obj: models.Model, save: Any, *args, **kwargs) -> None:
+    """insert a new row with `save`, or make `obj` the existing row with the same content
+    hash. The rows are shared by content, so creating an existing content reuses it instead
+    of failing on the unique hash. `obj` is reloaded from the existing row, whose values may
+    differ from the given ones in case or spacing."""
+    if not obj._state.adding:
+        save(*args, **kwargs)
+        return
+
+    using = kwargs.get('using') or router.db_for_write(type(obj), instance=obj)
+    try:
+        with transaction.atomic(using=using):
+            save(*args, **kwargs)
+    except IntegrityError:
+        existing = type(obj)._default_manager.using(using).filter(
+            content_hash=obj.content_hash
+        ).values_list('pk', flat=True).first()
+        if existing is None:
+            raise
+        obj.pk = existing
+        obj._state.adding = False
+        obj._state.db = using
+        obj.refresh_from_db(using=using)
+
+
+class AddressManager(models.Manager):
+    def get_or_create_by_content(
+        self, country: str, state: str, city: str, postal_code: str
+    ) -> tuple["Address", bool]:
+        """return the address with the same content, creating it if doesn't exist. The lookup
+        is done by the indexed `content_hash` field."""
+        return self.get_or_create(
+            content_hash=Address.compute_content_hash(country, state, city, postal_code),
+            defaults={
+                'country': country,
+                'state': state,
+                'city': city,
+                'postal_code': postal_code,
+            }
+        )
+
+
 class Address(models.Model):
     """model that represent the base address information.
 
@@ -12,32 +70,108 @@ class Address(models.Model):
         state (CharField): the state from the address.
         city (CharField): the address city.
         postal_code (CharField):
+        content_hash (CharField): hash of the normalized content, used to deduplicate addresses.
     """
     country = models.CharField(_("country"), max_length=2)
     state = models.CharField(_("state"), max_length=2)
     city = models.CharField(_("city"), max_length=255)
     postal_code = models.CharField(_("postal code"), max_length=15)
+    content_hash = models.CharField(
+        _("content hash"), max_length=64, unique=True, null=True, editable=False
+    )
+
+    objects: AddressManager = AddressManager()
 
     class Meta:
         verbose_name = _("Base address")
         verbose_name_plural = _("Base addresses")
 
+    @staticmethod
+    def compute_content_hash(country: str, state: str, city: str, postal_code: str) -> str:
+        postal_code = re.sub(r'[\s.-]', '', postal_code or '')
+        return content_hash(country, state, city, postal_code)
+
+    def save(self, *args, **kwargs):
+        adding, previous_hash = self._state.adding, self.content_hash
+        self.content_hash = self.compute_content_hash(
+            self.country, self.state, self.city, self.postal_code
+        )
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash'}
+        save_deduplicated(self, super().save, *args, **kwargs)
+        if not adding and previous_hash != self.content_hash:
+            self.rehash_lines()
+
+    def rehash_lines(self) -> None:
+        """update the hash of the lines of the address, made from its content"""
+        lines = list(self.addresslines_set.only('pk', 'line1', 'line2'))
+        for row in lines:
+            row.content_hash = AddressLines.compute_content_hash(self.content_hash, row.line1, row.line2)
+        AddressLines.objects.bulk_update(lines, ['content_hash'], batch_size=1000)
+
+
+class AddressLinesManager(models.Manager):
+    def get_or_create_by_content(
+        self, line1: str, line2: str = '', **address
+    ) -> tuple["AddressLines", bool]:
+        """return the address lines with the same content, creating it and the base address
+        if they don't exist. The existing content is found by a single query on the indexed
+        `content_hash` field.
+
+        Args:
+            line1 (str): the first line of the address.
+            line2 (str, optional): the second line of the address.
+            address (Mapping): the `country`, `state`, `city` and `postal_code` of the base address.
+        """
+        lines_hash = AddressLines.compute_content_hash(Address.compute_content_hash(**address), line1, line2)
+        lines = self.select_related('address').filter(content_hash=lines_hash).first()
+        if lines is not None:
+            return lines, False
+
+        base_address, _created = Address.objects.get_or_create_by_content(**address)
+        return self.get_or_create(
+            content_hash=lines_hash,
+            defaults={'line1': line1, 'line2': line2, 'address': base_address}
+        )
+
 
 class AddressLines(models.Model):
-    """Store the line fields of an address
+    """Store the line fields of an address. The rows are shared by all the users with the
+    same address, so to change the address of an user prefer to point him to the result of
+    `AddressLines.objects.get_or_create_by_content` instead of editing the row.
     
     Args:
         line1 (CharField, required): the first line of the address.
         line2 (CharField, optional): the second line of the address.
+        content_hash (CharField): hash of the normalized lines and the base address hash.
     """
     line1 = models.CharField(_("line 1"),  max_length=150)
     line2 = models.CharField(_("line 2"),  max_length=150, blank=True)
     address = models.ForeignKey(Address, on_delete=models.DO_NOTHING)
+    content_hash = models.CharField(
+        _("content hash"), max_length=64, unique=True, null=True, editable=False
+    )
+
+    objects: AddressLinesManager = AddressLinesManager()
 
     class Meta:
         verbose_name = _("Address lines")
         verbose_name_plural = _("Address lines")
     
+    @staticmethod
+    def compute_content_hash(address_hash: str, line1: str, line2: str) -> str:
+        # by the base address content, so the lines are found without the base address id
+        return content_hash(address_hash, line1, line2)
+
+    def save(self, *args, **kwargs):
+        address_hash = self.address.content_hash or self.address.compute_content_hash(
+            self.address.country, self.address.state, self.address.city, self.address.postal_code
+        )
+        self.content_hash = self.compute_content_hash(address_hash, self.line1, self.line2)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash'}
+        save_deduplicated(self, super().save, *args, **kwargs)
+
     def __str__(self):
         return self.line1
     
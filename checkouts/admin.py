@@ -1,3 +1,50 @@
 from django.contrib import admin
 
-# Register your models here.
+from utils.admin import LargeTableAdminMixin
+
+from .models import DailyRevenue, Payment, WebhookEvent
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'object_id', 'account', 'created']
+    list_filter = ['event_type', 'account']
+    search_fields = ['^event_id', '^object_id']
+    date_hierarchy = 'day'
+    exclude = ['payload']
+    readonly_fields = ['event_id', 'event_type', 'object_id', 'account', 'created', 'day', 'received_at', 'data']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Payment)
+class PaymentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['payment_intent_id', 'customer_id', 'status', 'amount', 'currency', 'created']
+    list_filter = ['status', 'capture_method', 'currency', 'account']
+    search_fields = ['^payment_intent_id', '^customer_id']
+    readonly_fields = [field.name for field in Payment._meta.fields]
+
+
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ['day', 'currency', 'account', 'gross', 'refunded', 'disputed', 'net', 'payments']
+    list_filter = ['currency', 'account']
+    date_hierarchy = 'day'
+    ordering = ['-day', 'currency']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        if hasattr(response, 'context_data') and 'cl' in response.context_data:
+            # the totals of the filtered days, summed from one row per day and currency
+            response.context_data['revenue_totals'] = response.context_data['cl'].queryset.totals()
+        return response
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ChekcoutsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'checkouts'
+
+    def ready(self):
+        from django.conf import settings
+
+        if getattr(settings, 'STRIPE_WARMUP', False):
+            import os
+
+            from utils.stripe_sdk import reset_after_fork, warm_up
+
+            warm_up()
+            # app servers that load the app before forking the workers (like gunicorn `--preload`)
+            os.register_at_fork(after_in_child=reset_after_fork)
@@ -0,0 +1,210 @@
+"""Capture, cancel or refund many payment intents concurrently, under the outbound rate limit.
+
+The calls use idempotency keys derived from the action and the intent, so an interrupted run
+can be resumed (skipping the intents already in its result log) without acting twice on an
+intent even if it was processed but not logged."""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.db.models import F
+
+from utils.rate_limit import TokenBucket
+from utils.stripe_clients import get_client
+from utils.stripe_sdk import stripe
+
+from .models import Payment
+
+logger = logging.getLogger("djangoStripe")
+
+CAPTURE = 'capture'
+CANCEL = 'cancel'
+REFUND = 'refund'
+
+
+def _capture(client, payment_intent_id: str, options: dict) -> Any:
+    return client.payment_intents.capture(payment_intent_id, options=options)
+
+
+def _cancel(client, payment_intent_id: str, options: dict) -> Any:
+    return client.payment_intents.cancel(payment_intent_id, options=options)
+
+
+def _refund(client, payment_intent_id: str, options: dict) -> Any:
+    client.refunds.create({'payment_intent': payment_intent_id}, options=options)
+    # the intent stays succeeded, the refunded amount is in its charge
+    return client.payment_intents.retrieve(payment_intent_id, {'expand': ['latest_charge']})
+
+
+ACTIONS: dict[str, Callable] = {CAPTURE: _capture, CANCEL: _cancel, REFUND: _refund}
+
+# the local status of the intents each action applies to
+ACTION_STATUSES = {
+    CAPTURE: [Payment.REQUIRES_CAPTURE],
+    CANCEL: [Payment.REQUIRES_CAPTURE, 'requires_payment_method', 'requires_confirmation', 'requires_action'],
+    REFUND: [Payment.SUCCEEDED],
+}
+
+
+@dataclass
+class BulkActionReport:
+    """Result of a bulk action on payment intents.
+
+    Args:
+        succeeded (list[str]): the intents the action was applied to.
+        failed (dict[str, str]): the error message by intent of the failed calls.
+        skipped (list[str]): the intents already processed by the resumed run.
+    """
+    succeeded: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    skipped: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class ResultLog:
+    """append only JSONL log with the result of each intent, also the checkpoint of the run:
+    every line is flushed as written, so an interrupted run loses nothing already done"""
+    def __init__(self, path: Path | str | None):
+        self.path = Path(path) if path else None
+        self._file = None
+
+    def done(self, action: str) -> set[str]:
+        """the intents the action already succeeded on, by the previous runs"""
+        if self.path is None or not self.path.exists():
+            return set()
+
+        done = set()
+        with self.path.open() as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # line cut by the interruption
+                    continue
+                if entry.get('action') == action and entry.get('ok'):
+                    done.add(entry['payment_intent'])
+        return done
+
+    def write(self, **entry) -> None:
+        if self.path is None:
+            return
+        entry['at'] = datetime.now(dt_timezone.utc).isoformat()
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.path.open('a')
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BulkPaymentAction:
+    """Apply an action to many payment intents concurrently.
+
+    Args:
+        action (str): `capture`, `cancel` or `refund`.
+        max_workers (int, optional): the maximum of concurrent stripe calls. Defaults to the
+            `STRIPE_BULK_MAX_WORKERS` setting or 8.
+        rate (float, optional): the maximum of calls per second. Defaults to the
+            `STRIPE_BULK_RATE_LIMIT` setting or 25, the stripe live mode limit is 100.
+        log_path (Path | str, optional): the JSONL result log, also used to resume the run.
+        retries (int): attempts again after a rate limit error of stripe.
+    """
+    def __init__(
+        self,
+        action: str,
+        max_workers: int | None = None,
+        rate: float | None = None,
+        log_path: Path | str | None = None,
+        retries: int = 3,
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action `{action}`, use one of {sorted(ACTIONS)}")
+        self.action = action
+        self.max_workers = max_workers or getattr(settings, 'STRIPE_BULK_MAX_WORKERS', 8)
+        self.bucket = TokenBucket(rate or getattr(settings, 'STRIPE_BULK_RATE_LIMIT', 25))
+        self.log = ResultLog(log_path)
+        self.retries = retries
+
+    def select(self, statuses: list[str] | None = None, metadata: dict[str, str] | None = None, **filters):
+        """return the local payments the action applies to, by default all with the status the
+        action accepts, filtered by metadata values and any other `Payment` field lookups. The
+        refund skips the payments already fully refunded."""
+        qs = Payment.objects.filter(status__in=statuses or ACTION_STATUSES[self.action], **filters)
+        if self.action == REFUND:
+            qs = qs.filter(amount_refunded__lt=F('amount_received'))
+        for key, value in (metadata or {}).items():
+            qs = qs.filter(**{f'metadata__{key}': value})
+        return qs.order_by('created', 'id')
+
+    def apply(self, payment_intent_id: str, account: str) -> Any:
+        """apply the action to one intent, waiting for the rate limit"""
+        options = {'idempotency_key': f'bulk-{self.action}-{payment_intent_id}'}
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                return ACTIONS[self.action](get_client(account), payment_intent_id, options)
+            except stripe.RateLimitError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _call(self, payment: tuple[str, str]) -> tuple[str, str, Any, str | None]:
+        """runs in the worker threads, only calling stripe. The database is updated by the
+        thread running the bulk, so the workers don't hold database connections."""
+        payment_intent_id, account = payment
+        try:
+            return payment_intent_id, account, self.apply(payment_intent_id, account), None
+        except stripe.StripeError as e:
+            return payment_intent_id, account, None, e.user_message or str(e)
+
+    def run(self, payments: Iterable[tuple[str, str]] | Any) -> BulkActionReport:
+        """apply the action to the payments, a `Payment` queryset or (intent id, account) pairs,
+        skipping the intents already done by the previous runs with the same log"""
+        if hasattr(payments, 'values_list'):
+            payments = payments.values_list('payment_intent_id', 'account').iterator(chunk_size=1000)
+
+        report = BulkActionReport()
+        done = self.log.done(self.action)
+
+        def not_done():
+            for payment in payments:
+                if payment[0] in done:
+                    report.skipped.append(payment[0])
+                else:
+                    yield payment
+
+        pending = not_done()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                # submits a few batches at a time, so the queue doesn't hold all the intents
+                while batch := list(islice(pending, self.max_workers * 4)):
+                    for payment_intent_id, account, intent, error in pool.map(self._call, batch):
+                        if error is not None:
+                            report.failed[payment_intent_id] = error
+                            self.log.write(action=self.action, payment_intent=payment_intent_id, ok=False, error=error)
+                            continue
+
+                        Payment.objects.sync_from_stripe(intent, account=account, event_created=int(time.time()))
+                        report.succeeded.append(payment_intent_id)
+                        self.log.write(
+                            action=self.action, payment_intent=payment_intent_id, ok=True, status=intent['status']
+                        )
+        finally:
+            self.log.close()
+
+        if report.failed:
+            logger.error(f"bulk {self.action} failed on {len(report.failed)} payment intents")
+        return report
@@ -0,0 +1,91 @@
+"""Datasets of the staff exports (see `utils.exports`), by name. Each dataset reads `values()`
+rows with the joins it needs, by chunks, so millions of rows stream at flat memory."""
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Iterator
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from stripe_customers.models import StripeCustomer
+
+from .models import Payment
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """an export: the queryset, the exported `values()` fields (the export columns, renamed
+    by `columns`) and the date field filtered by the `from` and `to` filters"""
+    queryset: Callable[[], QuerySet]
+    fields: list[str]
+    columns: dict[str, str]
+    date_field: str
+    filters: tuple[str, ...] = ()
+
+    @property
+    def column_names(self) -> list[str]:
+        return [self.columns.get(field, field) for field in self.fields]
+
+
+DATASETS = {
+    'customers': Dataset(
+        queryset=lambda: StripeCustomer.objects.all(),
+        fields=[
+            'customer_id', 'account', 'user__username', 'user__email', 'user__first_name',
+            'user__last_name', 'user__phone', 'user__date_joined', 'user__address__line1',
+            'user__address__line2', 'user__address__address__city', 'user__address__address__state',
+            'user__address__address__postal_code', 'user__address__address__country',
+        ],
+        columns={
+            'user__username': 'username', 'user__email': 'email', 'user__first_name': 'first_name',
+            'user__last_name': 'last_name', 'user__phone': 'phone', 'user__date_joined': 'date_joined',
+            'user__address__line1': 'line1', 'user__address__line2': 'line2',
+            'user__address__address__city': 'city', 'user__address__address__state': 'state',
+            'user__address__address__postal_code': 'postal_code',
+            'user__address__address__country': 'country',
+        },
+        date_field='user__date_joined',
+        filters=('account',),
+    ),
+    'payments': Dataset(
+        queryset=lambda: Payment.objects.all(),
+        fields=[
+            'payment_intent_id', 'customer_id', 'account', 'status', 'capture_method', 'amount',
+            'amount_capturable', 'amount_received', 'currency', 'metadata', 'created',
+        ],
+        columns={},
+        date_field='created',
+        filters=('account', 'status', 'currency', 'customer_id'),
+    ),
+}
+
+
+def export_rows(
+    name: str,
+    start: date | None = None,
+    end: date | None = None,
+    chunk_size: int | None = None,
+    **filters: Any,
+) -> tuple[list[str], Iterator[dict[str, Any]]]:
+    """return the column names and the rows of the dataset, filtered by the day range of its
+    date field and the supported equality filters (the others are ignored)
+
+    Raises:
+        KeyError: if the dataset doesn't exist.
+    """
+    dataset = DATASETS[name]
+    qs = dataset.queryset()
+    if start is not None:
+        qs = qs.filter(**{f'{dataset.date_field}__date__gte': start})
+    if end is not None:
+        qs = qs.filter(**{f'{dataset.date_field}__date__lte': end})
+    qs = qs.filter(**{key: value for key, value in filters.items() if key in dataset.filters and value})
+
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    # ordered by primary key so the server side cursor reads the table in index order
+    rows = qs.order_by('pk').values(*dataset.fields).iterator(chunk_size=chunk_size)
+    renamed = (
+        {dataset.columns.get(field, field): value for field, value in row.items()}
+        for row in rows
+    )
+    return dataset.column_names, renamed
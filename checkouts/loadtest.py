@@ -0,0 +1,298 @@
+"""Load test tooling: a local stand-in of the stripe API and a runner which drives the
+checkout and webhook endpoints through the whole django stack at a target concurrency.
+
+The load writes synthetic payments, webhook events and revenue, so it runs against a throwaway
+test database (see `throwaway_database`). SQLite serializes the writes: with concurrent webhooks
+most of them fail with "database is locked" and the numbers measure SQLite, not the app, so
+load test with the production database engine (like PostgreSQL)."""
+import hmac
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Callable, Iterator
+from urllib.parse import parse_qs
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import path
+
+from utils.stripe_clients import get_account_config
+from utils.support import percentile
+
+from . import views
+
+logger = logging.getLogger("djangoStripe")
+
+
+class StripeStandInHandler(BaseHTTPRequestHandler):
+    """answer the stripe API calls made by the checkout views with minimal objects"""
+    ids = count(1)
+    routes = [
+        ('POST', r'^/v1/checkout/sessions$', 'checkout.session'),
+        ('GET', r'^/v1/checkout/sessions/(?P<id>[\w-]+)$', 'checkout.session'),
+        ('POST', r'^/v1/payment_intents$', 'payment_intent'),
+        ('GET', r'^/v1/payment_intents/(?P<id>[\w-]+)$', 'payment_intent'),
+        ('POST', r'^/v1/customers$', 'customer'),
+        ('GET', r'^/v1/customers/(?P<id>[\w-]+)$', 'customer'),
+    ]
+
+    def log_message(self, format, *args):
+        return
+
+    def _object(self, kind: str, object_id: str | None, params: dict[str, Any]) -> dict[str, Any]:
+        n = next(self.ids)
+        if kind == 'checkout.session':
+            object_id = object_id or f'cs_test_{n}'
+            return {
+                'id': object_id,
+                'object': 'checkout.session',
+                'status': 'complete',
+                'url': f'https://checkout.stripe.com/c/pay/{object_id}',
+                'client_secret': f'{object_id}_secret',
+                'customer_email': 'loadtest@example.com',
+                'amount_total': 1000,
+            }
+        if kind == 'payment_intent':
+            object_id = object_id or f'pi_test_{n}'
+            return {
+                'id': object_id,
+                'object': 'payment_intent',
+                'status': 'succeeded',
+                'client_secret': f'{object_id}_secret',
+                'amount': int(params.get('amount', ['1000'])[0]),
+                'currency': params.get('currency', ['usd'])[0],
+                'customer': None,
+            }
+        return {'id': object_id or f'cus_test_{n}', 'object': 'customer', 'email': 'loadtest@example.com'}
+
+    def _handle(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url_path = self.path.split('?')[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_qs(self.rfile.read(length).decode()) if length else {}
+        for method, pattern, kind in self.routes:
+            match = re.match(pattern, url_path)
+            if method == self.command and match:
+                status, body = 200, self._object(kind, match.groupdict().get('id'), params)
+                break
+        else:
+            status, body = 404, {'error': {'type': 'invalid_request_error', 'message': 'unknown route'}}
+
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Request-Id', f'req_loadtest_{next(self.ids)}')
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class StripeStandIn:
+    """local http server speaking enough of the stripe API to the load test.
+
+    Args:
+        latency (float): seconds added to each response, to simulate the network.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StripeStandInHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> "StripeStandIn":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def sign_payload(payload: str, secret: str, timestamp: int | None = None) -> str:
+    """return the `Stripe-Signature` header of the payload, as stripe signs the webhooks"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def synthetic_event(event_type: str, n: int) -> str:
+    objects = {
+        'payment_intent.succeeded': {
+            'id': f'pi_loadtest_{n}', 'object': 'payment_intent', 'amount': 1000,
+            'amount_received': 1000, 'currency': 'usd', 'status': 'succeeded', 'customer': None,
+            'created': int(time.time()), 'capture_method': 'automatic', 'metadata': {},
+        },
+        'checkout.session.completed': {
+            'id': f'cs_loadtest_{n}', 'object': 'checkout.session', 'status': 'complete',
+            'amount_total': 1000, 'currency': 'usd', 'customer': None,
+        },
+        'customer.created': {'id': f'cus_loadtest_{n}', 'object': 'customer', 'email': f'loadtest{n}@example.com'},
+    }
+    return json.dumps({
+        'id': f'evt_loadtest_{n}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {'object': objects[event_type]},
+    })
+
+
+class LoadTestCheckoutSessionView(views.StripeCheckoutSessionView):
+    ui_mode = views.StripeCheckoutSessionView.HOSTED_UIMODE
+    rate_limits = {}  # all the load comes from the same client
+
+    def get_line_items(self, **kwargs):
+        kwargs.update({'price': 'price_loadtest', 'quantity': 1})
+        return super().get_line_items(**kwargs)
+
+
+class LoadTestPaymentIntentView(views.StripePaymentIntentView):
+    rate_limits = {}
+
+    def get_payment_intent_params(self, **extra):
+        params = super().get_payment_intent_params(**extra)
+        params['amount'] = 1000
+        return params
+
+
+urlpatterns = [
+    path('session/', LoadTestCheckoutSessionView.as_view(), name='checkout'),
+    path('intent/', LoadTestPaymentIntentView.as_view(), name='checkout_intent'),
+    path('success/', views.checkout_session_success_view, name='checkout_session_success'),
+    path('cancel/', views.checkout_session_cancel_view, name='checkout_session_cancel'),
+    path('return/', views.checkout_session_return_view, name='checkout_session_return'),
+    path('status/stream/', views.payment_status_stream_view, name='payment_status_stream'),
+    path('webhook/', views.StripeWebHookView.as_view(), name='stripe_webhook'),
+]
+
+
+ENDPOINTS = ['checkout_session', 'payment_intent', 'checkout_return', 'webhook']
+
+
+def endpoint_requests(webhook_secret: str) -> dict[str, Callable[[Client, int], Any]]:
+    """return, by endpoint name, the function which sends the n-th request with the client"""
+    event_types = ['payment_intent.succeeded', 'checkout.session.completed', 'customer.created']
+
+    def webhook(client: Client, n: int):
+        payload = synthetic_event(event_types[n % len(event_types)], n)
+        return client.post(
+            '/webhook/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, webhook_secret),
+        )
+
+    return {
+        'checkout_session': lambda client, n: client.post('/session/'),
+        'payment_intent': lambda client, n: client.post('/intent/'),
+        'checkout_return': lambda client, n: client.get('/return/', {'session_id': f'cs_test_{n}'}),
+        'webhook': webhook,
+    }
+
+
+def run_endpoint(send: Callable[[Client, int], Any], requests: int, concurrency: int) -> dict[str, Any]:
+    """send the requests with `concurrency` threads, each with its own client, and return the
+    throughput, latency percentiles (ms) and error rate"""
+    local = threading.local()
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(n: int):
+        nonlocal errors
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        start = time.perf_counter()
+        try:
+            failed = send(local.client, n).status_code >= 400
+        except Exception as e:
+            logger.debug(f"load test request failed: {str(e)}")
+            failed = True
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(requests / duration, 2) if duration else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p90': round(percentile(latencies, 90), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(latencies[-1], 2) if latencies else 0.0,
+        },
+    }
+
+
+def run(endpoints: list[str], requests: int, concurrency: int, stripe_latency: float) -> dict[str, Any]:
+    """load the endpoints one after the other against a stripe stand-in, with the urls of this
+    module, and return the results of `run_endpoint` by endpoint name"""
+    account = {**get_account_config('default'), 'secret_key': 'sk_test_loadtest'}
+    requests_by_endpoint = endpoint_requests(account['webhook_secret'])
+    report = {}
+    with StripeStandIn(latency=stripe_latency) as standin, override_settings(
+        ROOT_URLCONF=__name__,
+        ALLOWED_HOSTS=['testserver'],
+        REQUEST_DEADLINE_SECONDS=None,
+        STRIPE_ACCOUNTS={'default': {**account, 'api_base': standin.url}},
+        STRIPE_ACCOUNT_RESOLVER=None,
+    ):
+        for endpoint in endpoints:
+            report[endpoint] = run_endpoint(requests_by_endpoint[endpoint], requests, concurrency)
+    return report
+
+
+@contextmanager
+def throwaway_database(alias: str = DEFAULT_DB_ALIAS) -> Iterator[str]:
+    """run the block against a new test database of the alias, destroyed at the end, so the
+    load test doesn't write to the configured database. Yields the database vendor."""
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmpdir = None
+    if connection.vendor == 'sqlite' and not old_test_name:
+        # the default in memory test database locks whole tables between the threads
+        tmpdir = tempfile.mkdtemp(prefix='loadtest')
+        test_settings['NAME'] = os.path.join(tmpdir, 'loadtest.sqlite3')
+
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection.vendor
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
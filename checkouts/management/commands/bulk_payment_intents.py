@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from checkouts.bulk_payments import ACTIONS, BulkPaymentAction
+
+
+def metadata_pair(value: str) -> tuple[str, str]:
+    key, sep, metadata_value = value.partition('=')
+    if not sep or not key:
+        raise ValueError(value)
+    return key, metadata_value
+
+
+class Command(BaseCommand):
+    help = (
+        "Capture, cancel or refund the payment intents selected by their local status or "
+        "metadata, concurrently and under the rate limit. Runs with the same --log are resumed, "
+        "skipping the intents already done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=sorted(ACTIONS))
+        parser.add_argument('--id', dest='ids', action='append', default=[], help="payment intent id, repeatable.")
+        parser.add_argument(
+            '--status', dest='statuses', action='append', default=[],
+            help="local status, repeatable. Defaults to the statuses the action applies to.",
+        )
+        parser.add_argument(
+            '--metadata', action='append', default=[], type=metadata_pair,
+            help="metadata key=value the intents must have, repeatable.",
+        )
+        parser.add_argument('--account', help="only the intents of this stripe account.")
+        parser.add_argument('--limit', type=int, help="maximum of intents processed.")
+        parser.add_argument('--workers', type=int, help="concurrent stripe calls.")
+        parser.add_argument('--rate', type=float, help="maximum of stripe calls per second.")
+        parser.add_argument('--log', help="JSONL file with the result of each intent, the run checkpoint.")
+        parser.add_argument('--dry-run', action='store_true', help="only count the selected intents.")
+
+    def handle(self, *args, action, ids, statuses, metadata, account, limit, workers, rate, log, dry_run, **options):
+        if limit is not None and limit < 1:
+            raise CommandError("--limit must be positive")
+
+        bulk = BulkPaymentAction(action, max_workers=workers, rate=rate, log_path=log)
+        filters = {}
+        if ids:
+            filters['payment_intent_id__in'] = ids
+        if account:
+            filters['account'] = account
+        payments = bulk.select(statuses=statuses, metadata=dict(metadata), **filters)
+        if limit is not None:
+            payments = payments[:limit]
+
+        if dry_run:
+            self.stdout.write(f"{payments.count()} payment intents would be {action}d")
+            return
+
+        report = bulk.run(payments)
+        self.stdout.write(
+            f"{len(report.succeeded)} succeeded, {len(report.failed)} failed, "
+            f"{len(report.skipped)} skipped (already done)"
+        )
+        for payment_intent_id, error in report.failed.items():
+            self.stderr.write(f"{payment_intent_id}: {error}")
@@ -0,0 +1,36 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from checkouts.exports import DATASETS, export_rows
+from utils import exports
+
+
+class Command(BaseCommand):
+    help = "Stream a dataset export as CSV or JSON lines, optionally gzipped, at constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=exports.FORMATS, default=exports.CSV)
+        parser.add_argument('--gzip', action='store_true', help="gzip the output.")
+        parser.add_argument('--output', default='-', help="output file, `-` (default) for the stdout.")
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="first day (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="last day (YYYY-MM-DD).")
+        parser.add_argument('--chunk-size', type=int, help="rows read per database round trip.")
+        parser.add_argument(
+            '--filter', dest='filters', action='append', default=[],
+            help="field=value filter supported by the dataset, repeatable.",
+        )
+
+    def handle(self, *args, name, format, gzip, output, start, end, chunk_size, filters, **options):
+        filters = dict(item.split('=', 1) for item in filters if '=' in item)
+        columns, rows = export_rows(name, start, end, chunk_size=chunk_size, **filters)
+
+        out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for chunk in exports.stream_rows(rows, columns, format, compress=gzip):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from checkouts.models import WebhookEvent
+
+
+class Command(BaseCommand):
+    help = "Delete the archived webhook events older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'STRIPE_WEBHOOK_ARCHIVE_RETENTION_DAYS', 90),
+            help="retention in days. Defaults to the `STRIPE_WEBHOOK_ARCHIVE_RETENTION_DAYS` setting.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help="events deleted per query. Defaults to 1000."
+        )
+
+    def handle(self, *args, days: int, batch_size: int, **options):
+        deleted = WebhookEvent.objects.prune(days=days, batch_size=batch_size)
+        self.stdout.write(f"{deleted} webhook events older than {days} days deleted")
@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkouts import revenue
+from checkouts.models import Payment, RevenueEntry, WebhookEvent
+from utils.stripe_sdk import stripe
+
+# the archived events recorded by the backfill, by the function recording their object
+ARCHIVED_EVENTS = {
+    'refund.created': revenue.record_refund,
+    'refund.updated': revenue.record_refund,
+    'refund.failed': revenue.record_refund,
+    'charge.dispute.created': revenue.record_dispute,
+    'charge.dispute.closed': revenue.record_dispute,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily revenue rows of a day range from the revenue ledger. With "
+        "--backfill, first records in the ledger the succeeded payments and the archived refund "
+        "and dispute events not counted yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="first day (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="last day (YYYY-MM-DD).")
+        parser.add_argument('--backfill', action='store_true', help="record the missing entries first.")
+
+    def handle(self, *args, start, end, backfill, **options):
+        if start and end and start > end:
+            raise CommandError("--from must not be after --to")
+
+        if backfill:
+            recorded = self.backfill(start, end)
+            self.stdout.write(f"{recorded} revenue entries backfilled")
+
+        rows = revenue.rebuild(start, end)
+        self.stdout.write(f"{rows} daily revenue rows rebuilt")
+
+    def backfill(self, start: date | None, end: date | None) -> int:
+        recorded = 0
+        payments = Payment.objects.filter(status=Payment.SUCCEEDED).exclude(
+            payment_intent_id__in=RevenueEntry.objects.filter(kind=RevenueEntry.PAYMENT).values('object_id')
+        )
+        if start is not None:
+            payments = payments.filter(created__date__gte=start)
+        if end is not None:
+            payments = payments.filter(created__date__lte=end)
+        for payment in payments.iterator(chunk_size=1000):
+            recorded += revenue.record_payment({
+                'id': payment.payment_intent_id,
+                'amount': payment.amount,
+                'amount_received': payment.amount_received,
+                'currency': payment.currency,
+                'created': int(payment.created.timestamp()),
+            }, account=payment.account)
+
+        events = WebhookEvent.objects.between(start, end).filter(event_type__in=list(ARCHIVED_EVENTS))
+        for archived in events.only('event_type', 'account', 'payload').iterator(chunk_size=500):
+            event = stripe.Event.construct_from(archived.data, None)
+            recorded += ARCHIVED_EVENTS[archived.event_type](event.data.object, account=archived.account)
+        return recorded
@@ -0,0 +1,55 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkouts.models import WebhookEvent
+from checkouts.views import StripeWebHookView
+from utils.stripe_clients import use_account
+from utils.stripe_sdk import stripe
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the archived webhook events of a day range into the webhook callbacks, "
+        "in the order stripe created them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="first day (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="last day (YYYY-MM-DD).")
+        parser.add_argument('--type', dest='event_types', action='append', default=[], help="event type, repeatable.")
+        parser.add_argument('--object-id', help="only the events of this stripe object.")
+        parser.add_argument('--account', help="only the events of this stripe account.")
+        parser.add_argument('--dry-run', action='store_true', help="list the events without replaying.")
+
+    def handle(self, *args, start, end, event_types, object_id, account, dry_run, **options):
+        if start and end and start > end:
+            raise CommandError("--from must not be after --to")
+
+        qs = WebhookEvent.objects.between(start, end)
+        if event_types:
+            qs = qs.filter(event_type__in=event_types)
+        if object_id:
+            qs = qs.filter(object_id=object_id)
+        if account:
+            qs = qs.filter(account=account)
+
+        view = StripeWebHookView()
+        replayed = failed = 0
+        for archived in qs.only('event_id', 'event_type', 'account', 'payload').iterator(chunk_size=500):
+            if dry_run:
+                self.stdout.write(f"{archived.event_id} {archived.event_type}")
+                continue
+
+            event = stripe.Event.construct_from(archived.data, None)
+            try:
+                with use_account(archived.account):
+                    view.handle_event(event)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{archived.event_id} failed: {str(e)}")
+            else:
+                replayed += 1
+
+        if not dry_run:
+            self.stdout.write(f"{replayed} events replayed, {failed} failed")
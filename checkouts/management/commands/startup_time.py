@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup - start) * 1000,
+    'urls_ms': (urls - setup) * 1000,
+    'total_ms': (urls - start) * 1000,
+    'stripe_imported': 'stripe' in sys.modules,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure, in fresh processes, the time to set up django and import the url conf, "
+        "and list the modules with the highest import cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="processes measured. Defaults to 5.")
+        parser.add_argument('--top', type=int, default=10, help="slowest imports listed. Defaults to 10.")
+        parser.add_argument(
+            '--warmup', action='store_true',
+            help="measure the startup with `STRIPE_WARMUP` enabled, as the web workers.",
+        )
+        parser.add_argument('--format', choices=['text', 'json'], default='text')
+
+    def run_once(self, warmup: bool) -> tuple[dict, dict[str, int]]:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        env['STRIPE_WARMUP'] = '1' if warmup else '0'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        # "import time: self [us] | cumulative | imported package", only the top level modules
+        imports = {}
+        for match in re.finditer(r'^import time:\s+\d+ \|\s+(\d+) \| (\S+)$', result.stderr, re.MULTILINE):
+            imports[match.group(2)] = int(match.group(1))
+        return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+    def handle(self, *args, repeat, top, warmup, format, **options):
+        runs = [self.run_once(warmup) for _ in range(max(repeat, 1))]
+        timings = [timing for timing, _ in runs]
+        report = {
+            key: {
+                'min': round(min(t[key] for t in timings), 2),
+                'median': round(statistics.median(t[key] for t in timings), 2),
+            }
+            for key in ('setup_ms', 'urls_ms', 'total_ms')
+        }
+        report['stripe_imported'] = timings[-1]['stripe_imported']
+        slowest = sorted(runs[-1][1].items(), key=lambda item: item[1], reverse=True)[:top]
+        report['slowest_imports_ms'] = {module: round(us / 1000, 2) for module, us in slowest}
+
+        if format == 'json':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for key in ('setup_ms', 'urls_ms', 'total_ms'):
+            self.stdout.write(f"{key:<12} min {report[key]['min']:>9} | median {report[key]['median']:>9}")
+        self.stdout.write(f"stripe SDK imported on startup: {report['stripe_imported']}")
+        self.stdout.write("slowest imports (ms, cumulative):")
+        for module, ms in report['slowest_imports_ms'].items():
+            self.stdout.write(f"  {module:<40}{ms:>10}")
@@ -0,0 +1,74 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from checkouts import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the checkout session, payment intent, return and webhook endpoints at a target "
+        "concurrency against a local stripe stand-in, reporting throughput, latency percentiles "
+        "and error rates per endpoint. It runs against a throwaway test database of `--database`, "
+        "created and destroyed by the command. On SQLite the concurrent writes fail with "
+        "\"database is locked\", load test with the production database engine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            choices=loadtest.ENDPOINTS,
+            help="endpoint to load, can be repeated. Defaults to all.",
+        )
+        parser.add_argument('--requests', type=int, default=500, help="requests per endpoint. Defaults to 500.")
+        parser.add_argument('--concurrency', type=int, default=16, help="concurrent clients. Defaults to 16.")
+        parser.add_argument(
+            '--stripe-latency', type=float, default=0.05,
+            help="seconds added by the stripe stand-in to each response. Defaults to 0.05.",
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help="database whose engine the throwaway test database uses. Defaults to \"default\".",
+        )
+        parser.add_argument('--format', choices=['text', 'json'], default='text')
+        parser.add_argument('--output', help="file to write the json report to, to compare releases.")
+
+    def handle(self, *args, endpoints, requests, concurrency, stripe_latency, database, format, output, **options):
+        if requests < 1 or concurrency < 1:
+            raise CommandError("`--requests` and `--concurrency` must be positive")
+
+        endpoints = endpoints or loadtest.ENDPOINTS
+
+        app_logger = logging.getLogger("djangoStripe")
+        level = app_logger.level
+        if options['verbosity'] < 2:
+            app_logger.setLevel(logging.WARNING)
+
+        try:
+            with loadtest.throwaway_database(database) as vendor:
+                if vendor == 'sqlite' and concurrency > 1:
+                    self.stderr.write(self.style.WARNING(
+                        "SQLite serializes the writes: the concurrent requests writing to the database "
+                        "fail with \"database is locked\" and the results measure SQLite, not the app."
+                    ))
+                report = loadtest.run(endpoints, requests, concurrency, stripe_latency)
+        finally:
+            app_logger.setLevel(level)
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if format == 'json':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'endpoint':<18}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'errors':>10}")
+        for endpoint, result in report.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{endpoint:<18}{result['throughput_rps']:>10}{latency['p50']:>10}{latency['p95']:>10}"
+                f"{latency['p99']:>10}{latency['max']:>10}{result['error_rate']:>10.2%}"
+            )
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='event id')),
+                ('event_type', models.CharField(db_index=True, max_length=100, verbose_name='event type')),
+                ('object_id', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='object id')),
+                ('account', models.CharField(default='default', max_length=100, verbose_name='stripe account')),
+                ('created', models.DateTimeField(verbose_name='created on stripe')),
+                ('day', models.DateField(verbose_name='day')),
+                ('payload', models.BinaryField(verbose_name='compressed payload')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='received at')),
+            ],
+            options={
+                'verbose_name': 'webhook event',
+                'verbose_name_plural': 'webhook events',
+                'indexes': [models.Index(fields=['day', 'event_type'], name='webhook_day_type_idx')],
+            },
+        ),
+    ]
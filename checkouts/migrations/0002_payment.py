@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_intent_id', models.CharField(max_length=255, unique=True, verbose_name='payment intent id')),
+                ('customer_id', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='customer id')),
+                ('status', models.CharField(db_index=True, max_length=50, verbose_name='status')),
+                ('capture_method', models.CharField(blank=True, max_length=50, verbose_name='capture method')),
+                ('amount', models.PositiveBigIntegerField(verbose_name='amount')),
+                ('amount_capturable', models.PositiveBigIntegerField(default=0, verbose_name='amount capturable')),
+                ('amount_received', models.PositiveBigIntegerField(default=0, verbose_name='amount received')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('metadata', models.JSONField(blank=True, default=dict, verbose_name='metadata')),
+                ('account', models.CharField(default='default', max_length=100, verbose_name='stripe account')),
+                ('created', models.DateTimeField(db_index=True, verbose_name='created on stripe')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'payment',
+                'verbose_name_plural': 'payments',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0002_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('account', models.CharField(default='default', max_length=100, verbose_name='stripe account')),
+                ('gross', models.BigIntegerField(default=0, verbose_name='gross')),
+                ('refunded', models.BigIntegerField(default=0, verbose_name='refunded')),
+                ('disputed', models.BigIntegerField(default=0, verbose_name='disputed')),
+                ('payments', models.PositiveIntegerField(default=0, verbose_name='payments')),
+                ('refunds', models.PositiveIntegerField(default=0, verbose_name='refunds')),
+                ('disputes', models.PositiveIntegerField(default=0, verbose_name='disputes')),
+            ],
+            options={
+                'verbose_name': 'daily revenue',
+                'verbose_name_plural': 'daily revenues',
+                'constraints': [models.UniqueConstraint(fields=('day', 'currency', 'account'), name='daily_revenue_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('payment', 'payment'), ('refund', 'refund'), ('refund_reversal', 'failed refund'), ('dispute', 'dispute'), ('dispute_reversal', 'won dispute')], max_length=20, verbose_name='kind')),
+                ('object_id', models.CharField(max_length=255, verbose_name='stripe object id')),
+                ('amount', models.BigIntegerField(verbose_name='amount')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('day', models.DateField(verbose_name='day')),
+                ('account', models.CharField(default='default', max_length=100, verbose_name='stripe account')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, verbose_name='recorded at')),
+            ],
+            options={
+                'verbose_name': 'revenue entry',
+                'verbose_name_plural': 'revenue entries',
+                'indexes': [models.Index(fields=['day', 'currency'], name='revenue_entry_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('object_id', 'kind'), name='revenue_entry_object_kind_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0003_revenue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='amount_refunded',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='amount refunded'),
+        ),
+    ]
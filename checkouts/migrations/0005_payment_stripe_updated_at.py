@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkouts', '0004_payment_amount_refunded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='updated on stripe'),
+        ),
+    ]
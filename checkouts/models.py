@@ -1,7 +1,309 @@
-from django.db import models
+import json
+import logging
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Any
 
-# Create your models here.
-# class StripeCheckoutSessionModel(models.Model):
-#     session_id = models.CharField(max_length=100)
-#     customer_id = models.CharField(max_length=100)
-#     status = models.CharField(max_length=100)
\ No newline at end of file
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from utils.stripe_clients import DEFAULT_ACCOUNT, current_account, get_client
+
+logger = logging.getLogger("djangoStripe")
+
+# the payment intent statuses which never change again
+TERMINAL_INTENT_STATUSES = ('succeeded', 'canceled')
+
+
+class WebhookEventQuerySet(models.QuerySet):
+    def between(self, start: date | None = None, end: date | None = None) -> "WebhookEventQuerySet":
+        """filter the events received from the `start` day to the `end` day (both included),
+        in the order stripe created them. The filter only uses the `day` index."""
+        qs = self
+        if start is not None:
+            qs = qs.filter(day__gte=start)
+        if end is not None:
+            qs = qs.filter(day__lte=end)
+        return qs.order_by('day', 'created', 'id')
+
+    def prune(self, days: int | None = None, batch_size: int = 1000) -> int:
+        """delete the events older than `days` days, in batches to keep the transactions short.
+
+        Args:
+            days (int | None): the retention in days, by default the
+                `STRIPE_WEBHOOK_ARCHIVE_RETENTION_DAYS` setting.
+            batch_size (int): number of events deleted per query.
+
+        Returns:
+            int: the number of events deleted.
+        """
+        if days is None:
+            days = getattr(settings, 'STRIPE_WEBHOOK_ARCHIVE_RETENTION_DAYS', 90)
+        cutoff = timezone.now().date() - timedelta(days=days)
+
+        deleted = 0
+        while True:
+            ids = list(self.filter(day__lt=cutoff).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += self.model._base_manager.filter(id__in=ids).delete()[0]
+
+
+class WebhookEventManager(models.Manager.from_queryset(WebhookEventQuerySet)):
+    def archive(self, event: Any, payload: bytes, account: str = DEFAULT_ACCOUNT) -> bool:
+        """store the raw payload of a verified event, compressed. The retries of stripe for an
+        already archived event are ignored.
+
+        Args:
+            event (stripe.Event): the event built from the payload.
+            payload (bytes): the request body, as signed by stripe.
+            account (str): the stripe account which sent the event.
+
+        Returns:
+            bool: if the event was archived now.
+        """
+        data_object = event['data']['object']
+        created = datetime.fromtimestamp(event['created'], tz=dt_timezone.utc)
+        _obj, created_now = self.get_or_create(
+            event_id=event['id'],
+            defaults={
+                'event_type': event['type'],
+                'object_id': data_object.get('id') or '',
+                'account': account,
+                'created': created,
+                'day': created.date(),
+                'payload': zlib.compress(payload, getattr(settings, 'STRIPE_WEBHOOK_ARCHIVE_LEVEL', 6)),
+            },
+        )
+        return created_now
+
+
+class WebhookEvent(models.Model):
+    """Archive of the raw webhook payloads verified by `StripeWebHookView`, compressed with
+    zlib and bucketed by day, so old days are pruned and replayed by range."""
+    event_id = models.CharField(_("event id"), max_length=255, unique=True)
+    event_type = models.CharField(_("event type"), max_length=100, db_index=True)
+    object_id = models.CharField(_("object id"), max_length=255, blank=True, db_index=True)
+    account = models.CharField(_("stripe account"), max_length=100, default=DEFAULT_ACCOUNT)
+    created = models.DateTimeField(_("created on stripe"))
+    day = models.DateField(_("day"))
+    payload = models.BinaryField(_("compressed payload"))
+    received_at = models.DateTimeField(_("received at"), auto_now_add=True)
+
+    objects = WebhookEventManager()
+
+    class Meta:
+        verbose_name = _("webhook event")
+        verbose_name_plural = _("webhook events")
+        indexes = [
+            # also used by the range scans and the pruning, filtering only by day
+            models.Index(fields=['day', 'event_type'], name='webhook_day_type_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.event_type} {self.event_id}"
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """the decompressed event payload"""
+        return json.loads(zlib.decompress(self.payload))
+
+
+class PaymentManager(models.Manager):
+    def sync_from_stripe(
+        self, intent: Any, account: str | None = None, event_created: int | None = None
+    ) -> "Payment":
+        """Creates or updates the local copy of a stripe payment intent, as received from the
+        `payment_intent.*` webhooks or returned by the calls acting on it.
+
+        Args:
+            intent (stripe.PaymentIntent | Mapping): the stripe payment intent object.
+            account (str, optional): the stripe account of the intent. Defaults to the account
+                of the current request.
+            event_created (int, optional): the timestamp of the event (or of the call) the
+                intent comes from. The intents older than the stored state are ignored, stripe
+                doesn't send the webhooks in order, and so are the changes of a succeeded or
+                canceled intent, which stripe never changes again.
+        """
+        customer = intent.get('customer')
+        if customer is not None and not isinstance(customer, str):  # expanded customer object
+            customer = customer['id']
+
+        refunded = {}
+        charge = intent.get('latest_charge')
+        if charge is not None and not isinstance(charge, str):
+            # only known when the charge is expanded, kept as it is otherwise
+            refunded['amount_refunded'] = charge.get('amount_refunded') or 0
+
+        stripe_updated_at = datetime.fromtimestamp(event_created, tz=dt_timezone.utc) if event_created else None
+        with transaction.atomic():
+            current = self.select_for_update().filter(payment_intent_id=intent['id']).first()
+            if current is not None and (
+                (current.status in TERMINAL_INTENT_STATUSES and intent['status'] != current.status)
+                or (
+                    stripe_updated_at is not None and current.stripe_updated_at is not None
+                    and stripe_updated_at < current.stripe_updated_at
+                )
+            ):
+                logger.info(f"ignored the outdated state of the payment intent {intent['id']}")
+                return current
+
+            obj, _created = self.update_or_create(
+                payment_intent_id=intent['id'],
+                defaults={
+                    **refunded,
+                    'customer_id': customer or '',
+                    'status': intent['status'],
+                    'capture_method': intent.get('capture_method') or '',
+                    'amount': intent['amount'],
+                    'amount_capturable': intent.get('amount_capturable') or 0,
+                    'amount_received': intent.get('amount_received') or 0,
+                    'currency': intent['currency'],
+                    'metadata': dict(intent.get('metadata') or {}),
+                    'account': account or current_account(),
+                    'created': datetime.fromtimestamp(intent['created'], tz=dt_timezone.utc),
+                    'stripe_updated_at': stripe_updated_at or (current and current.stripe_updated_at),
+                },
+            )
+        return obj
+
+    def sync_refunded(self, obj: Any, account: str | None = None) -> int:
+        """Updates the refunded amount of the payment of a charge or refund, as received from
+        the `charge.refunded` and `refund.*` webhooks. The charge is retrieved from stripe, its
+        `amount_refunded` is the current total whatever the order of the webhooks. Returns the
+        number of payments updated.
+
+        Args:
+            obj (stripe.Charge | stripe.Refund | Mapping): the stripe charge or refund object.
+            account (str, optional): the stripe account of the object. Defaults to the account
+                of the current request.
+        """
+        charge_id = obj['id'] if obj['object'] == 'charge' else obj.get('charge')
+        if not charge_id:
+            return 0
+        if not isinstance(charge_id, str):  # expanded charge object
+            charge_id = charge_id['id']
+
+        charge = get_client(account).charges.retrieve(charge_id)
+        if not charge.get('payment_intent'):
+            return 0
+        return self.filter(payment_intent_id=charge['payment_intent']).update(
+            amount_refunded=charge.get('amount_refunded') or 0
+        )
+
+
+class Payment(models.Model):
+    """Local copy of the stripe payment intents, kept by the `payment_intent.*` webhooks, to
+    select the intents to act on without listing them on stripe."""
+    REQUIRES_CAPTURE = 'requires_capture'
+    SUCCEEDED = 'succeeded'
+    CANCELED = 'canceled'
+
+    payment_intent_id = models.CharField(_("payment intent id"), max_length=255, unique=True)
+    customer_id = models.CharField(_("customer id"), max_length=255, blank=True, db_index=True)
+    status = models.CharField(_("status"), max_length=50, db_index=True)
+    capture_method = models.CharField(_("capture method"), max_length=50, blank=True)
+    amount = models.PositiveBigIntegerField(_("amount"))
+    amount_capturable = models.PositiveBigIntegerField(_("amount capturable"), default=0)
+    amount_received = models.PositiveBigIntegerField(_("amount received"), default=0)
+    amount_refunded = models.PositiveBigIntegerField(_("amount refunded"), default=0)
+    currency = models.CharField(_("currency"), max_length=3)
+    metadata = models.JSONField(_("metadata"), default=dict, blank=True)
+    account = models.CharField(_("stripe account"), max_length=100, default=DEFAULT_ACCOUNT)
+    created = models.DateTimeField(_("created on stripe"), db_index=True)
+    stripe_updated_at = models.DateTimeField(_("updated on stripe"), null=True, blank=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    objects = PaymentManager()
+
+    class Meta:
+        verbose_name = _("payment")
+        verbose_name_plural = _("payments")
+
+    def __str__(self) -> str:
+        return self.payment_intent_id
+
+
+class RevenueEntry(models.Model):
+    """Ledger of the stripe objects already counted in `DailyRevenue`, so the webhook retries
+    and the replays don't count them twice."""
+    PAYMENT = 'payment'
+    REFUND = 'refund'
+    REFUND_REVERSAL = 'refund_reversal'
+    DISPUTE = 'dispute'
+    DISPUTE_REVERSAL = 'dispute_reversal'
+    KIND_CHOICES = [
+        (PAYMENT, _("payment")),
+        (REFUND, _("refund")),
+        (REFUND_REVERSAL, _("failed refund")),
+        (DISPUTE, _("dispute")),
+        (DISPUTE_REVERSAL, _("won dispute")),
+    ]
+
+    kind = models.CharField(_("kind"), max_length=20, choices=KIND_CHOICES)
+    object_id = models.CharField(_("stripe object id"), max_length=255)
+    amount = models.BigIntegerField(_("amount"))
+    currency = models.CharField(_("currency"), max_length=3)
+    day = models.DateField(_("day"))
+    account = models.CharField(_("stripe account"), max_length=100, default=DEFAULT_ACCOUNT)
+    recorded_at = models.DateTimeField(_("recorded at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("revenue entry")
+        verbose_name_plural = _("revenue entries")
+        constraints = [
+            models.UniqueConstraint(fields=['object_id', 'kind'], name='revenue_entry_object_kind_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'currency'], name='revenue_entry_day_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.object_id}"
+
+
+class DailyRevenueQuerySet(models.QuerySet):
+    def totals(self) -> dict[str, dict[str, int]]:
+        """sum the days of the queryset by currency, a query over one row per day and currency"""
+        rows = self.values('currency').annotate(
+            gross=models.Sum('gross'),
+            refunded=models.Sum('refunded'),
+            disputed=models.Sum('disputed'),
+            payments=models.Sum('payments'),
+        ).order_by('currency')
+        return {
+            row.pop('currency'): {**row, 'net': row['gross'] - row['refunded'] - row['disputed']}
+            for row in rows
+        }
+
+
+class DailyRevenue(models.Model):
+    """Revenue of each day by currency and stripe account, in the currency minor unit, updated
+    by the payment, refund and dispute webhooks (see `checkouts.revenue`)."""
+    day = models.DateField(_("day"))
+    currency = models.CharField(_("currency"), max_length=3)
+    account = models.CharField(_("stripe account"), max_length=100, default=DEFAULT_ACCOUNT)
+    gross = models.BigIntegerField(_("gross"), default=0)
+    refunded = models.BigIntegerField(_("refunded"), default=0)
+    disputed = models.BigIntegerField(_("disputed"), default=0)
+    payments = models.PositiveIntegerField(_("payments"), default=0)
+    refunds = models.PositiveIntegerField(_("refunds"), default=0)
+    disputes = models.PositiveIntegerField(_("disputes"), default=0)
+
+    objects = DailyRevenueQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("daily revenue")
+        verbose_name_plural = _("daily revenues")
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'currency', 'account'], name='daily_revenue_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.currency}"
+
+    @property
+    def net(self) -> int:
+        return self.gross - self.refunded - self.disputed
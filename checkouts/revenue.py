@@ -0,0 +1,109 @@
+"""Incremental revenue aggregates. Each payment, refund and dispute is recorded once in the
+`RevenueEntry` ledger and added to the `DailyRevenue` row of its day and currency in the same
+transaction, so the reports read a row per day instead of scanning the payments."""
+from datetime import date, datetime, timezone as dt_timezone
+from typing import Any
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from utils.stripe_clients import current_account
+
+from .models import DailyRevenue, RevenueEntry
+
+# the `DailyRevenue` amount and counter fields changed by each kind of entry, and the sign
+KIND_FIELDS = {
+    RevenueEntry.PAYMENT: ('gross', 'payments', 1),
+    RevenueEntry.REFUND: ('refunded', 'refunds', 1),
+    RevenueEntry.REFUND_REVERSAL: ('refunded', 'refunds', -1),
+    RevenueEntry.DISPUTE: ('disputed', 'disputes', 1),
+    RevenueEntry.DISPUTE_REVERSAL: ('disputed', 'disputes', -1),
+}
+
+
+def record(kind: str, obj: Any, amount: int, account: str | None = None) -> bool:
+    """add the amount of the stripe object to the revenue of its day, once.
+
+    Args:
+        kind (str): one of the `RevenueEntry` kinds.
+        obj (stripe.StripeObject | Mapping): the payment intent, refund or dispute.
+        amount (int): the amount in the currency minor unit, always positive.
+        account (str, optional): the stripe account. Defaults to the account of the current request.
+
+    Returns:
+        bool: if the object was counted now, False if it was already counted.
+    """
+    amount_field, count_field, sign = KIND_FIELDS[kind]
+    day = datetime.fromtimestamp(obj['created'], tz=dt_timezone.utc).date()
+    currency = obj['currency'].lower()
+    account = account or current_account()
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                RevenueEntry.objects.create(
+                    kind=kind, object_id=obj['id'], amount=amount, currency=currency, day=day, account=account
+                )
+        except IntegrityError:
+            return False
+
+        DailyRevenue.objects.get_or_create(day=day, currency=currency, account=account)
+        DailyRevenue.objects.filter(day=day, currency=currency, account=account).update(**{
+            amount_field: F(amount_field) + sign * amount,
+            count_field: F(count_field) + sign,
+        })
+    return True
+
+
+def record_payment(intent: Any, account: str | None = None) -> bool:
+    """callback to the `payment_intent.succeeded` webhook"""
+    return record(RevenueEntry.PAYMENT, intent, intent.get('amount_received') or intent['amount'], account)
+
+
+def record_refund(refund: Any, account: str | None = None) -> bool:
+    """callback to the `refund.created`, `refund.updated` and `refund.failed` webhooks. The
+    failed and canceled refunds give the amount back."""
+    recorded = False
+    if refund['status'] in ('pending', 'requires_action', 'succeeded', 'failed', 'canceled'):
+        recorded = record(RevenueEntry.REFUND, refund, refund['amount'], account)
+    if refund['status'] in ('failed', 'canceled'):
+        recorded = record(RevenueEntry.REFUND_REVERSAL, refund, refund['amount'], account) or recorded
+    return recorded
+
+
+def record_dispute(dispute: Any, account: str | None = None) -> bool:
+    """callback to the `charge.dispute.created` and `charge.dispute.closed` webhooks. The won
+    disputes give the amount back."""
+    recorded = record(RevenueEntry.DISPUTE, dispute, dispute['amount'], account)
+    if dispute['status'] == 'won':
+        recorded = record(RevenueEntry.DISPUTE_REVERSAL, dispute, dispute['amount'], account) or recorded
+    return recorded
+
+
+def rebuild(start: date | None = None, end: date | None = None) -> int:
+    """recompute the `DailyRevenue` rows of the days in the range (all by default) from the
+    ledger, replacing the current rows.
+
+    Returns:
+        int: the number of rows written.
+    """
+    entries = RevenueEntry.objects.all()
+    revenue = DailyRevenue.objects.all()
+    if start is not None:
+        entries, revenue = entries.filter(day__gte=start), revenue.filter(day__gte=start)
+    if end is not None:
+        entries, revenue = entries.filter(day__lte=end), revenue.filter(day__lte=end)
+
+    rows: dict[tuple, DailyRevenue] = {}
+    sums = entries.values('day', 'currency', 'account', 'kind').annotate(total=Sum('amount'), count=Count('id'))
+    for group in sums.order_by():
+        key = (group['day'], group['currency'], group['account'])
+        row = rows.setdefault(key, DailyRevenue(day=key[0], currency=key[1], account=key[2]))
+        amount_field, count_field, sign = KIND_FIELDS[group['kind']]
+        setattr(row, amount_field, getattr(row, amount_field) + sign * group['total'])
+        setattr(row, count_field, getattr(row, count_field) + sign * group['count'])
+
+    with transaction.atomic():
+        revenue.delete()
+        DailyRevenue.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
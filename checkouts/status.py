@@ -0,0 +1,51 @@
+"""Payment status messages pushed to the return page (see `payment_status_stream_view`) when
+the webhooks of the checkout sessions and payment intents arrive."""
+from typing import Any
+
+from utils import pubsub
+
+FINAL_INTENT_STATUSES = ('succeeded', 'canceled', 'requires_payment_method')
+FINAL_SESSION_PAYMENT_STATUSES = ('paid', 'no_payment_required')
+
+
+def status_channel(object_id: str) -> str:
+    return f"payment_status:{object_id}"
+
+
+def is_final(obj: Any) -> bool:
+    """if the status of the session or intent won't change without the customer acting"""
+    if obj['object'] == 'checkout.session':
+        return obj['status'] == 'expired' or (
+            obj['status'] == 'complete' and obj.get('payment_status') in FINAL_SESSION_PAYMENT_STATUSES
+        )
+    return obj['status'] in FINAL_INTENT_STATUSES
+
+
+def status_message(obj: Any, event_type: str | None = None) -> dict[str, Any]:
+    message = {
+        'object': obj['object'],
+        'id': obj['id'],
+        'status': obj['status'],
+        'payment_status': obj.get('payment_status'),
+        'final': is_final(obj),
+    }
+    if event_type == 'checkout.session.async_payment_failed':
+        # the session stays `complete`, the payment failed for good
+        message.update(payment_status='failed', final=True)
+    return message
+
+
+def publish_status(obj: Any, event_type: str | None = None) -> bool:
+    """publish the status of the session or intent, unless a status which never changes was
+    already published: stripe doesn't send the webhooks in order, a late event would move the
+    page back. Returns if the status was published."""
+    message = status_message(obj, event_type)
+    published = pubsub.last_message(status_channel(obj['id']))
+    # a failed intent can still be paid with another payment method
+    if (
+        published is not None and published['final'] and published['status'] != 'requires_payment_method'
+        and message != published
+    ):
+        return False
+    pubsub.publish(status_channel(obj['id']), message)
+    return True
@@ -6,5 +6,8 @@ urlpatterns = [
     path('success/', views.checkout_session_success_view, name='checkout_session_success'),
     path('cancel/', views.checkout_session_cancel_view, name='checkout_session_cancel'),
     path('return/', views.checkout_session_return_view, name='checkout_session_return'),
+    path('status/stream/', views.payment_status_stream_view, name='payment_status_stream'),
     path('webhook/', views.StripeWebHookView.as_view(), name='stripe_webhook'),
+    path('circuit-breakers/', views.circuit_breakers_status_view, name='circuit_breakers_status'),
+    path('exports/<str:name>/', views.export_view, name='export'),
 ]
@@ -1,28 +1,51 @@
+import asyncio
+import json
 import logging
-import os
 from copy import deepcopy
+from datetime import date
 from hashlib import sha256
 from typing import Any, Callable
+from uuid import uuid4
 import re
 
-import stripe
 from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import BadRequest
-from django.http import HttpRequest, JsonResponse
-from django.shortcuts import HttpResponseRedirect, redirect, render
-from django.urls import reverse_lazy
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import BadRequest, ValidationError
+from django.core.validators import validate_email
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.utils.timezone import datetime, timedelta
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
-from stripe_customers.models import StripeCustomer
+from stripe_customers import payment_methods
+from stripe_customers.models import StripeCustomer, StripeCustomerEmail
+from subscriptions.models import Subscription
+from utils import exports, pubsub, stripe_cache
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, breakers_status, get_breaker
+from utils.deadlines import DeadlineExceeded, hedged_call
+from utils.locks import LockNotAcquired
+from utils.rate_limit import SlidingWindowLimiter, count_rejection, rejections
+from utils.server_timing import timed_render
+from utils.stripe_clients import get_account_config, get_request_client, resolve_account
+from utils.stripe_sdk import stripe
+from utils.stripe_snapshots import snapshot
 from utils.support import get_user_lang
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from . import revenue
+from .exports import DATASETS, export_rows
+from .models import Payment, WebhookEvent
+from .status import is_final, publish_status, status_channel
+from .webhook_lanes import LaneFull, get_lane, lane_for, lanes_status
+
 logger = logging.getLogger("djangoStripe")
 
+# the checkout attempt tokens generated by the pages
+ATTEMPT_TOKEN_RE = re.compile(r"[\w-]{16,64}")
+
 
 class StripeSessionMixin:
     """Mixin class to help configure session-based checkouts
@@ -95,7 +118,91 @@ class StripeAppearanceMixin:
         return self.appearance
 
 
-class StripeBaseCheckoutView(View):
+class StripeCircuitBreakerMixin:
+    """Mixin class to call stripe through per-operation circuit breakers, failing fast with
+    a degraded response while stripe is unavailable"""
+    degraded_message: str = "Payments are temporarily unavailable. Please, try again in a few minutes."
+    degraded_status: int = 503
+
+    def get_circuit_breaker(self, operation: str) -> CircuitBreaker:
+        return get_breaker(operation)
+
+    def get_degraded_response(self, breaker: CircuitBreaker) -> HttpResponse:
+        """response returned while the circuit breaker of the operation is open"""
+        return JsonResponse(
+            {"error": self.degraded_message},
+            status=self.degraded_status,
+            headers={"Retry-After": str(breaker.retry_after())},
+        )
+
+
+class RateLimitMixin:
+    """Mixin class to limit the requests of each client before the view calls stripe.
+
+    `rate_limits` maps the client identity (`ip`, `user` or `session`) to the (hits, seconds)
+    allowed in a sliding window. The identities the request doesn't have (like the user of an
+    anonymous request) aren't limited. The rejected requests get a 429 with `Retry-After` and
+    are counted by `rate_limit_scope` (the class name by default).
+    """
+    rate_limits: dict[str, tuple[int, int]] = {"ip": (20, 60), "user": (10, 60), "session": (10, 60)}
+    rate_limited_methods: tuple[str, ...] = ("POST",)
+    rate_limited_message: str = "Too many requests. Please, try again in a few moments."
+    rate_limit_scope: str | None = None
+
+    scopes: set[str] = set()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        RateLimitMixin.scopes.add(cls.rate_limit_scope or cls.__name__)
+
+    def get_rate_limit_scope(self) -> str:
+        return self.rate_limit_scope or type(self).__name__
+
+    def get_rate_limit_identity(self, kind: str) -> str | None:
+        """return the identity of the client of the kind, None if the request doesn't have it"""
+        if kind == "ip":
+            return self.request.META.get("REMOTE_ADDR")
+        if kind == "user":
+            return str(self.request.user.pk) if self.request.user.is_authenticated else None
+        if kind == "session":
+            session = getattr(self.request, "session", None)
+            return session.session_key if session is not None else None
+        raise ValueError(f"unknown rate limit identity `{kind}`")
+
+    def check_rate_limits(self) -> HttpResponse | None:
+        """count the request in the limits, returning the 429 response if any is exceeded"""
+        scope = self.get_rate_limit_scope()
+        for kind, (limit, window) in self.rate_limits.items():
+            identity = self.get_rate_limit_identity(kind)
+            if not identity:
+                continue
+
+            retry_after = SlidingWindowLimiter(limit, window).hit(f"{scope}:{kind}:{identity}")
+            if retry_after:
+                count_rejection(scope)
+                logger.warning(f"{scope} rate limited by {kind} {identity}, retry after {retry_after}s")
+                return JsonResponse(
+                    {"error": self.rate_limited_message}, status=429, headers={"Retry-After": str(retry_after)}
+                )
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.rate_limited_methods and (response := self.check_rate_limits()):
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+class StripeClientMixin:
+    """Mixin class to call stripe with the client of the account selected to the request"""
+    def get_stripe_account(self) -> str:
+        """return the name of the stripe account used by the request"""
+        return getattr(self.request, 'stripe_account', None) or resolve_account(self.request)
+
+    def get_stripe_client(self) -> "stripe.StripeClient":
+        return get_request_client(self.request)
+
+
+class StripeBaseCheckoutView(RateLimitMixin, StripeClientMixin, StripeCircuitBreakerMixin, View):
     """base view to the stripe checkout views"""
     template_name: str | None = None
     stipe_public_key: str | None = None
@@ -125,26 +232,56 @@ class StripeBaseCheckoutView(View):
             raise ValueError("invalid template name")
         return self.template_name
     
+    def _get_account_public_key(self) -> str | None:
+        return get_account_config(self.get_stripe_account()).get('public_key')
+
     def _validate_stripe_key(self):
-        """verify if the stripe public key is setted in class or in the settings module and
+        """verify if the stripe public key is setted in class or in the stripe account settings and
         check if the regex pattern matches"""
-        if self.stipe_public_key is None and not hasattr(settings, 'STRIPE_PUBLIC_KEY'):
+        if self.stipe_public_key is None and not self._get_account_public_key():
             raise ValueError('stripe public is not defined')
         
-        key = self.stipe_public_key if self.stipe_public_key is not None else settings.STRIPE_PUBLIC_KEY
+        key = self.stipe_public_key if self.stipe_public_key is not None else self._get_account_public_key()
         assert re.match(r'^pk_(test_)?[A-Za-z0-9]+$', key) is not None, 'invalid stripe public key'
         assert isinstance(key, str), 'the stripe public key must be an valid string'
     
     def get_srtipe_public_key(self) -> str | None:
         self._validate_stripe_key()
         if self.stipe_public_key is None:
-            return settings.STRIPE_PUBLIC_KEY
+            return self._get_account_public_key()
         return self.stipe_public_key
 
     def get_context_data(self, **kwargs) -> dict[str, Any]:
         kwargs['STRIPE_PUBLIC_KEY'] = self.get_srtipe_public_key()
         return kwargs
 
+    def get_stripe_customer(self) -> StripeCustomer | None:
+        """return the stripe customer of the authenticated user, created at the first checkout
+        if the signup prefetch didn't create it yet"""
+        if not self.request.user.is_authenticated:
+            return None
+
+        if not hasattr(self, '_stripe_customer'):
+            self._stripe_customer = StripeCustomer.objects.get_or_create_for_user(
+                self.request.user, account=self.get_stripe_account()
+            )
+        return self._stripe_customer
+
+    def get_customer_email(self) -> str | None:
+        """hook method to return the email of a guest (not authenticated) customer. Defaults to
+        the `email` field of the POST data, if valid."""
+        email = self.request.POST.get("email", "").strip()
+        try:
+            validate_email(email)
+        except ValidationError:
+            return None
+        return email
+
+    def get_guest_customer_id(self) -> str | None:
+        """return the id of the guest stripe customer already created with the guest email, if
+        any. The customers of the registered users are never returned for an unverified email."""
+        return StripeCustomerEmail.objects.lookup_guest(self.get_customer_email(), self.get_stripe_account())
+
 
 class StripeCheckoutSessionView(StripeSessionMixin, StripeBaseCheckoutView):
     _ONEDAY_IN_MIN = 1440
@@ -211,26 +348,48 @@ class StripeCheckoutSessionView(StripeSessionMixin, StripeBaseCheckoutView):
 
     def create_checkout_sesion(
         self, *args, **kwargs
-    ) -> stripe.checkout.Session | HttpResponseRedirect:
+    ) -> "stripe.checkout.Session | HttpResponse":
         """Creates the stripe checkout session and return.
 
         Returns:
             stripe.checkout.Session: the stripe checkout session created.
             HttpResponseRedirect: if some fail occur redirect to the on_creation_fail_url attr value. Defaults to http referer or / if no referer found.
+            HttpResponse: the degraded response if the circuit breaker is open or if the request
+                deadline has no time left to the stripe call.
         """
         redirect_ = redirect(self.get_on_creation_fail_url())
         session_params = self.get_session_params()
 
         if self.request.user.is_authenticated:
-            customer = StripeCustomer.objects.filter(user=self.request.user).first()
+            try:
+                customer = self.get_stripe_customer()
+            except (stripe.StripeError, LockNotAcquired) as e:
+                # stripe creates a customer from the session instead
+                logger.error(f"Error on get the customer of the user {self.request.user.pk}: {str(e)}")
+                customer = None
+
             if customer is not None:
                 session_params["customer"] = customer.customer_id
                 logger.debug(
                     f"user {str(customer)} was related with the customer id {customer.customer_id} to the session"
                 )
 
+        elif (customer_id := self.get_guest_customer_id()) is not None:
+            session_params["customer"] = customer_id
+            logger.debug(f"returning guest related with the customer id {customer_id} to the session")
+
+        elif (email := self.get_customer_email()) is not None:
+            # the customer created by stripe is indexed by the `customer.created` webhook
+            session_params["customer_email"] = email
+            if self.mode == self.PAYMENT_MODE:
+                session_params.setdefault("customer_creation", "always")
+
+        breaker = self.get_circuit_breaker("checkout.session.create")
         try:
-            session = stripe.checkout.Session.create(**session_params)
+            session = breaker.call(self.get_stripe_client().checkout.sessions.create, session_params)
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logger.warning(f"checkout session not created: {str(e)}")
+            return self.get_degraded_response(breaker)
         except stripe.StripeError as e:
             logger.error(
                 f"Error on create session: {str(e)} | session params: {session_params}"
@@ -244,13 +403,13 @@ class StripeCheckoutSessionView(StripeSessionMixin, StripeBaseCheckoutView):
         context = self.get_context_data()
         template = self.get_template_name()
         logger.debug(f"context data: {context} | template {template}")
-        return render(self.request, template, context)
+        return timed_render(self.request, template, context)
 
     def post(self, *args, **kwargs):
         checkout_session = self.create_checkout_sesion()
         logger.debug(f"final checkout session object: {checkout_session}")
 
-        if isinstance(checkout_session, HttpResponseRedirect):
+        if isinstance(checkout_session, HttpResponse):
             return checkout_session
 
         ui_mode_responses = {
@@ -263,10 +422,17 @@ class StripeCheckoutSessionView(StripeSessionMixin, StripeBaseCheckoutView):
 
 
 class StripePaymentIntentView(StripeBaseCheckoutView, StripeAppearanceMixin):
+    """payment element checkout. The authenticated users can also pay with one of their saved
+    payment methods, posting its id as `payment_method`, which creates and confirms the intent
+    in the same request."""
     automatic_payment_methods = True
+    one_click_enabled = True
     payment_method_types = []
     default_payment_method_type = "card"
     template_name = "checkouts/checkout-custom.html"
+    customer_busy_message: str = "Your payment is being prepared. Please, try again in a few moments."
+    attempt_session_key = "stripe_checkout_attempt"
+    stripe_error_message: str = "The payment couldn't be started. Please, try again."
 
     def get_payment_method_types(self):
         if self.automatic_payment_methods and self.payment_method_types:
@@ -278,10 +444,25 @@ class StripePaymentIntentView(StripeBaseCheckoutView, StripeAppearanceMixin):
             return [self.default_payment_method_type]
         return self.payment_method_types
 
+    def get_attempt_token(self) -> str:
+        """return the token of the checkout attempt. The page posts a new `attempt` token on each
+        click and its retries send the same one, so only the retries of a click reuse the
+        payment intent. Without it, the token stored in the session by the last page load."""
+        token = self.request.POST.get("attempt", "")
+        if ATTEMPT_TOKEN_RE.fullmatch(token):
+            return token
+
+        session = getattr(self.request, "session", None)
+        if session is None:
+            return uuid4().hex
+        return session.setdefault(self.attempt_session_key, uuid4().hex)
+
     def set_idempotency_key(self, params, inplace=True) -> dict | None:
         """Convert the params to str and if the user is authenticated appends
         the id and the stripe customer idempotency key from database to the string.
-        The resultant string is hashed using sha256 and used as the idempotency key.
+        The token of the checkout attempt is appended too, so the same purchase made again
+        gets a new payment intent. The resultant string is hashed using sha256 and used as the
+        idempotency key.
 
 
         Args:
@@ -295,8 +476,9 @@ class StripePaymentIntentView(StripeBaseCheckoutView, StripeAppearanceMixin):
         params_str = str(params)
         if self.request.user.is_authenticated:
             string += str(self.request.user.pk)
-            string += str(self.request.user.stripe_customer.idempotency_key)
+            string += str(self.get_stripe_customer().idempotency_key)
 
+        string += self.get_attempt_token()
         string += params_str
         idempotency_key = sha256(string.encode()).hexdigest()
         if inplace:
@@ -318,27 +500,89 @@ class StripePaymentIntentView(StripeBaseCheckoutView, StripeAppearanceMixin):
             params["payment_method_types"] = self.payment_method_types
 
         if self.request.user.is_authenticated:
-            params["customer"] = self.request.user.stripe_customer.customer_id
+            params["customer"] = self.get_stripe_customer().customer_id
+
+        elif (customer_id := self.get_guest_customer_id()) is not None:
+            params["customer"] = customer_id
 
         params.update(extra)
         return params
 
-    def create_intent(self):
-        params = self.get_payment_intent_params()
+    def get_saved_payment_methods(self) -> list[dict[str, Any]]:
+        """return the cached saved payment methods of the authenticated user"""
+        if not self.one_click_enabled or not self.request.user.is_authenticated:
+            return []
+
+        # showing the page doesn't create the stripe customer, users without it have nothing saved
+        customer = StripeCustomer.objects.filter(user=self.request.user).first()
+        if customer is None:
+            return []
+        return payment_methods.get_saved_payment_methods(customer.customer_id, customer.account)
+
+    def get_one_click_payment_method(self) -> str | None:
+        """return the saved payment method chosen to pay with one click, if any
+
+        Raises:
+            BadRequest: if the payment method isn't a saved method of the user.
+        """
+        payment_method = self.request.POST.get("payment_method")
+        if not payment_method:
+            return None
+
+        if payment_method not in {method["id"] for method in self.get_saved_payment_methods()}:
+            raise BadRequest("the payment method isn't saved to the customer")
+        return payment_method
+
+    def create_intent(self, payment_method: str | None = None):
+        extra = {}
+        if payment_method is not None:
+            extra = {"payment_method": payment_method, "confirm": True}
+            if self.automatic_payment_methods:
+                # confirmed on the server, so there is no page to return to after a redirect
+                extra["automatic_payment_methods"] = {"enabled": True, "allow_redirects": "never"}
+
+        params = self.get_payment_intent_params(**extra)
         self.set_idempotency_key(params)
-        return stripe.PaymentIntent.create(**params)
+        options = {"idempotency_key": params.pop("idempotency_key")}
+        breaker = self.get_circuit_breaker("payment_intent.create")
+        return breaker.call(self.get_stripe_client().payment_intents.create, params, options)
 
     def get_context_data(self, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
+        context["saved_payment_methods"] = self.get_saved_payment_methods()
         return context
 
     def get(self, *args, **kwargs):
+        # each page load is a new attempt for the posts without their own token
+        self.request.session[self.attempt_session_key] = uuid4().hex
         context = self.get_context_data()
-        return render(self.request, self.template_name, context)
+        return timed_render(self.request, self.template_name, context)
 
     def post(self, *args, **kwargs):
-        intent = self.create_intent()
+        try:
+            payment_method = self.get_one_click_payment_method()
+            intent = self.create_intent(payment_method)
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logger.warning(f"payment intent not created: {str(e)}")
+            return self.get_degraded_response(self.get_circuit_breaker("payment_intent.create"))
+        except LockNotAcquired as e:
+            # another request of the user is creating its stripe customer
+            logger.warning(f"payment intent not created: {str(e)}")
+            return JsonResponse({"error": self.customer_busy_message}, status=503, headers={"Retry-After": "1"})
+        except stripe.CardError as e:
+            logger.info(f"one click payment declined: {str(e)}")
+            return JsonResponse({"error": e.user_message}, status=402)
+        except stripe.StripeError as e:
+            logger.error(f"payment intent not created: {str(e)}")
+            return JsonResponse({"error": self.stripe_error_message}, status=502)
         logger.debug(f"payment intent object: {intent}")
+
+        if payment_method is not None:
+            return JsonResponse({
+                "status": intent.status,
+                "clientSecret": intent.client_secret,
+                "requiresAction": intent.status == "requires_action",
+            })
         appearance = self.get_appearance()
         logger.debug(f"payment element appearance: {appearance}")
 
@@ -349,15 +593,16 @@ class StripePaymentIntentView(StripeBaseCheckoutView, StripeAppearanceMixin):
 
 
 def checkout_session_success_view(request):
-    return render(request, "checkouts/success.html")
+    return timed_render(request, "checkouts/success.html")
 
 
 def checkout_session_cancel_view(request):
-    return render(request, "checkouts/cancel.html")
+    return timed_render(request, "checkouts/cancel.html")
 
 
 def checkout_session_return_view(request):
     context = {}
+    client = get_request_client(request)
 
     checkout_session_id = request.GET.get("session_id")
     payment_intent_id = request.GET.get("payment_intent")
@@ -365,7 +610,18 @@ def checkout_session_return_view(request):
 
     # it's using the stripe checkout session embedded or hosted flow
     if checkout_session_id is not None:
-        checkout_session = stripe.checkout.Session.retrieve(checkout_session_id)
+        try:
+            checkout_session = stripe_cache.cached_retrieve(
+                "checkout.session", checkout_session_id,
+                lambda: snapshot(get_breaker("checkout.session.retrieve").call(
+                    hedged_call, client.checkout.sessions.retrieve, checkout_session_id,
+                    hedge_after=settings.STRIPE_HEDGE_AFTER,
+                )),
+            )
+        except (CircuitOpenError, DeadlineExceeded):
+            messages.info(request, "we couldn't check your payment now, please refresh the page in a few minutes.")
+            return timed_render(request, "checkouts/return.html", context, status=503)
+
         status = checkout_session.status
         if status == "open":
             return redirect("checkout")
@@ -374,7 +630,10 @@ def checkout_session_return_view(request):
             context["status"] = status
             context["customer_email"] = checkout_session.customer_email
             context["total"] = checkout_session.amount_total
-            return render(request, "checkouts/return.html", context)
+            if not is_final(checkout_session):
+                # async payment methods, the page is updated by the webhook
+                context["status_stream_url"] = f"{reverse('payment_status_stream')}?session_id={checkout_session_id}"
+            return timed_render(request, "checkouts/return.html", context)
 
         elif status == "expired":
             messages.info(request, "session expired.")
@@ -382,20 +641,145 @@ def checkout_session_return_view(request):
 
     # it's using customized flow with stripe payment intents
     elif payment_intent_id is not None and payment_intent_client_secret is not None:
-        pi = stripe.PaymentIntent.retrieve(payment_intent_id, expand=["customer"])
+        try:
+            params = {"expand": ["customer"]}
+            pi = stripe_cache.cached_retrieve(
+                "payment_intent", payment_intent_id,
+                lambda: snapshot(get_breaker("payment_intent.retrieve").call(
+                    hedged_call, client.payment_intents.retrieve, payment_intent_id, params,
+                    hedge_after=settings.STRIPE_HEDGE_AFTER,
+                )),
+                params,
+            )
+        except (CircuitOpenError, DeadlineExceeded):
+            messages.info(request, "we couldn't check your payment now, please refresh the page in a few minutes.")
+            return timed_render(request, "checkouts/return.html", context, status=503)
         context["status"] = pi.status
-        context["customer_email"] = pi.customer.email if pi.customer else ''
+        context["customer_email"] = pi.customer_email or ''
         context["total"] = f"{pi.amount / 100:.2f}"
-        return render(request, "checkouts/return.html", context)
+        if not is_final(pi):
+            context["status_stream_url"] = (
+                f"{reverse('payment_status_stream')}?payment_intent={payment_intent_id}"
+                f"&payment_intent_client_secret={payment_intent_client_secret}"
+            )
+        return timed_render(request, "checkouts/return.html", context)
 
     messages.info("something went wrong! please, try again.")
     return redirect("checkout")
 
 
-class StripeWebHookView(View):
+async def _status_events(object_id: str):
+    """the server-sent events with the status messages of the session or intent, until a final
+    status or `PAYMENT_STATUS_STREAM_SECONDS`, with keep alive comments between them"""
+    yield "retry: 5000\n\n"
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + getattr(settings, "PAYMENT_STATUS_STREAM_SECONDS", 300)
+    keep_alive = getattr(settings, "PAYMENT_STATUS_KEEP_ALIVE_SECONDS", 15)
+
+    async for message in pubsub.subscribe(status_channel(object_id), timeout=keep_alive):
+        if message is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"event: status\ndata: {json.dumps(message)}\n\n"
+            if message["final"]:
+                return
+        if loop.time() >= ends_at:
+            return
+
+
+async def payment_status_stream_view(request):
+    """stream the status changes of a checkout session (`?session_id=`) or a payment intent
+    (`?payment_intent=` and its `payment_intent_client_secret`) as server-sent events, pushed
+    when the webhooks arrive. Served by ASGI without holding a worker thread."""
+    session_id = request.GET.get("session_id", "")
+    payment_intent_id = request.GET.get("payment_intent", "")
+    client_secret = request.GET.get("payment_intent_client_secret", "")
+
+    if re.fullmatch(r"cs_\w+", session_id):
+        object_id = session_id
+    elif re.fullmatch(r"pi_\w+", payment_intent_id) and client_secret.startswith(f"{payment_intent_id}_secret_"):
+        object_id = payment_intent_id
+    else:
+        raise BadRequest("a checkout session or payment intent is required")
+
+    response = StreamingHttpResponse(_status_events(object_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx would buffer the events
+    return response
+
+
+@staff_member_required
+def circuit_breakers_status_view(request):
+    """return the state of the stripe circuit breakers, the rate limit rejections and the
+    webhook lanes of the process to monitoring"""
+    return JsonResponse({
+        "circuit_breakers": breakers_status(),
+        "rate_limit_rejections": rejections(sorted(RateLimitMixin.scopes)),
+        "webhook_lanes": lanes_status(),
+    })
+
+
+@staff_member_required
+def export_view(request, name: str):
+    """stream the export of the dataset as `?format=csv` (default) or `jsonl`, gzipped with
+    `?gzip=1`. The `from` and `to` days (YYYY-MM-DD) and the dataset filters are also taken
+    from the query string."""
+    fmt = request.GET.get("format", exports.CSV)
+    compress = request.GET.get("gzip") in ("1", "true")
+    if name not in DATASETS or fmt not in exports.FORMATS:
+        raise Http404("unknown export")
+
+    try:
+        start = date.fromisoformat(request.GET["from"]) if request.GET.get("from") else None
+        end = date.fromisoformat(request.GET["to"]) if request.GET.get("to") else None
+    except ValueError:
+        raise BadRequest("`from` and `to` must be YYYY-MM-DD days")
+
+    filters = {key: request.GET[key] for key in DATASETS[name].filters if request.GET.get(key)}
+    columns, rows = export_rows(name, start, end, **filters)
+    response = StreamingHttpResponse(
+        exports.stream_rows(rows, columns, fmt, compress),
+        content_type="application/gzip" if compress else exports.CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{exports.filename(name, fmt, compress)}"'
+    logger.info(f"export {name} ({fmt}) streamed to {request.user}")
+    return response
+
+
+class StripeWebHookView(StripeClientMixin, View):
     event_dict = {}
     event_callbacks = {
-        "customer.created": lambda o: logger.info(f"customer {o.id} created")
+        "customer.created": StripeCustomerEmail.objects.record_from_stripe,
+        "customer.updated": StripeCustomerEmail.objects.record_from_stripe,
+        "customer.deleted": StripeCustomerEmail.objects.forget_from_stripe,
+        "checkout.session.async_payment_failed": "checkout_session_changed",
+        "checkout.session.async_payment_succeeded": "checkout_session_changed",
+        "checkout.session.completed": "checkout_session_changed",
+        "checkout.session.expired": "checkout_session_changed",
+        "customer.subscription.created": "subscription_changed",
+        "customer.subscription.updated": "subscription_changed",
+        "customer.subscription.deleted": "subscription_changed",
+        "customer.subscription.paused": "subscription_changed",
+        "customer.subscription.resumed": "subscription_changed",
+        "invoice.paid": Subscription.objects.sync_from_invoice,
+        "invoice.payment_failed": Subscription.objects.sync_from_invoice,
+        "payment_intent.amount_capturable_updated": "payment_intent_changed",
+        "payment_intent.canceled": "payment_intent_changed",
+        "payment_intent.created": "payment_intent_changed",
+        "payment_intent.partially_funded": "payment_intent_changed",
+        "payment_intent.payment_failed": "payment_intent_changed",
+        "payment_intent.processing": "payment_intent_changed",
+        "payment_intent.requires_action": "payment_intent_changed",
+        "payment_intent.succeeded": "payment_intent_succeeded",
+        "payment_method.attached": payment_methods.payment_method_attached,
+        "payment_method.updated": payment_methods.payment_method_attached,
+        "payment_method.detached": payment_methods.payment_method_detached,
+        "refund.created": "refund_changed",
+        "refund.updated": "refund_changed",
+        "refund.failed": "refund_changed",
+        "charge.refunded": Payment.objects.sync_refunded,
+        "charge.dispute.created": revenue.record_dispute,
+        "charge.dispute.closed": revenue.record_dispute,
     }
 
     def get_event_dict(self):
@@ -404,8 +788,19 @@ class StripeWebHookView(View):
             "checkout.session.async_payment_succeeded": None,
             "checkout.session.completed": None,
             "checkout.session.expired": None,
+            "charge.dispute.closed": None,
+            "charge.dispute.created": None,
+            "charge.refunded": None,
             "customer.created": None,
             "customer.deleted": None,
+            "customer.updated": None,
+            "customer.subscription.created": None,
+            "customer.subscription.deleted": None,
+            "customer.subscription.paused": None,
+            "customer.subscription.resumed": None,
+            "customer.subscription.updated": None,
+            "invoice.paid": None,
+            "invoice.payment_failed": None,
             "payment_intent.amount_capturable_updated": None,
             "payment_intent.canceled": None,
             "payment_intent.created": None,
@@ -414,6 +809,12 @@ class StripeWebHookView(View):
             "payment_intent.processing": None,
             "payment_intent.requires_action": None,
             "payment_intent.succeeded": None,
+            "payment_method.attached": None,
+            "payment_method.detached": None,
+            "payment_method.updated": None,
+            "refund.created": None,
+            "refund.failed": None,
+            "refund.updated": None,
         }
         if self.event_dict:
             return self.event_dict
@@ -425,14 +826,41 @@ class StripeWebHookView(View):
 
         self.event_dict.update(self.event_callbacks)
 
+    def checkout_session_changed(self, session) -> None:
+        publish_status(session, self.event.type)
+
+    def subscription_changed(self, subscription) -> None:
+        Subscription.objects.sync_from_stripe(subscription, event_created=self.event.created)
+
+    def payment_intent_changed(self, intent) -> None:
+        payment = Payment.objects.sync_from_stripe(intent, event_created=self.event.created)
+        if payment.status == intent['status']:  # not an outdated event
+            publish_status(intent)
+
+    def refund_changed(self, refund) -> None:
+        revenue.record_refund(refund)
+        Payment.objects.sync_refunded(refund)
+
+    def payment_intent_succeeded(self, intent) -> None:
+        self.payment_intent_changed(intent)
+        revenue.record_payment(intent)
+
+    def get_event_lane(self, event) -> str:
+        """the priority lane of the event, by default by its type (see `checkouts.webhook_lanes`)"""
+        return lane_for(event.type)
+
+    def get_endpoint_secret(self) -> str:
+        """the secret used to verify the webhook signatures of the stripe account"""
+        return get_account_config(self.get_stripe_account())["webhook_secret"]
+
     def post(self, request: HttpRequest, *args, **kwargs):
         event = None
         payload = request.body
         sig_header = request.META["HTTP_STRIPE_SIGNATURE"]
-        endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+        endpoint_secret = self.get_endpoint_secret()
 
         try:
-            event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
+            event = self.get_stripe_client().construct_event(payload, sig_header, endpoint_secret)
         except ValueError as e:  # Invalid payload
             logger.error(str(e))
             raise BadRequest
@@ -441,12 +869,36 @@ class StripeWebHookView(View):
             logger.warning(str(e))
             raise e
 
+        if getattr(settings, 'STRIPE_WEBHOOK_ARCHIVE', True):
+            WebhookEvent.objects.archive(event, payload, account=self.get_stripe_account())
+
+        lane = get_lane(self.get_event_lane(event))
+        try:
+            with lane.slot():
+                handled = self.handle_event(event)
+        except LaneFull as e:
+            # stripe sends the event again later
+            logger.warning(f"event {event.id} ({event.type}) postponed: {str(e)}")
+            response = JsonResponse({"success": False, "lane": lane.name}, status=503)
+            response["Retry-After"] = str(max(1, round(lane.max_wait)))
+            return response
+        return JsonResponse({"success": handled})
+
+    def handle_event(self, event) -> bool:
+        """call the callback of the event, also used to replay the archived events.
+
+        Returns:
+            bool: if the event type is handled.
+        """
+        self.event = event
+        if object_id := event.data.object.get("id"):
+            stripe_cache.invalidate(object_id)
         self.event_dict = self.get_event_dict()
         self.set_event_callbacks()
 
         if event.type not in self.event_dict:
             logger.warning("Unhandled event type {}".format(event["type"]))
-            return JsonResponse({"success": False})
+            return False
 
         callback_func = self.event_dict[event.type]
         target_object = event.data.object
@@ -457,7 +909,7 @@ class StripeWebHookView(View):
         elif isinstance(callback_func, str):
             getattr(self, callback_func)(target_object)
 
-        return JsonResponse({"success": True})
+        return True
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
@@ -0,0 +1,182 @@
+"""Priority lanes of the webhook events. Each event type belongs to a lane (the money moving
+events to `critical`, the floods of informative events to `bulk`) and each lane runs a limited
+number of events at once in the process, so a flood of one lane can't take all the workers from
+the others.
+
+The events waiting longer than the `max_wait` of their lane for a slot are answered with a
+503, and stripe sends them again later (they are already archived, the retries aren't
+archived twice)."""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from django.conf import settings
+
+from utils.support import percentile
+
+CRITICAL = 'critical'
+DEFAULT = 'default'
+BULK = 'bulk'
+
+DEFAULT_LANES = {
+    CRITICAL: {'concurrency': 8, 'max_wait': 10.0},
+    DEFAULT: {'concurrency': 4, 'max_wait': 5.0},
+    BULK: {'concurrency': 2, 'max_wait': 1.0},
+}
+
+# the event types out of the default lane
+DEFAULT_EVENT_LANES = {
+    'checkout.session.completed': CRITICAL,
+    'checkout.session.async_payment_succeeded': CRITICAL,
+    'checkout.session.async_payment_failed': CRITICAL,
+    'payment_intent.succeeded': CRITICAL,
+    'payment_intent.payment_failed': CRITICAL,
+    'payment_intent.amount_capturable_updated': CRITICAL,
+    'invoice.paid': CRITICAL,
+    'invoice.payment_failed': CRITICAL,
+    'refund.created': CRITICAL,
+    'refund.failed': CRITICAL,
+    'charge.refunded': CRITICAL,
+    'charge.dispute.created': CRITICAL,
+    'customer.created': BULK,
+    'customer.updated': BULK,
+    'payment_intent.created': BULK,
+    'payment_method.attached': BULK,
+    'payment_method.updated': BULK,
+    'payment_method.detached': BULK,
+}
+
+# the latencies kept by lane to compute the percentiles
+LATENCY_SAMPLES = 1000
+
+
+class LaneFull(Exception):
+    """raised when the lane has no free slot after its maximum wait"""
+    def __init__(self, lane: "Lane"):
+        self.lane = lane
+        super().__init__(f"the webhook lane {lane.name} is full")
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    samples = sorted(samples)
+    return {f'p{pct}': round(percentile(samples, pct) * 1000, 2) for pct in (50, 95)}
+
+
+class Lane:
+    """limits the events of the lane running at once in the process, measuring the queue
+    depth (the events waiting for a slot), the wait and the total latency.
+
+    Args:
+        name (str): the lane name.
+        concurrency (int): the events of the lane running at once.
+        max_wait (float): seconds an event waits for a slot before `LaneFull`.
+    """
+    def __init__(self, name: str, concurrency: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._waits: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """run the block in a slot of the lane, waiting for one up to `max_wait` seconds
+
+        Raises:
+            LaneFull: if no slot was freed in time.
+        """
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+        acquired = self._slots.acquire(timeout=self.max_wait)
+        with self._lock:
+            self.queued -= 1
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.running += 1
+                self._waits.append(time.monotonic() - enqueued_at)
+        if not acquired:
+            raise LaneFull(self)
+
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._slots.release()
+            with self._lock:
+                self.running -= 1
+                self.processed += 1
+                self.failed += failed
+                self._latencies.append(time.monotonic() - enqueued_at)
+
+    def status(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'concurrency': self.concurrency,
+                'queued': self.queued,
+                'running': self.running,
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_ms': _percentiles(list(self._waits)),
+                'latency_ms': _percentiles(list(self._latencies)),
+            }
+
+
+_lanes: dict[str, Lane] = {}
+_lanes_lock = threading.Lock()
+
+
+def lanes_config() -> dict[str, dict[str, Any]]:
+    """the options of the lanes, the `STRIPE_WEBHOOK_LANES` setting updates the defaults and
+    adds lanes"""
+    config = {name: dict(options) for name, options in DEFAULT_LANES.items()}
+    for name, options in getattr(settings, 'STRIPE_WEBHOOK_LANES', {}).items():
+        config.setdefault(name, dict(DEFAULT_LANES[DEFAULT])).update(options)
+    return config
+
+
+def lane_for(event_type: str) -> str:
+    """return the lane of the event type, set by the `STRIPE_WEBHOOK_EVENT_LANES` setting or
+    the defaults"""
+    lanes = {**DEFAULT_EVENT_LANES, **getattr(settings, 'STRIPE_WEBHOOK_EVENT_LANES', {})}
+    return lanes.get(event_type, DEFAULT)
+
+
+def get_lane(name: str) -> Lane:
+    """return the lane of the process"""
+    lane = _lanes.get(name)
+    if lane is not None:
+        return lane
+    with _lanes_lock:
+        if name not in _lanes:
+            config = lanes_config()
+            if name not in config:
+                raise ValueError(f"the webhook lane `{name}` is not configured")
+            _lanes[name] = Lane(name, **config[name])
+        return _lanes[name]
+
+
+def lanes_status() -> list[dict[str, Any]]:
+    """return the queue depth, counts and latencies of each lane in this process"""
+    return [get_lane(name).status() for name in lanes_config()]
+
+
+def reset_lanes() -> None:
+    """discard the lanes and their metrics, they are built again with the current settings"""
+    with _lanes_lock:
+        _lanes.clear()
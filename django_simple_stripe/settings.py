@@ -45,9 +45,12 @@ INSTALLED_APPS = [
     'addresses',
     'stripe_customers',
     'checkouts',
+    'subscriptions',
 ]
 
 MIDDLEWARE = [
+    'utils.server_timing.ServerTimingMiddleware',
+    'utils.deadlines.DeadlineMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.stripe_clients.StripeAccountMiddleware',
 ]
 
 ROOT_URLCONF = 'django_simple_stripe.urls'
@@ -169,3 +173,70 @@ LOGGING = {
 STRIPE_SECRET_KEY = os.environ['STRIPE_SECRET_KEY'] if not DEBUG else os.environ['STRIPE_SECRET_KEY_TEST']
 STRIPE_PUBLIC_KEY = os.environ['STRIPE_PUBLIC_KEY'] if not DEBUG else os.environ['STRIPE_PUBLIC_KEY_TEST']
 STRIPE_WEBHOOK_SECRET = os.environ['STRIPE_WEBHOOK_SECRET'] if not DEBUG else os.environ['STRIPE_WEBHOOK_SECRET_TEST']
+
+# stripe accounts served by this deployment, by name (see `utils.stripe_clients.get_accounts`).
+# Without it, the `default` account uses the keys above. The account of each request is
+# selected by host with `STRIPE_ACCOUNT_HOSTS` or by the `STRIPE_ACCOUNT_RESOLVER` function
+# STRIPE_ACCOUNTS = {
+#     'default': {'secret_key': ..., 'public_key': ..., 'webhook_secret': ...},
+#     'eu': {'secret_key': ..., 'public_key': ..., 'webhook_secret': ...},
+# }
+# STRIPE_ACCOUNT_HOSTS = {'eu.example.com': 'eu'}
+
+# time budget of each request, shared by the stripe calls made while handling it. Must be
+# lower than the timeout of the upstream proxy
+REQUEST_DEADLINE_SECONDS = 25
+# seconds before a slow idempotent read (like the return view `retrieve`) is hedged by a
+# second concurrent call. None disables the hedging
+STRIPE_HEDGE_AFTER = None
+# load the stripe SDK and the templates and open the stripe connection when the app starts,
+# instead of on the first request. Only useful to the web workers
+STRIPE_WARMUP = os.getenv('STRIPE_WARMUP') == '1'
+# connections to the stripe API kept open by each process, shared by its threads. Size it to
+# the threads of the worker
+STRIPE_HTTP_POOL_SIZE = 10
+STRIPE_WARMUP_TEMPLATES = [
+    'checkouts/checkout-custom.html',
+    'checkouts/checkout-embedded.html',
+    'checkouts/checkout-hosted.html',
+    'checkouts/return.html',
+]
+# create the stripe customer of the new users in a background thread after the signup. The
+# first checkout creates it anyway if missing, serialized per user by a cache lock (use a
+# shared cache, like redis, to serialize between processes)
+STRIPE_CUSTOMER_PREFETCH = True
+STRIPE_CUSTOMER_LOCK_WAIT = 10
+# keep the verified webhook payloads, compressed, in `checkouts.WebhookEvent` to audit and
+# replay them (see the `replay_webhook_events` and `prune_webhook_events` commands)
+STRIPE_WEBHOOK_ARCHIVE = True
+STRIPE_WEBHOOK_ARCHIVE_RETENTION_DAYS = 90
+# fraction (0 to 1) of the requests logging their stripe, database and template timings,
+# also sent in the `Server-Timing` header of every response
+SERVER_TIMING_LOG_SAMPLE_RATE = float(os.getenv('SERVER_TIMING_LOG_SAMPLE_RATE', 0))
+# seconds the saved payment methods of a customer stay cached. The `payment_method.*` webhooks
+# update the cache, so it can be long
+STRIPE_PAYMENT_METHODS_CACHE_TIMEOUT = 60 * 60 * 24
+# maximum of stripe calls per second made by the bulk payment actions (stripe allows 100/s in
+# live mode and 25/s in test mode, shared with the web traffic)
+STRIPE_BULK_RATE_LIMIT = 25
+# the return page receives the payment status from the webhooks by server-sent events (served
+# by ASGI), through `utils.pubsub`. Each worker polls the cache every PUBSUB_POLL_INTERVAL
+# seconds, so the cache must be shared by the workers (like redis) for the events to cross them
+PUBSUB_POLL_INTERVAL = 0.5
+PAYMENT_STATUS_STREAM_SECONDS = 300
+# the stripe objects read by id (like the return page sessions and intents) are cached for
+# their type time to live, in seconds, by `utils.stripe_cache`, and invalidated by the
+# webhooks. Each process keeps them at most STRIPE_READ_CACHE_L1_TTL seconds in memory
+STRIPE_READ_CACHE_TTLS = {'checkout.session': 10, 'payment_intent': 10, 'customer': 5 * 60}
+STRIPE_READ_CACHE_L1_TTL = 2
+# the webhook events run in priority lanes (see `checkouts.webhook_lanes`), each one with a
+# limit of events running at once per process. The money moving events are in the `critical`
+# lane and the floods (like `customer.created`) in the `bulk` one. The events waiting more than
+# `max_wait` seconds are answered with 503, for stripe to send them again later
+STRIPE_WEBHOOK_LANES = {
+    'critical': {'concurrency': 8, 'max_wait': 10.0},
+    'default': {'concurrency': 4, 'max_wait': 5.0},
+    'bulk': {'concurrency': 2, 'max_wait': 1.0},
+}
+# lane by event type, over the defaults of `checkouts.webhook_lanes.DEFAULT_EVENT_LANES`
+STRIPE_WEBHOOK_EVENT_LANES = {}
@@ -1,7 +1,53 @@
-from django.contrib import admin
-from .models import StripeCustomer
+from django.contrib import admin, messages
+
+from utils.admin import LargeTableAdminMixin
+
+from .models import StripeCustomer, StripeCustomerEmail
 
 
 @admin.register(StripeCustomer)
-class StripeCustomerAdmin(admin.ModelAdmin):
-    list_display = ['customer_id', 'user', 'idempotency_key']
+class StripeCustomerAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['customer_id', 'user', 'account', 'idempotency_key']
+    list_select_related = ['user']
+    search_fields = ['^customer_id', '^user__email', '^user__username']
+    raw_id_fields = ['user']
+    actions = ['sync_from_stripe', 'delete_on_stripe']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # deletes only the rows, leaving the customers on stripe
+        actions.pop('delete_selected', None)
+        return actions
+
+    def report_failures(self, request, failed: dict[str, str], action: str) -> None:
+        if failed:
+            self.message_user(
+                request,
+                f"{len(failed)} stripe customers were not {action}: "
+                + ", ".join(f"{customer_id} ({error})" for customer_id, error in failed.items()),
+                messages.ERROR,
+            )
+
+    @admin.action(description="Sync selected customers from stripe", permissions=['change'])
+    def sync_from_stripe(self, request, queryset):
+        report = queryset.sync_from_stripe()
+        self.message_user(request, f"{len(report.synced)} stripe customers synced.")
+        if report.missing:
+            self.message_user(
+                request,
+                f"{len(report.missing)} customers deleted on stripe were removed: {', '.join(report.missing)}",
+                messages.WARNING,
+            )
+        self.report_failures(request, report.failed, 'synced')
+
+    @admin.action(description="Delete selected customers on stripe", permissions=['delete'])
+    def delete_on_stripe(self, request, queryset):
+        report = queryset.delete_on_stripe()
+        self.message_user(request, f"{len(report.deleted)} stripe customers deleted.")
+        self.report_failures(request, report.failed, 'deleted')
+
+
+@admin.register(StripeCustomerEmail)
+class StripeCustomerEmailAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['email', 'customer_id', 'account', 'updated_at']
+    search_fields = ['^email', '^customer_id']
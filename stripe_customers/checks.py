@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# the cache backends which keep the entries in each process
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """the lock of the customer creation lives in the default cache, it only works across the
+    workers if they share the cache"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_CACHES:
+        return []
+    return [
+        Warning(
+            "the default cache isn't shared by the processes, the stripe customer creation lock "
+            "only holds inside each process",
+            hint="use a cache shared by the workers, like redis or memcached, when running more than one process.",
+            obj=backend,
+            id='stripe_customers.W001',
+        )
+    ]
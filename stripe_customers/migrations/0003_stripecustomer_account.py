@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stripe_customers', '0002_stripecustomer_idempotency_key_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripecustomer',
+            name='account',
+            field=models.CharField(default='default', max_length=50, verbose_name='stripe account'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stripe_customers', '0003_stripecustomer_account'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeCustomerEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='email')),
+                ('customer_id', models.CharField(max_length=100, unique=True, verbose_name='customer id')),
+                ('account', models.CharField(default='default', max_length=50, verbose_name='stripe account')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'stripe customer email',
+                'verbose_name_plural': 'stripe customer emails',
+                'indexes': [models.Index(fields=['account', 'email', '-updated_at'], name='stripe_cust_account_b69be7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from utils.prefix_indexes import add_prefix_indexes
+
+INDEXES = {
+    'stripe_customer_id_prefix_idx': ('stripe_customers_stripecustomer', 'customer_id'),
+    'stripe_customer_email_prefix_idx': ('stripe_customers_stripecustomeremail', 'email'),
+}
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('stripe_customers', '0004_stripecustomeremail'),
+    ]
+
+    operations = [
+        add_prefix_indexes(INDEXES),
+    ]
@@ -1,8 +1,13 @@
+import json
+import logging
 import os
-from uuid import uuid4
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import Any
+from uuid import NAMESPACE_URL, UUID, uuid4, uuid5
 
-import stripe
-import stripe.error
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
@@ -10,31 +15,255 @@ from django.core.validators import RegexValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from utils.locks import cache_lock
+from utils.stripe_clients import DEFAULT_ACCOUNT, current_account, get_client
+from utils.stripe_sdk import stripe
 
-class StripeCustomerManager(models.Manager):
-    def new(self, user: AbstractUser, **kwargs) -> "StripeCustomer":
+from .sync import coalescer
+
+logger = logging.getLogger("djangoStripe")
+
+
+@dataclass
+class BulkDeleteReport:
+    """Result of the bulk deletion of stripe customers.
+
+    Args:
+        deleted (list[str]): the customer ids deleted on stripe and in the database.
+        failed (dict[str, str]): the error message by customer id of the failed deletions,
+            which are kept in the database.
+        db_deleted (int): the number of rows deleted in the database.
+    """
+    deleted: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    db_deleted: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+@dataclass
+class BulkSyncReport:
+    """Result of the bulk sync of stripe customers from stripe.
+
+    Args:
+        synced (list[str]): the customer ids refreshed from stripe.
+        missing (list[str]): the customer ids deleted on stripe, removed from the database.
+        failed (dict[str, str]): the error message by customer id of the failed retrieves.
+    """
+    synced: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+def _retrieve_from_stripe(customer_id: str, account: str) -> tuple[Any, str | None]:
+    """retrieves the customer from stripe, returning it (None if deleted on stripe) and the
+    error message if the retrieve fails"""
+    try:
+        customer = get_client(account).customers.retrieve(customer_id)
+    except stripe.InvalidRequestError as e:
+        if e.code == 'resource_missing':
+            return None, None
+        return None, str(e)
+    except stripe.StripeError as e:
+        return None, str(e)
+    return (None if customer.get('deleted') else customer), None
+
+
+def _delete_on_stripe(customer_id: str, account: str) -> str | None:
+    """deletes the customer on stripe, returning the error message if it fails. Customers
+    already missing on stripe are considered deleted."""
+    try:
+        deleted = get_client(account).customers.delete(customer_id)
+    except stripe.InvalidRequestError as e:
+        if e.code == 'resource_missing':
+            return None
+        return str(e)
+    except stripe.StripeError as e:
+        return str(e)
+    return None if deleted.deleted else 'The stripe customer was not deleted'
+
+
+def customer_idempotency_key(
+    user: AbstractUser, account: str, replaced: str = '', params: Mapping[str, Any] | None = None
+) -> UUID:
+    """the idempotency key of the creation of the stripe customer of the user, the same in all
+    the tries with the same params. The join date tells apart the users of other databases using
+    the same stripe account (and the reused primary keys). Stripe rejects a key reused with other
+    params, so the params are part of the key.
+
+    Args:
+        user (AbstractUser): the user of the customer.
+        account (str): the stripe account of the customer.
+        replaced (str): the id of the customer, deleted on stripe, previously created with the key.
+        params (Mapping, optional): the params of the customer creation.
+    """
+    params_hash = sha256(json.dumps(params or {}, sort_keys=True, default=str).encode()).hexdigest()
+    return uuid5(
+        NAMESPACE_URL,
+        f"stripe_customers:{account}:{user.pk}:{user.date_joined.isoformat()}:{replaced}:{params_hash}",
+    )
+
+
+def _idempotent_replay(obj: Any) -> bool:
+    """if stripe answered the call with the response of a previous call with the same key"""
+    headers = getattr(getattr(obj, 'last_response', None), 'headers', None)
+    if not isinstance(headers, Mapping):
+        return False
+    return any(key.lower() == 'idempotent-replayed' and value == 'true' for key, value in headers.items())
+
+
+class StripeCustomerQuerySet(models.QuerySet):
+    def delete_on_stripe(self, max_workers: int | None = None) -> BulkDeleteReport:
+        """deletes the customers from the stripe concurrently and, in a single statement, the
+        rows of the customers successfully deleted on stripe. The standard `delete` only
+        deletes the rows.
+
+        Args:
+            max_workers (int, optional): the maximum of concurrent stripe calls.
+                Defaults to the `STRIPE_BULK_MAX_WORKERS` setting or 8.
+        """
+        if max_workers is None:
+            max_workers = getattr(settings, 'STRIPE_BULK_MAX_WORKERS', 8)
+
+        report = BulkDeleteReport()
+        customers = list(self.values_list('customer_id', 'account'))
+        if not customers:
+            return report
+
+        customer_ids = [customer_id for customer_id, _ in customers]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            errors = pool.map(_delete_on_stripe, customer_ids, [account for _, account in customers])
+            for customer_id, error in zip(customer_ids, errors):
+                if error is None:
+                    report.deleted.append(customer_id)
+                else:
+                    report.failed[customer_id] = error
+
+        if report.deleted:
+            report.db_deleted, _ = self.model.objects.filter(customer_id__in=report.deleted).delete()
+
+        if report.failed:
+            logger.error(f"{len(report.failed)} stripe customers were not deleted: {report.failed}")
+        return report
+
+    def sync_from_stripe(self, max_workers: int | None = None) -> BulkSyncReport:
+        """retrieves the customers from stripe concurrently, refreshing their emails in the
+        `StripeCustomerEmail` index and removing the rows of the customers deleted on stripe.
+
+        Args:
+            max_workers (int, optional): the maximum of concurrent stripe calls.
+                Defaults to the `STRIPE_BULK_MAX_WORKERS` setting or 8.
+        """
+        if max_workers is None:
+            max_workers = getattr(settings, 'STRIPE_BULK_MAX_WORKERS', 8)
+
+        report = BulkSyncReport()
+        customers = list(self.values_list('customer_id', 'account'))
+        if not customers:
+            return report
+
+        customer_ids = [customer_id for customer_id, _ in customers]
+        accounts = [account for _, account in customers]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(_retrieve_from_stripe, customer_ids, accounts)
+            for customer_id, account, (customer, error) in zip(customer_ids, accounts, results):
+                if error is not None:
+                    report.failed[customer_id] = error
+                elif customer is None:
+                    report.missing.append(customer_id)
+                else:
+                    StripeCustomerEmail.objects.record(customer.get('email'), customer_id, account=account)
+                    report.synced.append(customer_id)
+
+        if report.missing:
+            self.model._base_manager.filter(customer_id__in=report.missing).delete()
+            StripeCustomerEmail.objects.filter(customer_id__in=report.missing).delete()
+
+        if report.failed:
+            logger.error(f"{len(report.failed)} stripe customers were not synced: {report.failed}")
+        return report
+
+
+class StripeCustomerManager(models.Manager.from_queryset(StripeCustomerQuerySet)):
+    def new(self, user: AbstractUser, account: str | None = None, **kwargs) -> "StripeCustomer":
         """Creates a stripe customer passing the email, phone, name (by get_full_name), address (if exists)
-        username (by metadata) and store the user instance and his stripe customer id.
+        username (by metadata) and store the user instance and his stripe customer id. Returns
+        the customer the user already has instead, if any.
+
+        The creation is serialized per user by a cache lock, so the concurrent callers wait for
+        the first one and share its customer. The idempotency key is derived from the user, so
+        a creation retried after a crash or an expired lock gets the customer already created
+        on stripe, and the row is upserted.
 
         Args:
             user (AbstractUser): the user attributed to the stripe customer object.
-            kwargs (Mapping, optional): get the customer_id if given and extra arguments sent to stripe.Customer.create method.
+            account (str, optional): the stripe account where the customer is created. Defaults
+                to the account of the current request.
+            kwargs (Mapping, optional): get the customer_id if given and extra params sent to the stripe customer creation.
+
+        Raises:
+            LockNotAcquired: if the creation of another caller doesn't finish in the
+                `STRIPE_CUSTOMER_LOCK_WAIT` seconds.
         """
-        if not isinstance(user, AbstractUser) or self.filter(user=user).exists():
-            return self.create(user=user, customer_id=kwargs.get('customer_id'))
+        account = account or current_account()
+        if not isinstance(user, AbstractUser):
+            return self.create(user=user, customer_id=kwargs.get('customer_id'), account=account)
 
+        customer = self.filter(user=user).first()
+        if customer is not None:
+            return customer
+
+        with cache_lock(
+            f"stripe_customers:new:{user.pk}",
+            timeout=getattr(settings, 'STRIPE_CUSTOMER_LOCK_TIMEOUT', 30),
+            wait=getattr(settings, 'STRIPE_CUSTOMER_LOCK_WAIT', 10),
+        ):
+            customer = self.filter(user=user).first()
+            if customer is not None:
+                return customer
+
+            created, idempotency_key = self._create_on_stripe(user, account, **kwargs)
+            StripeCustomerEmail.objects.record(user.email, created.id, account=account)
+            customer, _created = self.get_or_create(
+                user=user,
+                defaults={'customer_id': created.id, 'idempotency_key': idempotency_key, 'account': account},
+            )
+        return customer
+
+    def _create_on_stripe(self, user: AbstractUser, account: str, **kwargs) -> tuple[Any, UUID]:
+        """create the customer on stripe, returning it and the idempotency key used"""
+        client = get_client(account)
         user_address = user.address.full_address_as_dict() if user.address is not None else None
-        idempotency_key = uuid4()
-        created = stripe.Customer.create(
-            address=user_address,
-            email=user.email,
-            metadata={'username': user.username},
-            name=user.get_full_name(),
-            phone=user.phone,
-            idempotency_key=str(idempotency_key),
+        params = {
+            'address': user_address,
+            'email': user.email,
+            'metadata': {'username': user.username},
+            'name': user.get_full_name(),
+            'phone': user.phone,
             **kwargs
-        )
-        return self.create(user=user, customer_id=created.id, idempotency_key=idempotency_key)
+        }
+        replaced = ''
+        while True:
+            idempotency_key = customer_idempotency_key(user, account, replaced, params)
+            created = client.customers.create(params=params, options={'idempotency_key': str(idempotency_key)})
+            if not _idempotent_replay(created):
+                return created, idempotency_key
+
+            # created by a previous try, unless it was deleted since (stripe keeps the keys 24h)
+            if not client.customers.retrieve(created.id).get('deleted'):
+                return created, idempotency_key
+            replaced = created.id
+
+    def get_or_create_for_user(self, user: AbstractUser, account: str | None = None) -> "StripeCustomer":
+        """return the stripe customer of the user, creating it if the user doesn't have one yet
+        (see `new`)"""
+        return self.new(user, account=account)
 
 
 class StripeCustomer(models.Model):
@@ -44,6 +273,7 @@ class StripeCustomer(models.Model):
     Args:
         customer_id (Charfield, required): the stripe customer id.
         user (ForeignKey, required): the user which the customer object refers.
+        account (CharField): the name of the stripe account where the customer was created.
     """
     customer_id = models.CharField(
         max_length=100,
@@ -61,6 +291,7 @@ class StripeCustomer(models.Model):
         on_delete=models.DO_NOTHING,
         related_name='stripe_customer',
     )
+    account = models.CharField(_("stripe account"), max_length=50, default=DEFAULT_ACCOUNT)
 
     objects: StripeCustomerManager = StripeCustomerManager()
 
@@ -76,15 +307,90 @@ class StripeCustomer(models.Model):
         
         Returns:
             tuple[tuple[int, dict[str, int]], bool]: the original `delete` method return and the
-            value from the `deleted` field of the delete method from `stripe.Customer.delete` method.
+            value from the `deleted` field of the customer deleted on stripe.
         """
-        deleted = stripe.Customer.delete(self.customer_id)
+        deleted = get_client(self.account).customers.delete(self.customer_id)
         if not deleted.deleted:
             raise stripe.StripeError('The stripe customer was not deleted')
 
         return super().delete(*args, **kwargs), deleted.deleted
 
-    def update(self, **kwargs) -> stripe.Customer:
-        """update the customer on stripe just calling `stripe.Customer.modify` passing
-        the given kwargs"""
-        return stripe.Customer.modify(self.customer_id, **kwargs)
+    def update(self, **kwargs) -> "stripe.Customer":
+        """update the customer on stripe just passing the given kwargs as the params"""
+        return get_client(self.account).customers.update(self.customer_id, params=kwargs)
+
+    def update_later(self, **kwargs) -> None:
+        """schedule the update of the customer on stripe. The updates to the same customer
+        within the debounce window (`STRIPE_CUSTOMER_SYNC_DEBOUNCE`) are merged and sent
+        in the background by a single update call."""
+        coalescer.schedule(self.customer_id, kwargs, account=self.account)
+
+
+class StripeCustomerEmailManager(models.Manager):
+    def lookup(self, email: str, account: str | None = None) -> str | None:
+        """return the id of the most recent stripe customer with the email in the stripe
+        account (by default the account of the current request), by a single indexed query."""
+        if not email:
+            return None
+        return self.filter(
+            account=account or current_account(), email=email.strip().lower()
+        ).order_by('-updated_at').values_list('customer_id', flat=True).first()
+
+    def lookup_guest(self, email: str, account: str | None = None) -> str | None:
+        """like `lookup`, only among the guest customers, those without a user. The email of a
+        guest isn't verified, so it must not reach the customer of a registered user."""
+        if not email:
+            return None
+        return self.filter(
+            account=account or current_account(), email=email.strip().lower()
+        ).exclude(
+            customer_id__in=StripeCustomer.objects.values('customer_id')
+        ).order_by('-updated_at').values_list('customer_id', flat=True).first()
+
+    def record(self, email: str | None, customer_id: str, account: str | None = None) -> None:
+        """store or update the email of the stripe customer. Customers without email are forgotten."""
+        if not email:
+            self.forget(customer_id)
+            return
+        self.update_or_create(
+            customer_id=customer_id,
+            defaults={'email': email.strip().lower(), 'account': account or current_account()},
+        )
+
+    def forget(self, customer_id: str) -> None:
+        self.filter(customer_id=customer_id).delete()
+
+    def record_from_stripe(self, customer) -> None:
+        """callback to the `customer.created` and `customer.updated` webhooks"""
+        self.record(customer.get('email'), customer['id'])
+
+    def forget_from_stripe(self, customer) -> None:
+        """callback to the `customer.deleted` webhook"""
+        self.forget(customer['id'])
+
+
+class StripeCustomerEmail(models.Model):
+    """Index of the stripe customers by email, including the guest customers without user,
+    used to find the customer of an email without calling the stripe customer search.
+
+    Args:
+        email (EmailField, required): the customer email, in lower case.
+        customer_id (CharField, required): the stripe customer id.
+        account (CharField): the name of the stripe account of the customer.
+    """
+    email = models.EmailField(_("email"))
+    customer_id = models.CharField(_("customer id"), max_length=100, unique=True)
+    account = models.CharField(_("stripe account"), max_length=50, default=DEFAULT_ACCOUNT)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    objects: StripeCustomerEmailManager = StripeCustomerEmailManager()
+
+    class Meta:
+        verbose_name = _("stripe customer email")
+        verbose_name_plural = _("stripe customer emails")
+        indexes = [
+            models.Index(fields=['account', 'email', '-updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.customer_id})"
@@ -0,0 +1,112 @@
+"""Cache of the saved payment methods of each stripe customer, so the checkout shows them without
+calling stripe on every page load. The `payment_method.*` webhooks keep the cache up to date."""
+import logging
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.stripe_clients import get_client
+from utils.stripe_sdk import stripe
+
+logger = logging.getLogger("djangoStripe")
+
+# the `allow_redisplay` values of the methods the customer agreed to show again on the checkout
+REDISPLAYED = ('always', 'limited')
+
+
+def _cache_key(customer_id: str) -> str:
+    return f"stripe_customers:payment_methods:{customer_id}"
+
+
+def _owner_cache_key(payment_method_id: str) -> str:
+    # the detached payment methods don't have the customer anymore
+    return f"stripe_customers:payment_method_owner:{payment_method_id}"
+
+
+def _timeout() -> int:
+    return getattr(settings, 'STRIPE_PAYMENT_METHODS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def summarize(payment_method: Any) -> dict[str, Any]:
+    """return the fields of the payment method shown on the checkout"""
+    summary = {'id': payment_method['id'], 'type': payment_method['type']}
+    card = payment_method.get('card')
+    if card:
+        summary.update({
+            'brand': card['brand'],
+            'last4': card['last4'],
+            'exp_month': card['exp_month'],
+            'exp_year': card['exp_year'],
+        })
+    return summary
+
+
+def can_redisplay(payment_method: Any) -> bool:
+    return payment_method.get('allow_redisplay') in REDISPLAYED
+
+
+def _store(customer_id: str, methods: list[dict[str, Any]]) -> None:
+    cache.set(_cache_key(customer_id), methods, _timeout())
+    cache.set_many({_owner_cache_key(method['id']): customer_id for method in methods}, _timeout())
+
+
+def refresh_payment_methods(customer_id: str, account: str | None = None) -> list[dict[str, Any]]:
+    """list the saved payment methods of the customer on stripe which can be shown again, and
+    cache them"""
+    listed = get_client(account).customers.payment_methods.list(customer_id, {'limit': 100})
+    methods = [summarize(payment_method) for payment_method in listed.data if can_redisplay(payment_method)]
+    _store(customer_id, methods)
+    return methods
+
+
+def get_saved_payment_methods(customer_id: str, account: str | None = None) -> list[dict[str, Any]]:
+    """return the saved payment methods of the customer, from the cache when possible. Returns
+    an empty list if stripe fails, the checkout works without them."""
+    methods = cache.get(_cache_key(customer_id))
+    if methods is not None:
+        return methods
+
+    try:
+        return refresh_payment_methods(customer_id, account)
+    except stripe.StripeError as e:
+        logger.error(f"Error on list the payment methods of the customer {customer_id}: {str(e)}")
+        return []
+
+
+def invalidate_payment_methods(customer_id: str) -> None:
+    cache.delete(_cache_key(customer_id))
+
+
+def payment_method_attached(payment_method: Any) -> None:
+    """callback to the `payment_method.attached` and `payment_method.updated` webhooks. Updates
+    the cached list of the customer, or caches the full list if it isn't cached. If stripe
+    fails the list is listed again on the next checkout."""
+    customer_id = payment_method.get('customer')
+    if not customer_id:
+        return
+
+    methods = cache.get(_cache_key(customer_id))
+    if methods is None:
+        try:
+            refresh_payment_methods(customer_id)
+        except stripe.StripeError as e:
+            logger.error(f"Error on list the payment methods of the customer {customer_id}: {str(e)}")
+        return
+
+    methods = [method for method in methods if method['id'] != payment_method['id']]
+    if can_redisplay(payment_method):
+        methods.append(summarize(payment_method))
+    _store(customer_id, methods)
+
+
+def payment_method_detached(payment_method: Any) -> None:
+    """callback to the `payment_method.detached` webhook"""
+    customer_id = cache.get(_owner_cache_key(payment_method['id']))
+    cache.delete(_owner_cache_key(payment_method['id']))
+    if customer_id is None:
+        return
+
+    methods = cache.get(_cache_key(customer_id))
+    if methods is not None:
+        _store(customer_id, [method for method in methods if method['id'] != payment_method['id']])
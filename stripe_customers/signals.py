@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from addresses.models import Address, AddressLines
+from utils.background import run_in_background
+from utils.stripe_clients import current_account
+
+from .models import StripeCustomer
+from .sync import (
+    ADDRESS_LINES_SNAPSHOT_FIELDS, ADDRESS_SNAPSHOT_FIELDS, USER_SNAPSHOT_FIELDS, address_snapshot,
+    coalescer, diff_snapshots, user_snapshot,
+)
+
+User = get_user_model()
+
+
+def _sync_enabled() -> bool:
+    return getattr(settings, 'STRIPE_CUSTOMER_SYNC_ENABLED', True)
+
+
+def _schedule(customers, params) -> None:
+    for customer_id, account in customers:
+        transaction.on_commit(lambda c=customer_id, a=account: coalescer.schedule(c, params, account=a))
+
+
+SNAPSHOT_FIELDS = {
+    User: USER_SNAPSHOT_FIELDS,
+    Address: ADDRESS_SNAPSHOT_FIELDS,
+    AddressLines: ADDRESS_LINES_SNAPSHOT_FIELDS,
+}
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=AddressLines)
+@receiver(pre_save, sender=Address)
+def take_snapshot(sender, instance, update_fields=None, raw=False, **kwargs):
+    """read the stripe relevant values of the instance as stored, to diff them after the save.
+    Only read when saving an existing row which may change them, not on every load."""
+    instance._stripe_snapshot = None
+    if raw or instance._state.adding or instance.pk is None or not _sync_enabled():
+        return
+
+    fields = SNAPSHOT_FIELDS[sender]
+    if update_fields is not None and not {field.removesuffix('_id') for field in fields} & {
+        field.removesuffix('_id') for field in update_fields
+    }:
+        return
+
+    stored = sender._default_manager.filter(pk=instance.pk).values(*fields).first()
+    if stored is not None:
+        snapshot = user_snapshot if sender is User else address_snapshot
+        instance._stripe_snapshot = snapshot(sender(pk=instance.pk, **stored))
+
+
+@receiver(post_save, sender=User)
+def sync_user(sender, instance, created, **kwargs):
+    """schedule the update of the changed fields of the user on his stripe customer"""
+    new = user_snapshot(instance)
+    changed = diff_snapshots(getattr(instance, '_stripe_snapshot', None), new)
+    if not changed or not _sync_enabled():
+        return
+
+    customers = StripeCustomer.objects.filter(user=instance).values_list('customer_id', 'account')
+    params = {key: new[key] for key in changed - {'address'}}
+    if 'address' in changed:
+        params['address'] = instance.address.full_address_as_dict() if instance.address else ''
+    _schedule(customers, params)
+
+
+def prefetch_customer(user_pk, account: str) -> None:
+    StripeCustomer.objects.get_or_create_for_user(User.objects.get(pk=user_pk), account=account)
+
+
+@receiver(post_save, sender=User)
+def schedule_customer_prefetch(sender, instance, created, **kwargs):
+    """create the stripe customer of the new users in the background, after the signup commit,
+    so the signup doesn't wait for stripe. The first checkout creates it if this fails."""
+    if not created or not getattr(settings, 'STRIPE_CUSTOMER_PREFETCH', True):
+        return
+
+    account = current_account()
+    transaction.on_commit(lambda: run_in_background(prefetch_customer, instance.pk, account))
+
+
+@receiver(post_save, sender=AddressLines)
+@receiver(post_save, sender=Address)
+def sync_address(sender, instance, created, **kwargs):
+    """schedule the update of the address on the stripe customers of the users which live there"""
+    new = address_snapshot(instance)
+    changed = diff_snapshots(getattr(instance, '_stripe_snapshot', None), new)
+    if not changed or not _sync_enabled():
+        return
+
+    lines = [instance] if sender is AddressLines else instance.addresslines_set.select_related('address')
+    for address_lines in lines:
+        customers = StripeCustomer.objects.filter(
+            user__address=address_lines
+        ).values_list('customer_id', 'account')
+        _schedule(customers, {'address': address_lines.full_address_as_dict()})
@@ -0,0 +1,112 @@
+import atexit
+import logging
+import threading
+from typing import Any
+
+from django.conf import settings
+
+from utils.stripe_clients import DEFAULT_ACCOUNT, get_client
+from utils.stripe_sdk import stripe
+
+logger = logging.getLogger("djangoStripe")
+
+
+# the fields read to build the snapshots, by model name
+USER_SNAPSHOT_FIELDS = ['email', 'phone', 'first_name', 'last_name', 'address_id']
+ADDRESS_SNAPSHOT_FIELDS = ['country', 'state', 'city', 'postal_code']
+ADDRESS_LINES_SNAPSHOT_FIELDS = ['line1', 'line2', 'address_id']
+
+
+def user_snapshot(user) -> dict[str, Any]:
+    """return the values of the user that are sent to the stripe customer object"""
+    return {
+        'email': user.email,
+        'phone': str(user.phone) if user.phone else '',
+        'name': user.get_full_name(),
+        'address': user.address_id,
+    }
+
+
+def address_snapshot(address) -> dict[str, Any]:
+    """return the values of an `Address` or `AddressLines` that are sent to the stripe
+    customer object"""
+    fields = ADDRESS_LINES_SNAPSHOT_FIELDS if hasattr(address, 'line1') else ADDRESS_SNAPSHOT_FIELDS
+    return {field: getattr(address, field) for field in fields}
+
+
+def diff_snapshots(old: dict[str, Any] | None, new: dict[str, Any]) -> set[str]:
+    """return the keys with different values between the snapshots. A missing old snapshot
+    means the instance was just created and has nothing to sync yet."""
+    if old is None:
+        return set()
+    return {key for key, value in new.items() if old.get(key) != value}
+
+
+class CustomerUpdateCoalescer:
+    """Collect the stripe customer updates in memory and send them in the background.
+
+    All the updates scheduled to the same customer within the debounce window are merged
+    into a single customer update call. The pending updates are sent when the
+    window ends or as soon as `batch_size` distinct customers are waiting, and when the
+    process exits (like at the end of a management command), see `atexit` below.
+
+    Args:
+        debounce (float): seconds waited after the first pending update before flushing.
+        batch_size (int): the maximum of customers waiting before a early flush.
+    """
+    def __init__(self, debounce: float = 2.0, batch_size: int = 100):
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self._pending: dict[tuple[str, str], dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+
+    def schedule(self, customer_id: str, params: dict[str, Any], account: str = DEFAULT_ACCOUNT) -> None:
+        """merge the params into the pending update of the customer of the stripe account"""
+        if not params:
+            return
+
+        with self._lock:
+            self._pending.setdefault((account, customer_id), {}).update(params)
+            if len(self._pending) >= self.batch_size:
+                self._start_timer(0)
+            elif self._timer is None:
+                self._start_timer(self.debounce)
+
+    def _start_timer(self, interval: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(interval, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self) -> dict[str, Exception]:
+        """send all the pending updates now.
+
+        Returns:
+            dict[str, Exception]: the errors raised by stripe by customer id.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        errors = {}
+        for (account, customer_id), params in pending.items():
+            try:
+                get_client(account).customers.update(customer_id, params=params)
+            except stripe.StripeError as e:
+                logger.error(f"Error on update the customer {customer_id}: {str(e)} | params: {params}")
+                errors[customer_id] = e
+            else:
+                logger.debug(f"customer {customer_id} updated with the fields {sorted(params)}")
+        return errors
+
+
+coalescer = CustomerUpdateCoalescer(
+    debounce=getattr(settings, 'STRIPE_CUSTOMER_SYNC_DEBOUNCE', 2.0),
+    batch_size=getattr(settings, 'STRIPE_CUSTOMER_SYNC_BATCH_SIZE', 100),
+)
+# the timer is a daemon thread, killed at exit with the updates still pending
+atexit.register(coalescer.flush)
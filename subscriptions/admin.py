@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Subscription
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_display = ['subscription_id', 'customer_id', 'user', 'status', 'current_period_end']
+    list_filter = ['status']
+    list_select_related = ['user']
+    search_fields = ['^subscription_id', '^customer_id']
@@ -0,0 +1,79 @@
+from functools import wraps
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.contrib.auth.mixins import AccessMixin
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+from .models import Subscription
+
+CACHE_KEY = "subscriptions:entitlements:{user_id}"
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'SUBSCRIPTIONS_ENTITLEMENTS_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_user_entitlements(user) -> frozenset[str]:
+    """return the set of entitlements from the active subscriptions of the user.
+
+    The set is read from the cache and, on a miss, built with a single indexed query on the
+    local `Subscription` table. The stripe API is never called.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    key = CACHE_KEY.format(user_id=user.pk)
+    entitlements = cache.get(key)
+    if entitlements is None:
+        entitlements = set()
+        rows = Subscription.objects.filter(
+            user_id=user.pk, status__in=Subscription.GRANTING_STATUSES
+        ).values_list('entitlements', flat=True)
+        for row in rows:
+            entitlements.update(row)
+        cache.set(key, entitlements, _cache_timeout())
+
+    return frozenset(entitlements)
+
+
+def invalidate_entitlements(user_id) -> None:
+    """removes the cached entitlements of the user, must be called when his subscriptions change"""
+    cache.delete(CACHE_KEY.format(user_id=user_id))
+
+
+def has_entitlements(user, entitlements: Iterable[str]) -> bool:
+    """check if the user has all the given entitlements"""
+    return get_user_entitlements(user).issuperset(entitlements)
+
+
+def entitlement_required(*entitlements: str, login_url: str | None = None) -> Callable:
+    """decorator to function based views that denies the access if the user doesn't have all
+    the given entitlements. Anonymous users are redirected to the login page.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path(), login_url)
+
+            if not has_entitlements(request.user, entitlements):
+                raise PermissionDenied
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+class EntitlementRequiredMixin(AccessMixin):
+    """Mixin class to deny the access to users without all the `required_entitlements`"""
+    required_entitlements: Iterable[str] = ()
+
+    def get_required_entitlements(self) -> Iterable[str]:
+        return self.required_entitlements
+
+    def dispatch(self, request, *args, **kwargs):
+        if not has_entitlements(request.user, self.get_required_entitlements()):
+            return self.handle_no_permission()
+        return super().dispatch(request, *args, **kwargs)
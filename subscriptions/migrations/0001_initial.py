@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_id', models.CharField(max_length=100, unique=True, verbose_name='subscription id')),
+                ('customer_id', models.CharField(db_index=True, max_length=100, verbose_name='customer id')),
+                ('status', models.CharField(max_length=30, verbose_name='status')),
+                ('entitlements', models.JSONField(blank=True, default=list, verbose_name='entitlements')),
+                ('cancel_at_period_end', models.BooleanField(default=False, verbose_name='cancel at period end')),
+                ('current_period_end', models.DateTimeField(blank=True, null=True, verbose_name='current period end')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='subscriptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'subscription',
+                'verbose_name_plural': 'subscriptions',
+                'indexes': [models.Index(fields=['user', 'status'], name='subscriptio_user_id_2a19e8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='stripe_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='updated on stripe'),
+        ),
+    ]
@@ -0,0 +1,170 @@
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.utils.translation import gettext_lazy as _
+
+from stripe_customers.models import StripeCustomer
+from utils.stripe_clients import get_client
+
+logger = logging.getLogger("djangoStripe")
+
+
+class SubscriptionManager(models.Manager):
+    def sync_from_stripe(self, subscription: Any, event_created: int | None = None) -> "Subscription":
+        """Creates or updates the local copy of a stripe subscription object, as received
+        from the `customer.subscription.*` webhooks.
+
+        Args:
+            subscription (stripe.Subscription | Mapping): the stripe subscription object.
+            event_created (int, optional): the timestamp of the event (or of the retrieve) the
+                object comes from. The objects older than the stored state are ignored, stripe
+                doesn't send the webhooks in order.
+        """
+        customer_id = subscription['customer']
+        if not isinstance(customer_id, str):  # expanded customer object
+            customer_id = customer_id['id']
+
+        entitlements = []
+        period_end = subscription.get('current_period_end')
+        for item in subscription['items']['data']:
+            price = item['price']
+            entitlements.append(price.get('lookup_key') or price['id'])
+            product = price['product']
+            entitlements.append(product if isinstance(product, str) else product['id'])
+            period_end = period_end or item.get('current_period_end')
+
+        user_id = StripeCustomer.objects.filter(
+            customer_id=customer_id
+        ).values_list('user_id', flat=True).first()
+
+        stripe_updated_at = _from_timestamp(event_created)
+        with transaction.atomic():
+            current = self.select_for_update().filter(subscription_id=subscription['id']).first()
+            if (
+                current is not None and stripe_updated_at is not None
+                and current.stripe_updated_at is not None and stripe_updated_at < current.stripe_updated_at
+            ):
+                logger.info(f"ignored the outdated state of the subscription {subscription['id']}")
+                return current
+
+            obj, _created = self.update_or_create(
+                subscription_id=subscription['id'],
+                defaults={
+                    'customer_id': customer_id,
+                    'user_id': user_id,
+                    'status': subscription['status'],
+                    'entitlements': sorted(set(entitlements)),
+                    'cancel_at_period_end': bool(subscription.get('cancel_at_period_end')),
+                    'current_period_end': _from_timestamp(period_end),
+                    'stripe_updated_at': stripe_updated_at or (current and current.stripe_updated_at),
+                }
+            )
+        return obj
+
+    def sync_from_invoice(self, invoice: Any, account: str | None = None) -> "Subscription | None":
+        """Syncs the subscription of the given stripe invoice object, as received from the
+        `invoice.*` webhooks. The invoice doesn't tell the subscription status (a paid invoice
+        of a canceled subscription doesn't activate it), so the subscription is retrieved from
+        stripe. Returns None if the invoice is not from a subscription.
+
+        Args:
+            invoice (stripe.Invoice | Mapping): the stripe invoice object.
+            account (str, optional): the stripe account of the invoice. Defaults to the account
+                of the current request.
+        """
+        subscription_id = invoice.get('subscription')
+        if not subscription_id:
+            return None
+        if not isinstance(subscription_id, str):  # expanded subscription object
+            subscription_id = subscription_id['id']
+
+        retrieved_at = int(time.time())
+        subscription = get_client(account).subscriptions.retrieve(subscription_id)
+        return self.sync_from_stripe(subscription, event_created=retrieved_at)
+
+    def link_customer(self, customer: StripeCustomer) -> int:
+        """relate the subscriptions synced before the customer row existed to its user"""
+        linked = self.filter(customer_id=customer.customer_id, user__isnull=True).update(user_id=customer.user_id)
+        if linked:
+            from .entitlements import invalidate_entitlements
+
+            invalidate_entitlements(customer.user_id)
+        return linked
+
+
+class Subscription(models.Model):
+    """Local copy of a stripe subscription, maintained by the stripe webhooks, used to check
+    what the user has access to without calling the stripe API.
+
+    Args:
+        subscription_id (CharField, required): the stripe subscription id.
+        customer_id (CharField, required): the stripe customer id which owns the subscription.
+        user (ForeignKey, optional): the user related to the stripe customer, if known.
+        status (CharField, required): the stripe subscription status.
+        entitlements (JSONField): the price lookup keys (or price ids) and product ids subscribed.
+        cancel_at_period_end (BooleanField): if the subscription will be canceled at the period end.
+        current_period_end (DateTimeField, optional): the end of the period already paid.
+        stripe_updated_at (DateTimeField, optional): the time of the event the state comes from.
+    """
+    ACTIVE = 'active'
+    TRIALING = 'trialing'
+    PAST_DUE = 'past_due'
+    GRANTING_STATUSES = (ACTIVE, TRIALING)
+
+    subscription_id = models.CharField(_("subscription id"), max_length=100, unique=True)
+    customer_id = models.CharField(_("customer id"), max_length=100, db_index=True)
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.DO_NOTHING,
+        related_name='subscriptions',
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(_("status"), max_length=30)
+    entitlements = models.JSONField(_("entitlements"), default=list, blank=True)
+    cancel_at_period_end = models.BooleanField(_("cancel at period end"), default=False)
+    current_period_end = models.DateTimeField(_("current period end"), blank=True, null=True)
+    stripe_updated_at = models.DateTimeField(_("updated on stripe"), blank=True, null=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    objects: SubscriptionManager = SubscriptionManager()
+
+    class Meta:
+        verbose_name = _("subscription")
+        verbose_name_plural = _("subscriptions")
+        indexes = [
+            models.Index(fields=['user', 'status']),
+        ]
+
+    def __str__(self):
+        return self.subscription_id
+
+    @property
+    def is_granting(self) -> bool:
+        """if the subscription status gives access to its entitlements"""
+        return self.status in self.GRANTING_STATUSES
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_entitlements()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_entitlements()
+        return result
+
+    def _invalidate_entitlements(self):
+        from .entitlements import invalidate_entitlements
+
+        if self.user_id is not None:
+            invalidate_entitlements(self.user_id)
+
+
+def _from_timestamp(timestamp: int | None) -> datetime | None:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from stripe_customers.models import StripeCustomer
+
+from .models import Subscription
+
+
+@receiver(post_save, sender=StripeCustomer)
+def link_subscriptions_to_new_customer(sender, instance, created, **kwargs):
+    """the subscription webhooks may arrive before the customer row of the user is saved"""
+    if created:
+        Subscription.objects.link_customer(instance)
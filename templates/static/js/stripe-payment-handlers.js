@@ -17,9 +17,13 @@ class StripeCustomCheckoutHandler extends IPaymentProviderHandler {
 	}
 
 	async _initialize(csrfToken, checkoutUrl, layout, paymentElementSelector) {
+		// a new attempt on each page load, so buying the same again creates a new intent
+		const body = new FormData();
+		body.append("attempt", crypto.randomUUID());
 		const response = await fetch(checkoutUrl, {
 			method: "POST",
 			headers: { "X-CSRFToken": csrfToken },
+			body,
 		});
 
 		const { clientSecret, appearance } = await response.json();
@@ -53,6 +57,62 @@ class StripeCustomCheckoutHandler extends IPaymentProviderHandler {
 				this._confirmPayment(elements, returnUrl)
 			);
 	}
+
+	_payWithSavedMethod(csrfToken, checkoutUrl, successUrl) {
+		const inner = async (e) => {
+			const button = e.currentTarget;
+			if (button.disabled) {
+				return;
+			}
+			// the attempt of the click is kept until the server answers, so clicking again after
+			// a network failure retries the same intent and a later purchase creates a new one
+			button.dataset.attempt ||= crypto.randomUUID();
+			const body = new FormData();
+			body.append("payment_method", button.dataset.paymentMethod);
+			body.append("attempt", button.dataset.attempt);
+			button.disabled = true;
+			let response;
+			try {
+				response = await fetch(checkoutUrl, {
+					method: "POST",
+					headers: { "X-CSRFToken": csrfToken },
+					body,
+				});
+			} finally {
+				button.disabled = false;
+			}
+			delete button.dataset.attempt;
+
+			const { status, clientSecret, requiresAction, error } = await response.json();
+			if (error) {
+				alert(error);
+				return;
+			}
+			if (requiresAction) {
+				const result = await this._provider.handleNextAction({ clientSecret });
+				if (result.error) {
+					alert(result.error.message);
+					return;
+				}
+			} else if (status !== "succeeded" && status !== "processing") {
+				alert("The payment was not completed.");
+				return;
+			}
+			location.href = successUrl;
+		};
+		return inner;
+	}
+
+	handleSavedPaymentMethods(settings) {
+		const { csrfToken, checkoutUrl, savedPaymentMethodSelector, successUrl } = settings;
+
+		document
+			.querySelectorAll(savedPaymentMethodSelector)
+			.forEach((button) => button.addEventListener(
+				"click",
+				this._payWithSavedMethod(csrfToken, checkoutUrl, successUrl)
+			));
+	}
 }
 
 class StripeCheckoutEmbeddedHandler extends IPaymentProviderHandler {
@@ -0,0 +1,43 @@
+import os
+from pathlib import Path
+
+import pytest
+
+CASSETTES_DIR = Path(__file__).parent / 'cassettes'
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        "stripe_cassette: replay the stripe calls of the test from its cassette "
+        "(STRIPE_CASSETTE_MODE=record calls stripe and records it again)",
+    )
+
+
+@pytest.fixture
+def stripe_cassette(request):
+    """answer the stripe calls of the test from `tests/cassettes/<module>/<test>.json`"""
+    from utils.stripe_cassettes import REPLAY, use_cassette
+
+    module = request.node.module.__name__.removeprefix('tests.').replace('.', '/')
+    path = CASSETTES_DIR / module / f'{request.node.name}.json'
+    with use_cassette(path, os.getenv('STRIPE_CASSETTE_MODE', REPLAY)) as cassette:
+        yield cassette
+
+
+@pytest.fixture(autouse=True)
+def _stripe_cassette_marker(request):
+    if request.node.get_closest_marker('stripe_cassette') is not None:
+        request.getfixturevalue('stripe_cassette')
+
+
+@pytest.fixture(autouse=True)
+def _clear_stripe_read_cache():
+    """the read cache outlives the tests, its objects would leak to the next ones"""
+    from django.core.cache import cache
+
+    from utils.stripe_cache import read_cache
+
+    yield
+    read_cache.clear()
+    cache.clear()
@@ -1,13 +1,11 @@
-import os
-from pathlib import Path
-
 import pytest
-import stripe
-from dotenv import load_dotenv
 
 from stripe_customers.models import StripeCustomer
+from utils.stripe_clients import get_client
 
-load_dotenv(Path(__file__).parent.parent.parent.parent / '.env')
+# the stripe calls are replayed from the hand-written fixtures in tests/cassettes, see
+# `tests/conftest.py`
+pytestmark = pytest.mark.stripe_cassette
 
 
 @pytest.mark.django_db
@@ -15,22 +13,20 @@ def test_stripe_customer_manager_new(admin_user):
     """test if the method `new` from `StripeCustomerManager` creates a new customer
     on stripe and store the user and the customer id
     """
-    stripe_key = os.environ['STRIPE_SECRET_KEY_TEST']
-    new_customer = StripeCustomer.objects.new(admin_user, stripe_api_key=stripe_key)
-    stipe_customer = stripe.Customer.retrieve(new_customer.customer_id, api_key=stripe_key)
+    new_customer = StripeCustomer.objects.new(admin_user)
+    stipe_customer = get_client().customers.retrieve(new_customer.customer_id)
     customer_username = stipe_customer['metadata'].get('username')
 
     assert new_customer.user.username == customer_username
 
-    deleted = stripe.Customer.delete(new_customer.customer_id, api_key=stripe_key)
+    deleted = get_client().customers.delete(new_customer.customer_id)
     assert deleted.deleted, 'The stripe customer was not deleted'
 
 
 @pytest.mark.django_db
 def test_stripe_customer_delete(admin_user):
     """test if the delete method deletes the customer on the stripe platform"""
-    stripe_key = os.environ['STRIPE_SECRET_KEY_TEST']
-    new_customer = StripeCustomer.objects.new(admin_user, stripe_api_key=stripe_key)
+    new_customer = StripeCustomer.objects.new(admin_user)
     
     result = new_customer.delete()
     deleted = result[1]
@@ -1,4 +1,7 @@
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
 
 from addresses.models import Address, AddressLines
 
@@ -32,3 +35,108 @@ def test_address_lines_full_address_as_dict():
     
     # assert
     assert result == expected_result
+
+
+@pytest.mark.django_db
+def test_address_lines_get_or_create_by_content_reuses_the_same_content():
+    # arrange
+    address = {'country': 'BR', 'state': 'SP', 'city': 'Itaquera', 'postal_code': '57302-675'}
+    first, created = AddressLines.objects.get_or_create_by_content('Liberdade, 123', **address)
+
+    # act
+    same, same_created = AddressLines.objects.get_or_create_by_content(
+        '  liberdade,   123 ', '', country='br', state='sp', city='ITAQUERA', postal_code='57302675'
+    )
+
+    # assert
+    assert created and not same_created
+    assert same.pk == first.pk
+    assert Address.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_editing_an_address_rehashes_its_lines():
+    # arrange
+    address = {'country': 'BR', 'state': 'SP', 'city': 'Itaquera', 'postal_code': '57302675'}
+    lines, _created = AddressLines.objects.get_or_create_by_content('Liberdade, 123', **address)
+
+    # act
+    lines.address.city = 'Guaianases'
+    lines.address.save()
+    old, old_created = AddressLines.objects.get_or_create_by_content('Liberdade, 123', **address)
+    new, new_created = AddressLines.objects.get_or_create_by_content(
+        'Liberdade, 123', **{**address, 'city': 'Guaianases'}
+    )
+
+    # assert
+    assert old_created and old.address.city == 'Itaquera'
+    assert not new_created and new.pk == lines.pk
+
+
+@pytest.mark.django_db
+def test_creating_an_existing_content_returns_the_stored_row():
+    # arrange
+    Address.objects.create(country='BR', state='SP', city='Itaquera', postal_code='57302675')
+
+    # act
+    address = Address.objects.create(country='br', state='sp', city='ITAQUERA', postal_code='57302-675')
+
+    # assert
+    assert Address.objects.count() == 1
+    assert (address.city, address.postal_code) == ('Itaquera', '57302675')
+
+
+@pytest.mark.django_db
+def test_dedupe_addresses_command_merges_duplicates_and_repoints_users(django_user_model):
+    # arrange
+    # bulk_create skips `save`, as the rows created before the content hash existed
+    addresses = Address.objects.bulk_create([
+        Address(country='BR', state='SP', city='itaquera', postal_code='57302675')
+        for _ in range(2)
+    ])
+    lines = AddressLines.objects.bulk_create([
+        AddressLines(line1='liberdade, 123', address=addr) for addr in addresses
+    ])
+    user = django_user_model.objects.create(username='user', email='user@mail.com', address=lines[1])
+
+    # act
+    call_command('dedupe_addresses', batch_size=1, stdout=StringIO())
+
+    # assert
+    user.refresh_from_db()
+    assert Address.objects.count() == 1
+    assert AddressLines.objects.count() == 1
+    assert user.address_id == lines[0].pk
+    assert AddressLines.objects.get().content_hash is not None
+
+
+@pytest.mark.django_db
+def test_create_with_an_existing_content_reuses_the_row():
+    # arrange
+    first = Address.objects.create(country='BR', state='SP', city='Itaquera', postal_code='57302-675')
+
+    # act
+    same = Address.objects.create(country='br', state='sp', city='ITAQUERA', postal_code='57302675')
+    lines = AddressLines.objects.create(line1='Liberdade, 123', address=same)
+    same_lines = AddressLines.objects.create(line1='liberdade,  123', address=first)
+
+    # assert
+    assert same.pk == first.pk
+    assert Address.objects.count() == 1
+    assert same_lines.pk == lines.pk
+
+
+@pytest.mark.django_db
+def test_get_or_create_by_content_finds_the_lines_in_one_query(django_assert_num_queries):
+    # arrange
+    address = {'country': 'BR', 'state': 'SP', 'city': 'Itaquera', 'postal_code': '57302-675'}
+    AddressLines.objects.get_or_create_by_content('Liberdade, 123', **address)
+
+    # act
+    with django_assert_num_queries(1):
+        lines, created = AddressLines.objects.get_or_create_by_content('Liberdade, 123', **address)
+        city = lines.address.city
+
+    # assert
+    assert not created
+    assert city == 'Itaquera'
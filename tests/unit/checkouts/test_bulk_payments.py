@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from checkouts.bulk_payments import CAPTURE, REFUND, BulkPaymentAction
+from checkouts.models import Payment
+from utils.stripe_sdk import stripe
+
+
+@pytest.fixture
+def payments():
+    return [
+        Payment.objects.create(
+            payment_intent_id=f'pi_{i}', status=status, amount=1000, amount_capturable=1000,
+            currency='usd', metadata={'batch': batch}, created=timezone.now(),
+        )
+        for i, (status, batch) in enumerate([
+            ('requires_capture', '1'), ('requires_capture', '1'), ('requires_capture', '2'), ('succeeded', '1'),
+        ])
+    ]
+
+
+def captured(payment_intent_id, options):
+    if payment_intent_id == 'pi_1':
+        raise stripe.CardError('expired', 'capture', 'charge_expired_for_capture')
+    return {
+        'id': payment_intent_id, 'status': 'succeeded', 'amount': 1000, 'amount_received': 1000,
+        'currency': 'usd', 'created': 1760832000, 'metadata': {'batch': '1'},
+    }
+
+
+@pytest.mark.django_db
+def test_capture_selects_by_status_and_metadata_and_logs_each_result(payments, tmp_path):
+    # arrange
+    log = tmp_path / 'capture.jsonl'
+    bulk = BulkPaymentAction(CAPTURE, max_workers=2, rate=1000, log_path=log)
+
+    # act
+    with mock.patch('checkouts.bulk_payments.get_client') as get_client:
+        get_client.return_value.payment_intents.capture.side_effect = captured
+        report = bulk.run(bulk.select(metadata={'batch': '1'}))
+
+    # assert
+    assert report.succeeded == ['pi_0']
+    assert list(report.failed) == ['pi_1']
+    assert Payment.objects.get(payment_intent_id='pi_0').status == 'succeeded'
+    entries = [json.loads(line) for line in log.read_text().splitlines()]
+    assert sorted((entry['payment_intent'], entry['ok']) for entry in entries) == [('pi_0', True), ('pi_1', False)]
+    options = get_client.return_value.payment_intents.capture.call_args_list[0].kwargs['options']
+    assert options['idempotency_key'].startswith('bulk-capture-pi_')
+
+
+@pytest.mark.django_db
+def test_resumed_run_skips_the_intents_already_done(payments, tmp_path):
+    # arrange
+    log = tmp_path / 'capture.jsonl'
+    log.write_text(json.dumps({'action': 'capture', 'payment_intent': 'pi_0', 'ok': True}) + '\n{"cut')
+
+    # act
+    with mock.patch('checkouts.bulk_payments.get_client') as get_client:
+        get_client.return_value.payment_intents.capture.side_effect = captured
+        call_command('bulk_payment_intents', 'capture', '--log', str(log), '--rate', '1000', stdout=mock.Mock(), stderr=mock.Mock())
+
+    # assert
+    captured_ids = sorted(call.args[0] for call in get_client.return_value.payment_intents.capture.call_args_list)
+    assert captured_ids == ['pi_1', 'pi_2']
+
+
+@pytest.mark.django_db
+def test_refunded_payments_are_not_selected_again(payments):
+    # arrange
+    Payment.objects.filter(payment_intent_id='pi_3').update(amount_received=1000)
+    bulk = BulkPaymentAction(REFUND, max_workers=2, rate=1000)
+
+    # act
+    with mock.patch('checkouts.bulk_payments.get_client') as get_client:
+        get_client.return_value.payment_intents.retrieve.return_value = {
+            'id': 'pi_3', 'status': 'succeeded', 'amount': 1000, 'amount_received': 1000, 'currency': 'usd',
+            'created': 1760832000, 'latest_charge': {'id': 'ch_3', 'amount_refunded': 1000},
+        }
+        report = bulk.run(bulk.select())
+
+    # assert
+    assert report.succeeded == ['pi_3']
+    assert Payment.objects.get(payment_intent_id='pi_3').amount_refunded == 1000
+    assert list(bulk.select()) == []
+
+
+def intent(status: str, **fields) -> dict:
+    return {
+        'id': 'pi_9', 'status': status, 'amount': 1000, 'amount_received': 0, 'currency': 'usd',
+        'created': 1760832000, **fields,
+    }
+
+
+@pytest.mark.django_db
+def test_sync_ignores_the_intent_events_delivered_late():
+    # arrange
+    Payment.objects.sync_from_stripe(intent('requires_capture'), event_created=1760832010)
+
+    # act
+    Payment.objects.sync_from_stripe(intent('requires_payment_method'), event_created=1760832000)
+    Payment.objects.sync_from_stripe(intent('succeeded', amount_received=1000), event_created=1760832020)
+    Payment.objects.sync_from_stripe(intent('requires_capture'), event_created=1760832020)
+
+    # assert
+    assert Payment.objects.get(payment_intent_id='pi_9').status == 'succeeded'
+
+
+@pytest.mark.django_db
+def test_refund_webhooks_update_the_refunded_amount(payments):
+    # arrange
+    refund = {'id': 're_1', 'object': 'refund', 'charge': 'ch_3', 'amount': 400, 'status': 'succeeded'}
+
+    # act
+    with mock.patch('checkouts.models.get_client') as get_client:
+        get_client.return_value.charges.retrieve.return_value = {
+            'id': 'ch_3', 'payment_intent': 'pi_3', 'amount_refunded': 400,
+        }
+        updated = Payment.objects.sync_refunded(refund)
+
+    # assert
+    assert updated == 1
+    assert Payment.objects.get(payment_intent_id='pi_3').amount_refunded == 400
+    get_client.return_value.charges.retrieve.assert_called_once_with('ch_3')
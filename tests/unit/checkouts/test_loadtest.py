@@ -0,0 +1,35 @@
+import pytest
+import stripe
+
+from checkouts import loadtest
+from checkouts.loadtest import sign_payload, synthetic_event
+from utils.support import percentile
+
+
+def test_synthetic_events_are_accepted_by_the_stripe_signature_verification():
+    # arrange
+    payload = synthetic_event('payment_intent.succeeded', 1)
+
+    # act
+    event = stripe.Webhook.construct_event(payload, sign_payload(payload, 'whsec_test'), 'whsec_test')
+
+    # assert
+    assert event.type == 'payment_intent.succeeded'
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 99) == 0.0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('endpoint', loadtest.ENDPOINTS)
+def test_the_load_test_scenario_runs_without_errors(endpoint):
+    # act
+    report = loadtest.run([endpoint], requests=6, concurrency=1, stripe_latency=0)
+
+    # assert
+    assert report[endpoint]['requests'] == 6
+    assert report[endpoint]['errors'] == 0
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+from django.core.cache import cache
+
+from checkouts.status import publish_status
+from checkouts.views import _status_events
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(settings):
+    cache.clear()
+    settings.PUBSUB_POLL_INTERVAL = 0.01
+
+
+def intent(status: str) -> dict:
+    return {'object': 'payment_intent', 'id': 'pi_1', 'status': status}
+
+
+def test_status_changes_are_pushed_until_the_final_status():
+    # arrange
+    publish_status(intent('processing'))
+
+    async def stream():
+        events = []
+        async for event in _status_events('pi_1'):
+            events.append(event)
+            if event.startswith('event: status') and len(events) == 2:
+                publish_status(intent('succeeded'))
+        return events
+
+    # act
+    events = asyncio.run(asyncio.wait_for(stream(), 5))
+
+    # assert
+    statuses = [json.loads(event.split('data: ')[1]) for event in events if event.startswith('event: status')]
+    assert [(message['status'], message['final']) for message in statuses] == [
+        ('processing', False), ('succeeded', True),
+    ]
+
+
+def test_async_session_payment_failure_is_final():
+    # arrange
+    session = {'object': 'checkout.session', 'id': 'cs_1', 'status': 'complete', 'payment_status': 'unpaid'}
+
+    # act
+    publish_status(session, 'checkout.session.async_payment_failed')
+
+    # assert
+    events = asyncio.run(asyncio.wait_for(_collect('cs_1'), 5))
+    assert json.loads(events[-1].split('data: ')[1])['payment_status'] == 'failed'
+
+
+async def _collect(object_id):
+    return [event async for event in _status_events(object_id)]
+
+
+def test_late_events_dont_move_the_status_back():
+    # arrange
+    publish_status(intent('succeeded'))
+
+    # act
+    published = publish_status(intent('processing'))
+
+    # assert
+    events = asyncio.run(asyncio.wait_for(_collect('pi_1'), 5))
+    assert not published
+    assert json.loads(events[-1].split('data: ')[1])['status'] == 'succeeded'
@@ -0,0 +1,50 @@
+from datetime import date
+
+import pytest
+
+from checkouts import revenue
+from checkouts.models import DailyRevenue
+
+CREATED = 1760832000  # 2025-10-19 UTC
+
+
+def intent(n: int, amount: int = 1000, currency: str = 'usd') -> dict:
+    return {'id': f'pi_{n}', 'amount': amount, 'amount_received': amount, 'currency': currency, 'created': CREATED}
+
+
+@pytest.mark.django_db
+def test_webhooks_update_the_daily_revenue_once():
+    # arrange
+    refund = {'id': 're_1', 'amount': 300, 'currency': 'usd', 'created': CREATED, 'status': 'succeeded'}
+    dispute = {'id': 'dp_1', 'amount': 1000, 'currency': 'usd', 'created': CREATED, 'status': 'needs_response'}
+
+    # act
+    revenue.record_payment(intent(1))
+    revenue.record_payment(intent(1))  # stripe retry
+    revenue.record_payment(intent(2, 2000))
+    revenue.record_payment(intent(3, 500, 'EUR'))
+    revenue.record_refund(refund)
+    revenue.record_dispute(dispute)
+    revenue.record_dispute({**dispute, 'status': 'won'})
+
+    # assert
+    usd = DailyRevenue.objects.get(currency='usd')
+    assert usd.day == date(2025, 10, 19)
+    assert (usd.gross, usd.refunded, usd.disputed, usd.net, usd.payments) == (3000, 300, 0, 2700, 2)
+    assert DailyRevenue.objects.totals()['eur']['net'] == 500
+
+
+@pytest.mark.django_db
+def test_rebuild_recomputes_the_rows_from_the_ledger():
+    # arrange
+    revenue.record_payment(intent(1))
+    revenue.record_refund({'id': 're_1', 'amount': 1000, 'currency': 'usd', 'created': CREATED, 'status': 'failed'})
+    DailyRevenue.objects.update(gross=0, payments=0)
+
+    # act
+    rows = revenue.rebuild()
+
+    # assert
+    usd = DailyRevenue.objects.get()
+    assert rows == 1
+    assert (usd.gross, usd.refunded, usd.payments, usd.refunds) == (1000, 0, 1, 0)
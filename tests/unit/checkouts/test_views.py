@@ -0,0 +1,258 @@
+import json
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from checkouts.views import StripeCheckoutSessionView, StripePaymentIntentView, StripeWebHookView
+from stripe_customers.models import StripeCustomer, StripeCustomerEmail
+from utils.locks import cache_lock
+from utils.stripe_sdk import stripe
+
+
+class CheckoutSessionView(StripeCheckoutSessionView):
+    def get_line_items(self, **kwargs):
+        return super().get_line_items(price='price_123', quantity=1)
+
+
+def post(view_class, data=None):
+    request = RequestFactory().post('/', data or {})
+    request.user = AnonymousUser()
+    request.stripe_account = 'default'
+    view = view_class()
+    view.setup(request)
+    return view
+
+
+@pytest.mark.django_db
+def test_returning_guest_is_attached_to_his_stripe_customer():
+    # arrange
+    StripeCustomerEmail.objects.record('guest@mail.com', 'cus_123')
+    view = post(CheckoutSessionView, {'email': 'guest@mail.com'})
+
+    # act
+    with mock.patch.object(view, 'get_stripe_client') as get_client:
+        view.create_checkout_sesion()
+
+    # assert
+    params = get_client.return_value.checkout.sessions.create.call_args.args[0]
+    assert params['customer'] == 'cus_123'
+
+
+@pytest.mark.django_db
+def test_guest_email_of_a_registered_user_is_not_attached_to_the_user_customer(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='user', email='user@mail.com', phone='+5511999990998')
+    StripeCustomer.objects.create(user=user, customer_id='cus_user')
+    StripeCustomerEmail.objects.record('user@mail.com', 'cus_user')
+    view = post(CheckoutSessionView, {'email': 'user@mail.com'})
+
+    # act
+    with mock.patch.object(view, 'get_stripe_client') as get_client:
+        view.create_checkout_sesion()
+
+    # assert
+    params = get_client.return_value.checkout.sessions.create.call_args.args[0]
+    assert 'customer' not in params
+    assert params['customer_email'] == 'user@mail.com'
+
+
+@pytest.mark.django_db
+def test_new_guest_email_is_sent_to_create_the_customer():
+    # arrange
+    view = post(CheckoutSessionView, {'email': 'new@mail.com'})
+
+    # act
+    with mock.patch.object(view, 'get_stripe_client') as get_client:
+        view.create_checkout_sesion()
+
+    # assert
+    params = get_client.return_value.checkout.sessions.create.call_args.args[0]
+    assert 'customer' not in params
+    assert params['customer_email'] == 'new@mail.com'
+    assert params['customer_creation'] == 'always'
+
+
+@pytest.mark.django_db
+def test_first_checkout_creates_the_missing_stripe_customer(django_user_model):
+    # arrange
+    view = post(StripePaymentIntentView)
+    view.request.user = django_user_model.objects.create(
+        username='new', email='new@mail.com', phone='+5511999990999'
+    )
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.return_value = mock.Mock(id='cus_new')
+        params = view.get_payment_intent_params(amount=1000)
+
+    # assert
+    assert params['customer'] == 'cus_new'
+    assert view.request.user.stripe_customer.customer_id == 'cus_new'
+
+
+@pytest.mark.django_db
+def test_payment_intent_is_retried_later_while_the_customer_is_being_created(django_user_model, settings):
+    # arrange
+    settings.STRIPE_CUSTOMER_LOCK_WAIT = 0
+    view = post(StripePaymentIntentView)
+    view.request.user = django_user_model.objects.create(
+        username='new', email='new@mail.com', phone='+5511999990999'
+    )
+
+    # act
+    with cache_lock(f"stripe_customers:new:{view.request.user.pk}"), \
+            mock.patch('stripe_customers.models.get_client') as get_client:
+        response = view.post()
+
+    # assert
+    assert response.status_code == 503
+    assert response['Retry-After'] == '1'
+    get_client.return_value.customers.create.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_payment_intent_stripe_errors_are_answered_with_a_502(django_user_model):
+    # arrange
+    view = post(StripePaymentIntentView)
+    view.request.user = django_user_model.objects.create(
+        username='new', email='new@mail.com', phone='+5511999990999'
+    )
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.side_effect = stripe.APIConnectionError("down")
+        response = view.post()
+
+    # assert
+    assert response.status_code == 502
+    assert json.loads(response.content)['error'] == view.stripe_error_message
+
+
+@pytest.mark.django_db
+def test_one_click_payment_confirms_the_intent_with_the_saved_method(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='buyer', email='buyer@mail.com', phone='+5511999990998')
+    StripeCustomer.objects.create(user=user, customer_id='cus_buyer')
+    view = post(StripePaymentIntentView, {'payment_method': 'pm_saved'})
+    view.request.user = user
+
+    # act
+    with mock.patch('checkouts.views.payment_methods.get_saved_payment_methods', return_value=[{'id': 'pm_saved'}]), \
+            mock.patch.object(view, 'get_stripe_client') as get_client:
+        get_client.return_value.payment_intents.create.return_value = mock.Mock(
+            status='succeeded', client_secret='pi_secret'
+        )
+        response = view.post()
+
+    # assert
+    params = get_client.return_value.payment_intents.create.call_args.args[0]
+    assert params['payment_method'] == 'pm_saved'
+    assert params['confirm'] is True
+    assert params['customer'] == 'cus_buyer'
+    assert json.loads(response.content) == {'status': 'succeeded', 'clientSecret': 'pi_secret', 'requiresAction': False}
+
+
+@pytest.mark.django_db
+def test_only_the_retries_of_an_attempt_reuse_the_payment_intent(admin_user):
+    # arrange
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_admin')
+
+    def idempotency_key(attempt):
+        view = post(StripePaymentIntentView, {'attempt': attempt})
+        view.request.user = admin_user
+        with mock.patch.object(view, 'get_stripe_client') as get_client:
+            view.create_intent()
+        return get_client.return_value.payment_intents.create.call_args.args[1]['idempotency_key']
+
+    # act
+    first, retry, again = [idempotency_key(attempt) for attempt in ('a' * 32, 'a' * 32, 'b' * 32)]
+
+    # assert
+    assert first == retry
+    assert first != again
+
+
+@pytest.mark.django_db
+def test_export_only_takes_the_dataset_filters_from_the_query_string(admin_client, admin_user):
+    # arrange
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_admin')
+
+    # act
+    response = admin_client.get('/checkout/exports/customers/', {
+        'format': 'jsonl', 'account': 'default', 'start': 'x', 'end': 'x', 'name': 'x', 'chunk_size': 'abc',
+    })
+
+    # assert
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert response.status_code == 200
+    assert [row['customer_id'] for row in rows] == ['cus_admin']
+
+
+@pytest.mark.django_db
+def test_customers_export_streams_the_joined_rows_to_staff(admin_client, admin_user):
+    # arrange
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_admin')
+
+    # act
+    response = admin_client.get('/checkout/exports/customers/', {'format': 'jsonl'})
+
+    # assert
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert response['Content-Disposition'] == 'attachment; filename="customers.jsonl"'
+    assert rows == [{
+        'customer_id': 'cus_admin', 'account': 'default', 'username': 'admin', 'email': 'admin@example.com',
+        'first_name': '', 'last_name': '', 'phone': '', 'date_joined': rows[0]['date_joined'],
+        'line1': None, 'line2': None, 'city': None, 'state': None, 'postal_code': None, 'country': None,
+    }]
+
+
+@pytest.mark.django_db
+def test_checkout_posts_over_the_limit_get_429_without_calling_stripe():
+    # arrange
+    from django.core.cache import cache
+
+    from utils.rate_limit import rejections
+
+    cache.clear()
+    view = CheckoutSessionView.as_view(rate_limits={'ip': (2, 60)})
+
+    def request():
+        request = RequestFactory().post('/', REMOTE_ADDR='203.0.113.7')
+        request.user = AnonymousUser()
+        request.stripe_account = 'default'
+        return request
+
+    # act
+    with mock.patch.object(CheckoutSessionView, 'get_stripe_client') as get_client:
+        get_client.return_value.checkout.sessions.create.return_value = mock.Mock(url='https://stripe', client_secret='cs_secret')
+        responses = [view(request()) for _ in range(3)]
+
+    # assert
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert int(responses[2]['Retry-After']) > 0
+    assert get_client.return_value.checkout.sessions.create.call_count == 2
+    assert rejections(['CheckoutSessionView']) == {'CheckoutSessionView': 1}
+
+
+@pytest.mark.django_db
+def test_webhooks_invalidate_the_cached_object():
+    # arrange
+    from utils.stripe_cache import cached_retrieve
+    from utils.stripe_sdk import stripe
+
+    fetch = mock.Mock(side_effect=[{'id': 'cus_1', 'email': 'old@test.com'}, {'id': 'cus_1', 'email': 'new@test.com'}])
+    cached_retrieve('customer', 'cus_1', fetch)
+    event = stripe.Event.construct_from({
+        'id': 'evt_1',
+        'type': 'customer.updated',
+        'data': {'object': {'id': 'cus_1', 'object': 'customer', 'email': 'new@test.com'}},
+    }, None)
+
+    # act
+    StripeWebHookView().handle_event(event)
+    customer = cached_retrieve('customer', 'cus_1', fetch)
+
+    # assert
+    assert customer['email'] == 'new@test.com'
@@ -0,0 +1,65 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from checkouts.models import WebhookEvent
+from utils.stripe_sdk import stripe
+
+
+def make_event(n: int, days_ago: int = 0, event_type: str = 'customer.created') -> tuple:
+    created = int((timezone.now() - timedelta(days=days_ago)).timestamp())
+    payload = json.dumps({
+        'id': f'evt_{n}', 'object': 'event', 'type': event_type, 'created': created,
+        'data': {'object': {'id': f'cus_{n}', 'object': 'customer', 'email': f'user{n}@mail.com'}},
+    }).encode()
+    return stripe.Event.construct_from(json.loads(payload), None), payload
+
+
+@pytest.mark.django_db
+def test_archive_stores_the_payload_compressed_once():
+    # arrange
+    event, payload = make_event(1)
+
+    # act
+    first = WebhookEvent.objects.archive(event, payload)
+    retry = WebhookEvent.objects.archive(event, payload)
+
+    # assert
+    archived = WebhookEvent.objects.get()
+    assert (first, retry) == (True, False)
+    assert archived.object_id == 'cus_1'
+    assert archived.data == json.loads(payload)
+    assert bytes(archived.payload) != payload
+
+
+@pytest.mark.django_db
+def test_prune_deletes_only_the_days_out_of_the_retention():
+    # arrange
+    for n, days_ago in enumerate([0, 10, 100, 200]):
+        WebhookEvent.objects.archive(*make_event(n, days_ago))
+
+    # act
+    deleted = WebhookEvent.objects.prune(days=90, batch_size=1)
+
+    # assert
+    assert deleted == 2
+    assert sorted(WebhookEvent.objects.values_list('event_id', flat=True)) == ['evt_0', 'evt_1']
+
+
+@pytest.mark.django_db
+def test_replay_calls_the_callbacks_of_the_day_range_in_order():
+    # arrange
+    for n, days_ago in enumerate([5, 1, 2]):
+        WebhookEvent.objects.archive(*make_event(n, days_ago))
+    start = (timezone.now() - timedelta(days=3)).date().isoformat()
+
+    # act
+    with mock.patch('checkouts.views.StripeWebHookView.handle_event') as handle_event:
+        call_command('replay_webhook_events', '--from', start, stdout=mock.Mock())
+
+    # assert
+    assert [call.args[0].id for call in handle_event.call_args_list] == ['evt_2', 'evt_1']
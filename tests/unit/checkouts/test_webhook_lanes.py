@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+from django.urls import reverse
+
+from checkouts.loadtest import sign_payload, synthetic_event
+from checkouts.webhook_lanes import LaneFull, get_lane, lane_for, reset_lanes
+
+
+@pytest.fixture
+def lanes(settings):
+    settings.STRIPE_WEBHOOK_LANES = {'bulk': {'concurrency': 1, 'max_wait': 0.05}}
+    reset_lanes()
+    yield
+    reset_lanes()
+
+
+def test_a_full_lane_doesnt_slow_the_others(lanes):
+    # arrange
+    bulk, critical = get_lane(lane_for('customer.created')), get_lane(lane_for('payment_intent.succeeded'))
+    release = threading.Event()
+
+    def flood():
+        with bulk.slot():
+            release.wait(5)
+
+    flooding = threading.Thread(target=flood)
+    flooding.start()
+    while bulk.status()['running'] == 0:
+        time.sleep(0.01)
+
+    # act
+    with pytest.raises(LaneFull):
+        with bulk.slot():
+            pass
+    with critical.slot():
+        pass
+    release.set()
+    flooding.join()
+
+    # assert
+    assert bulk.status()['rejected'] == 1
+    assert (bulk.status()['processed'], bulk.status()['queued']) == (1, 0)
+    assert critical.status()['processed'] == 1
+    assert critical.status()['wait_ms']['p95'] < 50
+
+
+@pytest.mark.django_db
+def test_webhooks_of_a_full_lane_are_postponed(lanes, client, settings):
+    # arrange
+    def post(event_type, n):
+        payload = synthetic_event(event_type, n)
+        return client.post(
+            reverse('stripe_webhook'), payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, settings.STRIPE_WEBHOOK_SECRET),
+        )
+
+    # act
+    with get_lane('bulk').slot():  # a flood of customer events takes the lane
+        postponed = post('customer.created', 1)
+        succeeded = post('payment_intent.succeeded', 2)
+
+    # assert
+    assert postponed.status_code == 503
+    assert postponed['Retry-After'] == '1'
+    assert succeeded.status_code == 200
+    assert succeeded.json() == {'success': True}
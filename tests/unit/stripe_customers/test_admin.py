@@ -0,0 +1,52 @@
+from unittest import mock
+
+import pytest
+import stripe
+from django.urls import reverse
+
+from stripe_customers.models import StripeCustomer
+
+
+@pytest.mark.django_db
+def test_delete_on_stripe_action_reports_the_failures(admin_client, django_user_model):
+    # arrange
+    customers = [
+        StripeCustomer.objects.create(
+            customer_id=f'cus_{i}',
+            user=django_user_model.objects.create(
+                username=f'user{i}', email=f'user{i}@mail.com', phone=f'+5511999990{i:03d}'
+            ),
+        )
+        for i in range(2)
+    ]
+
+    def delete(customer_id):
+        if customer_id == 'cus_1':
+            raise stripe.APIConnectionError('connection refused')
+        return mock.Mock(deleted=True)
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.delete.side_effect = delete
+        response = admin_client.post(
+            reverse('admin:stripe_customers_stripecustomer_changelist'),
+            {'action': 'delete_on_stripe', '_selected_action': [customer.pk for customer in customers]},
+            follow=True,
+        )
+
+    # assert
+    messages = [str(message) for message in response.context['messages']]
+    assert '1 stripe customers deleted.' in messages
+    assert any('were not deleted: cus_1' in message for message in messages)
+    assert list(StripeCustomer.objects.values_list('customer_id', flat=True)) == ['cus_1']
+
+
+@pytest.mark.django_db
+def test_bulk_delete_without_stripe_is_not_offered(admin_client):
+    # act
+    response = admin_client.get(reverse('admin:stripe_customers_stripecustomer_changelist'))
+
+    # assert
+    actions = [name for name, _label in response.context['action_form'].fields['action'].choices]
+    assert 'delete_on_stripe' in actions
+    assert 'delete_selected' not in actions
@@ -0,0 +1,28 @@
+import pytest
+
+from stripe_customers.models import StripeCustomerEmail
+
+
+@pytest.mark.django_db
+def test_lookup_returns_the_customer_recorded_by_the_webhooks():
+    # arrange
+    StripeCustomerEmail.objects.record_from_stripe({'id': 'cus_old', 'email': 'Guest@Mail.com'})
+    StripeCustomerEmail.objects.record_from_stripe({'id': 'cus_new', 'email': 'guest@mail.com'})
+
+    # act
+    customer_id = StripeCustomerEmail.objects.lookup(' GUEST@mail.com ')
+
+    # assert
+    assert customer_id == 'cus_new'
+
+
+@pytest.mark.django_db
+def test_deleted_customers_are_forgotten():
+    # arrange
+    StripeCustomerEmail.objects.record_from_stripe({'id': 'cus_123', 'email': 'guest@mail.com'})
+
+    # act
+    StripeCustomerEmail.objects.forget_from_stripe({'id': 'cus_123', 'deleted': True})
+
+    # assert
+    assert StripeCustomerEmail.objects.lookup('guest@mail.com') is None
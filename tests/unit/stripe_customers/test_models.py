@@ -0,0 +1,218 @@
+import time
+from unittest import mock
+
+import pytest
+import stripe
+
+from stripe_customers.checks import check_shared_cache
+from stripe_customers.models import StripeCustomer, StripeCustomerEmail
+
+
+@pytest.fixture
+def customers(django_user_model):
+    return [
+        StripeCustomer.objects.create(
+            customer_id=f'cus_{i}',
+            user=django_user_model.objects.create(
+                username=f'user{i}', email=f'user{i}@mail.com', phone=f'+5511999990{i:03d}'
+            ),
+        )
+        for i in range(3)
+    ]
+
+
+@pytest.mark.django_db
+def test_delete_on_stripe_keeps_the_customers_not_deleted_on_stripe(customers):
+    # arrange
+    def delete(customer_id):
+        if customer_id == 'cus_1':
+            raise stripe.APIConnectionError('connection refused')
+        return mock.Mock(deleted=True)
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.delete.side_effect = delete
+        report = StripeCustomer.objects.all().delete_on_stripe(max_workers=2)
+
+    # assert
+    assert sorted(report.deleted) == ['cus_0', 'cus_2']
+    assert list(report.failed) == ['cus_1']
+    assert report.db_deleted == 2
+    assert list(StripeCustomer.objects.values_list('customer_id', flat=True)) == ['cus_1']
+
+
+@pytest.mark.django_db
+def test_queryset_delete_only_deletes_the_rows(customers):
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        deleted = StripeCustomer.objects.filter(customer_id='cus_0').delete()
+
+    # assert
+    assert deleted == (1, {'stripe_customers.StripeCustomer': 1})
+    get_client.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_delete_on_stripe_considers_missing_stripe_customers_deleted(customers):
+    # arrange
+    missing = stripe.InvalidRequestError('No such customer', 'id', code='resource_missing')
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.delete.side_effect = missing
+        report = StripeCustomer.objects.filter(customer_id='cus_0').delete_on_stripe()
+
+    # assert
+    assert report.ok
+    assert not StripeCustomer.objects.filter(customer_id='cus_0').exists()
+
+
+@pytest.mark.django_db
+def test_get_or_create_for_user_creates_the_customer_only_once(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.return_value = mock.Mock(id='cus_new')
+        first = StripeCustomer.objects.get_or_create_for_user(user)
+        second = StripeCustomer.objects.get_or_create_for_user(user)
+
+    # assert
+    assert first.pk == second.pk
+    assert first.customer_id == 'cus_new'
+    get_client.return_value.customers.create.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_get_or_create_for_user_waits_for_the_concurrent_creation(django_user_model):
+    # arrange
+    from django.core.cache import cache
+
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+    lock_key = f'stripe_customers:new:{user.pk}'
+    cache.add(lock_key, 'other checkout', 30)
+
+    def other_checkout_finishes(seconds):
+        StripeCustomer.objects.create(user=user, customer_id='cus_other')
+        cache.delete(lock_key)
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client, \
+            mock.patch('utils.locks.time.sleep', side_effect=other_checkout_finishes):
+        customer = StripeCustomer.objects.get_or_create_for_user(user)
+
+    # assert
+    assert customer.customer_id == 'cus_other'
+    get_client.return_value.customers.create.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_new_share_one_stripe_call_and_one_row(django_user_model):
+    # arrange
+    from concurrent.futures import ThreadPoolExecutor
+
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+
+    def create(params, options):
+        time.sleep(0.2)  # the others wait on the lock meanwhile
+        return mock.Mock(id='cus_new')
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.side_effect = create
+        with ThreadPoolExecutor(4) as executor:
+            customers = list(executor.map(lambda _: StripeCustomer.objects.new(user).pk, range(4)))
+
+    # assert
+    assert len(set(customers)) == 1
+    assert StripeCustomer.objects.filter(user=user).count() == 1
+    get_client.return_value.customers.create.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_new_retries_with_the_same_idempotency_key(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.return_value = mock.Mock(id='cus_new')
+        first = StripeCustomer.objects.new(user)
+        StripeCustomer.objects.filter(pk=first.pk).delete()  # like a crash before saving the row
+        second = StripeCustomer.objects.new(user)
+
+    # assert
+    keys = [call.kwargs['options']['idempotency_key'] for call in get_client.return_value.customers.create.call_args_list]
+    assert keys[0] == keys[1] == str(second.idempotency_key)
+
+
+@pytest.mark.django_db
+def test_new_retried_with_other_params_uses_another_idempotency_key(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.create.return_value = mock.Mock(id='cus_new')
+        first = StripeCustomer.objects.new(user)
+        StripeCustomer.objects.filter(pk=first.pk).delete()  # like a crash before saving the row
+        user.first_name = 'Changed'
+        StripeCustomer.objects.new(user)
+
+    # assert
+    keys = [call.kwargs['options']['idempotency_key'] for call in get_client.return_value.customers.create.call_args_list]
+    assert keys[0] != keys[1]
+
+
+@pytest.mark.django_db
+def test_new_doesnt_reuse_a_replayed_customer_deleted_on_stripe(django_user_model):
+    # arrange
+    user = django_user_model.objects.create(username='new', email='new@mail.com', phone='+5511999990999')
+    replayed = mock.Mock(id='cus_deleted', last_response=mock.Mock(headers={'Idempotent-Replayed': 'true'}))
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        client = get_client.return_value
+        client.customers.create.side_effect = [replayed, mock.Mock(id='cus_new')]
+        client.customers.retrieve.return_value = {'id': 'cus_deleted', 'deleted': True}
+        customer = StripeCustomer.objects.new(user)
+
+    # assert
+    first_key, second_key = [call.kwargs['options']['idempotency_key'] for call in client.customers.create.call_args_list]
+    assert customer.customer_id == 'cus_new'
+    assert first_key != second_key
+
+
+@pytest.mark.django_db
+def test_sync_from_stripe_refreshes_emails_and_removes_deleted_customers(customers):
+    # arrange
+    def retrieve(customer_id):
+        if customer_id == 'cus_1':
+            raise stripe.InvalidRequestError('No such customer', 'id', code='resource_missing')
+        if customer_id == 'cus_2':
+            raise stripe.APIConnectionError('connection refused')
+        return {'id': customer_id, 'email': 'New@Mail.com'}
+
+    # act
+    with mock.patch('stripe_customers.models.get_client') as get_client:
+        get_client.return_value.customers.retrieve.side_effect = retrieve
+        report = StripeCustomer.objects.all().sync_from_stripe(max_workers=2)
+
+    # assert
+    assert report.synced == ['cus_0']
+    assert report.missing == ['cus_1']
+    assert list(report.failed) == ['cus_2']
+    assert StripeCustomerEmail.objects.lookup('new@mail.com') == 'cus_0'
+    assert sorted(StripeCustomer.objects.values_list('customer_id', flat=True)) == ['cus_0', 'cus_2']
+
+
+def test_check_warns_when_the_cache_isnt_shared(settings):
+    # arrange
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    # act
+    warnings = check_shared_cache(None)
+
+    # assert
+    assert [warning.id for warning in warnings] == ['stripe_customers.W001']
@@ -0,0 +1,80 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from stripe_customers import payment_methods
+from utils.stripe_sdk import stripe
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+def card(
+    payment_method_id: str, customer: str | None = 'cus_1', last4: str = '4242', allow_redisplay: str = 'always'
+) -> dict:
+    return {
+        'id': payment_method_id, 'type': 'card', 'customer': customer, 'allow_redisplay': allow_redisplay,
+        'card': {'brand': 'visa', 'last4': last4, 'exp_month': 12, 'exp_year': 2030},
+    }
+
+
+def test_saved_payment_methods_are_listed_once():
+    # arrange
+    with mock.patch('stripe_customers.payment_methods.get_client') as get_client:
+        get_client.return_value.customers.payment_methods.list.return_value = mock.Mock(data=[card('pm_1')])
+
+        # act
+        first = payment_methods.get_saved_payment_methods('cus_1')
+        second = payment_methods.get_saved_payment_methods('cus_1')
+
+    # assert
+    assert first == second == [
+        {'id': 'pm_1', 'type': 'card', 'brand': 'visa', 'last4': '4242', 'exp_month': 12, 'exp_year': 2030}
+    ]
+    get_client.return_value.customers.payment_methods.list.assert_called_once()
+
+
+def test_webhooks_keep_the_cached_methods_up_to_date():
+    # arrange
+    with mock.patch('stripe_customers.payment_methods.get_client') as get_client:
+        get_client.return_value.customers.payment_methods.list.return_value = mock.Mock(data=[card('pm_1')])
+        payment_methods.get_saved_payment_methods('cus_1')
+
+    # act
+    payment_methods.payment_method_attached(card('pm_2', last4='1111'))
+    payment_methods.payment_method_attached(card('pm_1', last4='0005'))
+    payment_methods.payment_method_detached(card('pm_2', customer=None))
+
+    # assert
+    methods = payment_methods.get_saved_payment_methods('cus_1')
+    assert [(method['id'], method['last4']) for method in methods] == [('pm_1', '0005')]
+
+
+def test_only_the_methods_allowed_to_redisplay_are_listed():
+    # arrange
+    listed = [card('pm_1'), card('pm_2', allow_redisplay='limited'), card('pm_3', allow_redisplay='unspecified')]
+    with mock.patch('stripe_customers.payment_methods.get_client') as get_client:
+        get_client.return_value.customers.payment_methods.list.return_value = mock.Mock(data=listed)
+
+        # act
+        methods = payment_methods.get_saved_payment_methods('cus_1')
+        payment_methods.payment_method_attached(card('pm_1', allow_redisplay='unspecified'))
+
+    # assert
+    assert [method['id'] for method in methods] == ['pm_1', 'pm_2']
+    assert [method['id'] for method in payment_methods.get_saved_payment_methods('cus_1')] == ['pm_2']
+
+
+def test_attached_webhook_survives_stripe_errors():
+    # arrange
+    with mock.patch('stripe_customers.payment_methods.get_client') as get_client:
+        get_client.return_value.customers.payment_methods.list.side_effect = stripe.APIConnectionError("down")
+
+        # act
+        payment_methods.payment_method_attached(card('pm_1'))
+
+    # assert
+    assert cache.get('stripe_customers:payment_methods:cus_1') is None
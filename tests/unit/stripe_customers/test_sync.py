@@ -0,0 +1,84 @@
+from unittest import mock
+
+import pytest
+
+from addresses.models import AddressLines
+from stripe_customers.models import StripeCustomer
+from stripe_customers.sync import coalescer
+
+
+@pytest.fixture
+def customer(admin_user, monkeypatch):
+    monkeypatch.setattr(coalescer, 'debounce', 60)
+    coalescer.flush()
+    return StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+
+
+@pytest.mark.django_db
+def test_user_changes_are_merged_in_a_single_modify(customer, django_capture_on_commit_callbacks):
+    # arrange
+    user = customer.user
+
+    # act
+    with django_capture_on_commit_callbacks(execute=True):
+        user.email = 'new@mail.com'
+        user.save()
+        user.first_name = 'New'
+        user.save()
+
+    with mock.patch('stripe_customers.sync.get_client') as get_client:
+        coalescer.flush()
+    update = get_client.return_value.customers.update
+
+    # assert
+    update.assert_called_once_with('cus_123', params={'email': 'new@mail.com', 'name': user.get_full_name()})
+
+
+@pytest.mark.django_db
+def test_noop_saves_do_not_call_stripe(customer, django_capture_on_commit_callbacks):
+    # act
+    with django_capture_on_commit_callbacks(execute=True):
+        customer.user.save()
+
+    with mock.patch('stripe_customers.sync.get_client') as get_client:
+        coalescer.flush()
+    update = get_client.return_value.customers.update
+
+    # assert
+    update.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_address_lines_changes_are_sent_to_the_users_customers(customer, django_capture_on_commit_callbacks):
+    # arrange
+    lines, _ = AddressLines.objects.get_or_create_by_content(
+        'liberdade, 123', country='BR', state='SP', city='itaquera', postal_code='57302675'
+    )
+    customer.user.address = lines
+    customer.user.save()
+    lines = AddressLines.objects.get(pk=lines.pk)
+
+    # act
+    with django_capture_on_commit_callbacks(execute=True):
+        lines.line2 = 'apto 42'
+        lines.save()
+
+    with mock.patch('stripe_customers.sync.get_client') as get_client:
+        coalescer.flush()
+    update = get_client.return_value.customers.update
+
+    # assert
+    update.assert_called_once_with('cus_123', params={'address': lines.full_address_as_dict()})
+
+
+@pytest.mark.django_db
+def test_snapshots_are_read_only_by_the_saves_which_may_change_them(customer, django_assert_num_queries):
+    # arrange
+    user = type(customer.user).objects.get(pk=customer.user.pk)
+
+    # act
+    with django_assert_num_queries(1):  # the update, without reading the snapshot
+        user.save(update_fields=['last_login'])
+
+    # assert
+    assert not hasattr(type(user).objects.get(pk=user.pk), '_stripe_snapshot')
@@ -0,0 +1,158 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.views.generic import View
+
+from stripe_customers.models import StripeCustomer
+from subscriptions.entitlements import (
+    EntitlementRequiredMixin, entitlement_required, get_user_entitlements, has_entitlements,
+)
+from subscriptions.models import Subscription
+
+
+def make_subscription(status='active'):
+    return {
+        'id': 'sub_123',
+        'customer': 'cus_123',
+        'status': status,
+        'cancel_at_period_end': False,
+        'current_period_end': 1735689600,
+        'items': {
+            'data': [
+                {'price': {'id': 'price_123', 'lookup_key': 'pro_monthly', 'product': 'prod_123'}},
+            ]
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_sync_from_stripe_grants_the_subscription_entitlements(admin_user):
+    # arrange
+    cache.clear()
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+
+    # act
+    subscription = Subscription.objects.sync_from_stripe(make_subscription())
+
+    # assert
+    assert subscription.user == admin_user
+    assert get_user_entitlements(admin_user) == {'pro_monthly', 'prod_123'}
+    assert has_entitlements(admin_user, ['pro_monthly'])
+
+
+@pytest.mark.django_db
+def test_subscription_update_invalidates_the_cached_entitlements(admin_user):
+    # arrange
+    cache.clear()
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+    Subscription.objects.sync_from_stripe(make_subscription())
+    assert has_entitlements(admin_user, ['prod_123'])
+
+    # act
+    Subscription.objects.sync_from_stripe(make_subscription(status='canceled'))
+
+    # assert
+    assert get_user_entitlements(admin_user) == frozenset()
+
+
+@pytest.mark.django_db
+def test_sync_from_stripe_ignores_the_events_older_than_the_stored_state(admin_user):
+    # arrange
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+    Subscription.objects.sync_from_stripe(make_subscription(status='canceled'), event_created=2000)
+
+    # act
+    subscription = Subscription.objects.sync_from_stripe(make_subscription(), event_created=1000)
+
+    # assert
+    assert subscription.status == 'canceled'
+    assert Subscription.objects.get().status == 'canceled'
+
+
+@pytest.mark.django_db
+def test_paid_invoice_of_a_canceled_subscription_doesnt_activate_it(admin_user):
+    # arrange
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+    invoice = {'id': 'in_123', 'subscription': 'sub_123', 'status': 'paid', 'paid': True}
+
+    # act
+    with mock.patch('subscriptions.models.get_client') as get_client:
+        get_client.return_value.subscriptions.retrieve.return_value = make_subscription(status='canceled')
+        subscription = Subscription.objects.sync_from_invoice(invoice)
+
+    # assert
+    assert subscription.status == 'canceled'
+    assert not has_entitlements(admin_user, ['pro_monthly'])
+
+
+@pytest.mark.django_db
+def test_subscription_synced_before_the_customer_is_linked_to_the_user(admin_user):
+    # arrange
+    Subscription.objects.sync_from_stripe(make_subscription())
+    assert get_user_entitlements(admin_user) == frozenset()
+
+    # act
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+
+    # assert
+    assert Subscription.objects.get().user == admin_user
+    assert has_entitlements(admin_user, ['pro_monthly'])
+
+
+@pytest.fixture
+def entitled_user(admin_user):
+    StripeCustomer.objects.create(user=admin_user, customer_id='cus_123')
+    Subscription.objects.sync_from_stripe(make_subscription())
+    return admin_user
+
+
+def request_of(user):
+    request = RequestFactory().get('/premium/')
+    request.user = user
+    return request
+
+
+@pytest.mark.django_db
+def test_entitlement_required_decorator(entitled_user):
+    # arrange
+    @entitlement_required('pro_monthly')
+    def pro_view(request):
+        return HttpResponse('pro')
+
+    @entitlement_required('enterprise')
+    def enterprise_view(request):
+        return HttpResponse('enterprise')
+
+    # act
+    allowed = pro_view(request_of(entitled_user))
+    anonymous = pro_view(request_of(AnonymousUser()))
+
+    # assert
+    assert allowed.status_code == 200
+    assert anonymous.status_code == 302
+    with pytest.raises(PermissionDenied):
+        enterprise_view(request_of(entitled_user))
+
+
+@pytest.mark.django_db
+def test_entitlement_required_mixin(entitled_user):
+    # arrange
+    class PremiumView(EntitlementRequiredMixin, View):
+        required_entitlements = ['prod_123']
+        raise_exception = True
+
+        def get(self, request):
+            return HttpResponse('premium')
+
+    # act
+    allowed = PremiumView.as_view()(request_of(entitled_user))
+
+    # assert
+    assert allowed.status_code == 200
+    with pytest.raises(PermissionDenied):
+        PremiumView.as_view(required_entitlements=['enterprise'])(request_of(entitled_user))
@@ -0,0 +1,35 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from utils.admin import EstimatedCountPaginator
+
+
+@pytest.mark.django_db
+def test_paginator_uses_the_estimate_of_big_unfiltered_tables(settings):
+    # arrange
+    settings.ADMIN_ESTIMATED_COUNT_THRESHOLD = 100
+    paginator = EstimatedCountPaginator(get_user_model().objects.order_by('pk'), 50)
+
+    # act
+    with mock.patch.object(EstimatedCountPaginator, 'estimated_count', return_value=5000):
+        count = paginator.count
+
+    # assert
+    assert count == 5000
+    assert paginator.num_pages == 100
+
+
+@pytest.mark.django_db
+def test_paginator_counts_the_filtered_querysets():
+    # arrange
+    get_user_model().objects.create(username='a', email='a@mail.com', phone='+5511999990001')
+    paginator = EstimatedCountPaginator(get_user_model().objects.filter(username='a').order_by('pk'), 50)
+
+    # act
+    estimate = paginator.estimated_count()
+
+    # assert
+    assert estimate is None
+    assert paginator.count == 1
@@ -0,0 +1,75 @@
+from unittest import mock
+
+import pytest
+import stripe
+from django.core.cache import cache
+
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def breaker():
+    cache.clear()
+    return CircuitBreaker('test', failure_threshold=2, slow_call_threshold=None, reset_timeout=30)
+
+
+def fail():
+    raise stripe.APIConnectionError('connection refused')
+
+
+def test_breaker_opens_after_the_failure_threshold(breaker):
+    # act
+    for _ in range(2):
+        with pytest.raises(stripe.APIConnectionError):
+            breaker.call(fail)
+
+    # assert
+    assert breaker.state() == breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: 'not called')
+
+
+def test_client_errors_do_not_open_the_breaker(breaker):
+    # arrange
+    def decline():
+        raise stripe.CardError('declined', 'card', 'card_declined')
+
+    # act
+    for _ in range(3):
+        with pytest.raises(stripe.CardError):
+            breaker.call(decline)
+
+    # assert
+    assert breaker.state() == breaker.CLOSED
+
+
+def test_half_open_breaker_allows_a_single_probe_and_closes_on_success(breaker):
+    # arrange
+    breaker.open()
+
+    # act
+    with mock.patch('utils.circuit_breaker.time.time', return_value=cache.get('circuit_breaker:test:opened_at') + 31):
+        assert breaker.state() == breaker.HALF_OPEN
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+        breaker.record_success()
+
+    # assert
+    assert breaker.state() == breaker.CLOSED
+
+
+def test_failures_of_the_calls_in_flight_dont_keep_the_breaker_open(breaker):
+    # arrange
+    breaker.open()
+    opened_at = cache.get('circuit_breaker:test:opened_at')
+
+    # act
+    with mock.patch('utils.circuit_breaker.time.time', return_value=opened_at + 10):
+        breaker.record_failure()  # a call started before the breaker opened
+    with mock.patch('utils.circuit_breaker.time.time', return_value=opened_at + 31):
+        probe_allowed = breaker.allow_request()
+        breaker.record_failure()  # the probe failed
+
+    # assert
+    assert probe_allowed
+    assert cache.get('circuit_breaker:test:opened_at') == opened_at + 31
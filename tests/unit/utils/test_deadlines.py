@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from utils.deadlines import DeadlineExceeded, deadline, hedged_call
+from utils.stripe_http import DeadlineRequestsClient, shared_session
+
+
+def test_client_timeout_is_limited_by_the_request_deadline():
+    # arrange
+    client = DeadlineRequestsClient(timeout=80)
+
+    # act
+    with deadline(5):
+        timeout = client._timeout
+
+    # assert
+    assert 4 < timeout <= 5
+    assert client._timeout == 80
+
+
+def test_client_skips_the_call_when_the_deadline_has_no_time_left():
+    # arrange
+    client = DeadlineRequestsClient(timeout=80)
+
+    # act / assert
+    with deadline(0.1), mock.patch.object(client, '_request_internal') as request:
+        with pytest.raises(DeadlineExceeded):
+            client.request('get', 'https://api.stripe.com/v1/customers', {})
+    request.assert_not_called()
+
+
+def test_client_threads_share_the_warmed_up_session():
+    # arrange
+    session = shared_session()
+    client = DeadlineRequestsClient(session=session)
+    response = mock.Mock(content=b'{}', status_code=200, headers={})
+
+    # act
+    with mock.patch.object(session, 'request', return_value=response) as request:
+        client.request('get', 'https://api.stripe.com', {})
+        thread = threading.Thread(target=client.request, args=('get', 'https://api.stripe.com', {}))
+        thread.start()
+        thread.join()
+
+    # assert
+    assert request.call_count == 2
+
+
+def test_nested_deadline_never_extends_the_current_one():
+    with deadline(1):
+        with deadline(10):
+            assert DeadlineRequestsClient(timeout=80)._timeout <= 1
+
+
+def test_hedged_call_returns_the_fastest_result():
+    # arrange
+    calls = []
+
+    def read():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+
+    # act
+    result = hedged_call(read, hedge_after=0.05)
+
+    # assert
+    assert result == 'fast'
+    assert len(calls) == 2
+
+
+def test_concurrent_first_hedged_calls_share_one_executor(monkeypatch):
+    # arrange
+    from concurrent.futures import ThreadPoolExecutor as Executor
+
+    from utils import deadlines
+
+    monkeypatch.setattr(deadlines, '_hedge_executor', None)
+    start = threading.Barrier(8)
+
+    def first_call(_):
+        start.wait()
+        return deadlines._get_hedge_executor()
+
+    # act
+    with Executor(8) as callers:
+        executors = set(callers.map(first_call, range(8)))
+
+    # assert
+    assert len(executors) == 1
+    executors.pop().shutdown()
@@ -0,0 +1,23 @@
+import gzip
+import json
+
+from utils.exports import CSV, JSONL, stream_rows
+
+
+def test_rows_stream_as_csv_and_gzipped_jsonl():
+    # arrange
+    rows = [{'id': i, 'metadata': {'order': i}, 'email': f'user{i}@mail.com'} for i in range(3000)]
+    fields = ['id', 'metadata', 'email']
+
+    # act
+    csv_chunks = list(stream_rows(iter(rows), fields, CSV))
+    jsonl = b''.join(stream_rows(iter(rows), fields, JSONL, compress=True))
+
+    # assert
+    csv_lines = b''.join(csv_chunks).decode().splitlines()
+    assert len(csv_chunks) > 1
+    assert csv_lines[0] == 'id,metadata,email'
+    assert csv_lines[1] == '0,"{""order"": 0}",user0@mail.com'
+    lines = gzip.decompress(jsonl).decode().splitlines()
+    assert len(lines) == 3000
+    assert json.loads(lines[-1]) == {'id': 2999, 'metadata': {'order': 2999}, 'email': 'user2999@mail.com'}
@@ -0,0 +1,42 @@
+from unittest import mock
+
+from utils.rate_limit import TokenBucket
+
+
+def test_token_bucket_allows_the_burst_then_the_rate():
+    # arrange
+    now = [100.0]
+    with mock.patch('utils.rate_limit.time.monotonic', side_effect=lambda: now[0]):
+        bucket = TokenBucket(rate=2, burst=2)
+
+        # act
+        burst = [bucket.try_acquire() for _ in range(3)]
+        now[0] += 0.5
+        after_refill = bucket.try_acquire()
+
+    # assert
+    assert burst[:2] == [0.0, 0.0]
+    assert burst[2] == 0.5
+    assert after_refill == 0.0
+
+
+def test_sliding_window_counts_the_previous_window_weighted():
+    # arrange
+    from django.core.cache import cache
+
+    from utils.rate_limit import SlidingWindowLimiter
+
+    cache.clear()
+    limiter = SlidingWindowLimiter(limit=4, window=60)
+
+    # act
+    with mock.patch('utils.rate_limit.time.time', return_value=6000 + 50):  # end of a window
+        first_window = [limiter.hit('client') for _ in range(5)]
+    with mock.patch('utils.rate_limit.time.time', return_value=6060 + 30):  # half of the next
+        half_next = [limiter.hit('client') for _ in range(3)]
+
+    # assert
+    assert first_window == [0, 0, 0, 0, 10]
+    # 4 * 0.5 of the previous window leave room to 2 more hits
+    assert half_next[:2] == [0, 0]
+    assert half_next[2] > 0
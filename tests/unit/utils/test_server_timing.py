@@ -0,0 +1,41 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from utils.server_timing import STRIPE, ServerTimingMiddleware, timed
+
+
+@pytest.mark.django_db
+def test_middleware_sends_the_time_by_category():
+    # arrange
+    def view(request):
+        get_user_model().objects.count()
+        with timed(STRIPE):
+            pass
+        with timed(STRIPE):
+            pass
+        return HttpResponse()
+
+    # act
+    response = ServerTimingMiddleware(view)(RequestFactory().get('/'))
+
+    # assert
+    metrics = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+    assert set(metrics) == {'stripe', 'db', 'total'}
+    assert 'desc="Stripe API (2)"' in metrics['stripe']
+    assert 'desc="Database (1)"' in metrics['db']
+
+
+def test_middleware_logs_the_sampled_requests(settings):
+    # arrange
+    settings.SERVER_TIMING_LOG_SAMPLE_RATE = 1
+
+    # act
+    with mock.patch('utils.server_timing.logger') as logger:
+        ServerTimingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/checkout/'))
+
+    # assert
+    assert 'GET /checkout/ (200)' in logger.info.call_args.args[0]
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from utils.stripe_cache import StripeReadCache
+
+
+def test_concurrent_misses_make_a_single_call():
+    # arrange
+    read_cache = StripeReadCache()
+    release = threading.Event()
+    fetch = mock.Mock(side_effect=lambda: release.wait(5) and {'id': 'cs_1', 'status': 'complete'})
+
+    # act
+    with ThreadPoolExecutor(8) as executor:
+        futures = [
+            executor.submit(read_cache.get, 'checkout.session', 'cs_1', fetch, account='default')
+            for _ in range(8)
+        ]
+        while read_cache.stats['coalesced'] < 7:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    # assert
+    assert fetch.call_count == 1
+    assert all(result == {'id': 'cs_1', 'status': 'complete'} for result in results)
+
+
+def test_the_other_processes_read_the_shared_tier():
+    # arrange
+    fetch = mock.Mock(return_value={'id': 'cus_1'})
+    StripeReadCache().get('customer', 'cus_1', fetch, account='default')
+    other_process = StripeReadCache()
+
+    # act
+    customer = other_process.get('customer', 'cus_1', fetch, account='default')
+
+    # assert
+    assert customer == {'id': 'cus_1'}
+    assert fetch.call_count == 1
+    assert other_process.stats['l2'] == 1
+
+
+def test_the_params_are_cached_apart_and_invalidated_together():
+    # arrange
+    read_cache = StripeReadCache()
+    fetch = mock.Mock(side_effect=[{'v': 1}, {'v': 1, 'customer': {}}, {'v': 2}, {'v': 2, 'customer': {}}])
+    read_cache.get('payment_intent', 'pi_1', fetch, account='default')
+    read_cache.get('payment_intent', 'pi_1', fetch, {'expand': ['customer']}, account='default')
+
+    # act
+    read_cache.invalidate('pi_1', account='default')
+    plain = read_cache.get('payment_intent', 'pi_1', fetch, account='default')
+    expanded = read_cache.get('payment_intent', 'pi_1', fetch, {'expand': ['customer']}, account='default')
+
+    # assert
+    assert plain == {'v': 2}
+    assert expanded == {'v': 2, 'customer': {}}
+    assert fetch.call_count == 4
+
+
+def test_a_retrieve_racing_the_invalidation_isnt_cached():
+    # arrange
+    read_cache = StripeReadCache()
+
+    def fetch():
+        read_cache.invalidate('cs_1', account='default')  # the webhook arrives meanwhile
+        return {'status': 'open'}
+
+    # act
+    read_cache.get('checkout.session', 'cs_1', fetch, account='default')
+    refetch = mock.Mock(return_value={'status': 'complete'})
+    session = read_cache.get('checkout.session', 'cs_1', refetch, account='default')
+
+    # assert
+    assert session == {'status': 'complete'}
+    refetch.assert_called_once()
+
+
+def test_the_errors_are_raised_to_all_and_not_cached():
+    # arrange
+    read_cache = StripeReadCache()
+    fetch = mock.Mock(side_effect=[ValueError('stripe is down'), {'id': 'cus_1'}])
+
+    # act
+    with pytest.raises(ValueError):
+        read_cache.get('customer', 'cus_1', fetch, account='default')
+    customer = read_cache.get('customer', 'cus_1', fetch, account='default')
+
+    # assert
+    assert customer == {'id': 'cus_1'}
@@ -0,0 +1,54 @@
+from unittest import mock
+
+import pytest
+
+from utils.stripe_cassettes import RECORD, REPLAY, CassetteError, CassetteHTTPClient
+
+
+def test_recorded_calls_are_replayed_in_order(tmp_path):
+    # arrange
+    inner = mock.Mock()
+    inner.request.side_effect = [
+        (b'{"id": "cus_1"}', 200, {'Request-Id': 'req_1', 'Set-Cookie': 'x'}),
+        (b'{"id": "cus_2"}', 200, {'Request-Id': 'req_2'}),
+    ]
+    recorder = CassetteHTTPClient(tmp_path / 'cassette.json', RECORD, inner=inner)
+    url = 'https://api.stripe.com/v1/customers'
+    recorder.request('post', url, {}, 'email=a%40mail.com')
+    recorder.request('post', url, {}, 'email=b%40mail.com')
+    recorder.save()
+
+    # act
+    player = CassetteHTTPClient(tmp_path / 'cassette.json', REPLAY)
+    responses = [player.request('post', url, {}, body) for body in ('email=a%40mail.com', 'email=b%40mail.com')]
+
+    # assert
+    assert [body for body, _, _ in responses] == ['{"id": "cus_1"}', '{"id": "cus_2"}']
+    assert responses[0][2] == {'request-id': 'req_1'}
+    assert player.unplayed() == []
+    with pytest.raises(CassetteError):
+        player.request('post', url, {}, 'email=a%40mail.com')
+
+
+def test_replay_matches_the_request_body(tmp_path):
+    # arrange
+    inner = mock.Mock()
+    inner.request.side_effect = [
+        (b'{"id": "cus_1"}', 200, {}),
+        (b'{"id": "cus_2"}', 200, {}),
+    ]
+    recorder = CassetteHTTPClient(tmp_path / 'cassette.json', RECORD, inner=inner)
+    url = 'https://api.stripe.com/v1/customers'
+    recorder.request('post', url, {}, 'email=a%40mail.com&name=A')
+    recorder.request('post', url, {}, 'email=b%40mail.com&name=B')
+    recorder.save()
+    player = CassetteHTTPClient(tmp_path / 'cassette.json', REPLAY)
+
+    # act
+    stream, status, _ = player.request_stream('post', url, {}, 'name=B&email=b%40mail.com')
+
+    # assert
+    assert (stream.read(), status) == (b'{"id": "cus_2"}', 200)
+    assert player.unplayed() == ['POST /v1/customers']
+    with pytest.raises(CassetteError):
+        player.request('post', url, {}, 'email=c%40mail.com&name=C')
@@ -0,0 +1,28 @@
+from django.test import RequestFactory, override_settings
+
+from utils.stripe_clients import get_client, resolve_account
+
+ACCOUNTS = {
+    'default': {'secret_key': 'sk_test_default', 'public_key': 'pk_test_default', 'webhook_secret': 'whsec_default'},
+    'eu': {'secret_key': 'sk_test_eu', 'public_key': 'pk_test_eu', 'webhook_secret': 'whsec_eu'},
+}
+
+
+@override_settings(
+    STRIPE_ACCOUNTS=ACCOUNTS, STRIPE_ACCOUNT_HOSTS={'eu.example.com': 'eu'}, ALLOWED_HOSTS=['.example.com']
+)
+def test_account_is_resolved_by_the_request_host():
+    factory = RequestFactory()
+    assert resolve_account(factory.get('/', HTTP_HOST='eu.example.com')) == 'eu'
+    assert resolve_account(factory.get('/', HTTP_HOST='example.com')) == 'default'
+
+
+@override_settings(STRIPE_ACCOUNTS=ACCOUNTS)
+def test_each_account_has_its_own_client_built_once():
+    # act
+    eu = get_client('eu')
+
+    # assert
+    assert eu is get_client('eu')
+    assert eu is not get_client('default')
+    assert eu._requestor.api_key == 'sk_test_eu'
@@ -0,0 +1,75 @@
+import pickle
+
+import pytest
+
+from checkouts.status import is_final, status_message
+from utils import stripe_snapshots
+from utils.stripe_sdk import stripe
+from utils.stripe_snapshots import CheckoutSessionSnapshot, PaymentIntentSnapshot, snapshot
+
+
+def payment_intent() -> "stripe.PaymentIntent":
+    return stripe.PaymentIntent.construct_from({
+        'id': 'pi_1',
+        'object': 'payment_intent',
+        'status': 'processing',
+        'amount': 15000,
+        'amount_received': 0,
+        'currency': 'brl',
+        'capture_method': 'automatic',
+        'created': 1760832000,
+        'customer': {'id': 'cus_1', 'object': 'customer', 'email': 'customer@test.com', 'metadata': {}},
+        'metadata': {'order': '42'},
+        'payment_method_types': ['card', 'boleto'],
+    }, 'sk_test_x')
+
+
+def test_snapshot_keeps_the_used_fields_of_the_expanded_objects():
+    # act
+    snap = snapshot(payment_intent())
+
+    # assert
+    assert isinstance(snap, PaymentIntentSnapshot)
+    assert (snap.id, snap.status, snap.amount, snap.currency) == ('pi_1', 'processing', 15000, 'brl')
+    assert (snap.customer_id, snap.customer_email) == ('cus_1', 'customer@test.com')
+
+
+def test_snapshots_serialize_compactly():
+    # arrange
+    intent = payment_intent()
+    snap = snapshot(intent)
+
+    # act
+    dumped = stripe_snapshots.dumps(snap)
+    pickled = pickle.dumps(snap)
+
+    # assert
+    assert stripe_snapshots.loads(dumped) == snap
+    assert pickle.loads(pickled) == snap
+    # real intents have many more fields, the snapshot stays the same size
+    assert len(pickled) < len(pickle.dumps(intent)) / 3
+
+
+def test_snapshots_are_read_like_the_stripe_objects():
+    # arrange
+    snap = CheckoutSessionSnapshot.from_stripe({
+        'id': 'cs_1', 'object': 'checkout.session', 'status': 'complete', 'payment_status': 'unpaid',
+        'amount_total': 1000, 'currency': 'usd', 'customer': None, 'customer_email': None,
+        'payment_intent': {'id': 'pi_1', 'object': 'payment_intent'},
+    })
+
+    # act
+    message = status_message(snap)
+
+    # assert
+    assert snap.payment_intent_id == 'pi_1'
+    assert not is_final(snap)
+    assert message == {
+        'object': 'checkout.session', 'id': 'cs_1', 'status': 'complete', 'payment_status': 'unpaid', 'final': False,
+    }
+
+
+def test_snapshot_of_unknown_types_fails():
+    # act / assert
+    with pytest.raises(ValueError):
+        snapshot({'id': 'ch_1', 'object': 'charge'})
@@ -1,12 +1,17 @@
 from django.contrib import admin
+
+from utils.admin import LargeTableAdminMixin
+
 from .models import CustomUser
 
 
 @admin.register(CustomUser)
-class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ("username", "email", "first_name", "last_name", "is_staff")
+class CustomUserAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ("username", "email", "first_name", "last_name", "address", "is_staff")
     list_filter = ("is_staff", "is_superuser", "is_active", "groups")
-    search_fields = ("username", "first_name", "last_name", "email")
+    list_select_related = ("address",)
+    search_fields = ("^username", "^email", "^first_name", "^last_name")
+    raw_id_fields = ("address",)
     ordering = ("username",)
     filter_horizontal = (
         "groups",
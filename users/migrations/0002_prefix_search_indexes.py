@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from utils.prefix_indexes import add_prefix_indexes
+
+INDEXES = {
+    'users_username_prefix_idx': ('users_customuser', 'username'),
+    'users_email_prefix_idx': ('users_customuser', 'email'),
+}
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        add_prefix_indexes(INDEXES),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from utils.prefix_indexes import add_prefix_indexes
+
+INDEXES = {
+    'users_first_name_prefix_idx': ('users_customuser', 'first_name'),
+    'users_last_name_prefix_idx': ('users_customuser', 'last_name'),
+}
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently, which can't run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_prefix_search_indexes'),
+    ]
+
+    operations = [
+        add_prefix_indexes(INDEXES),
+    ]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator which, on postgres, takes the row count of the unfiltered changelists from the
+    table statistics instead of a `COUNT(*)` scanning the whole table.
+
+    The estimate is only used above `ADMIN_ESTIMATED_COUNT_THRESHOLD` rows (10000 by default),
+    where the small error doesn't matter. Filtered querysets and other databases are counted.
+    """
+    @cached_property
+    def count(self) -> int:
+        estimate = self.estimated_count()
+        if estimate is not None and estimate > getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000):
+            return estimate
+        return super().count
+
+    def estimated_count(self) -> int | None:
+        queryset = getattr(self.object_list, 'query', None)
+        if queryset is None or queryset.where or queryset.distinct:
+            return None
+
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 when the table was never analyzed
+        return int(row[0]) if row and row[0] >= 0 else None
+
+
+class LargeTableAdminMixin:
+    """ModelAdmin options to the changelists of tables with millions of rows: estimated
+    pagination count and no second count of the whole table when filtering"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
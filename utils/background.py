@@ -0,0 +1,41 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger("djangoStripe")
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """return the process wide thread pool used to run the work kept off the request path"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_MAX_WORKERS', 4),
+                    thread_name_prefix='django-simple-stripe',
+                )
+    return _executor
+
+
+def _run(func: Callable, *args, **kwargs) -> Any:
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"background task {func.__qualname__} failed")
+        raise
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func: Callable, *args, **kwargs) -> Future:
+    """run the function in the background thread pool, logging if it fails. The database
+    connections opened by the task are closed when it finishes."""
+    return get_executor().submit(_run, func, *args, **kwargs)
@@ -0,0 +1,193 @@
+import logging
+import time
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .deadlines import DeadlineExceeded
+from .stripe_sdk import stripe
+
+logger = logging.getLogger("djangoStripe")
+
+DEFAULT_OPTIONS = {
+    'failure_threshold': 5,
+    'slow_call_threshold': 10.0,
+    'window': 60,
+    'reset_timeout': 30,
+}
+
+
+class CircuitOpenError(Exception):
+    """raised when the call is refused because the circuit breaker is open"""
+    def __init__(self, breaker: "CircuitBreaker"):
+        self.breaker = breaker
+        super().__init__(f"the circuit breaker {breaker.name} is open")
+
+
+class CircuitBreaker:
+    """Circuit breaker with the state stored in the django cache, so it is shared between
+    all the workers using the same cache backend.
+
+    The breaker opens when `failure_threshold` failures happen within `window` seconds.
+    Calls slower than `slow_call_threshold` seconds are counted as failures. While open the
+    calls fail fast with `CircuitOpenError`, and after `reset_timeout` seconds a single call
+    is let through (half-open) as a probe: if it succeeds the breaker closes, otherwise it
+    stays open for another `reset_timeout`.
+
+    Args:
+        name (str): the operation name, used in the cache keys.
+        failure_threshold (int): failures in the window needed to open the breaker.
+        slow_call_threshold (float, optional): duration in seconds from which a successful
+            call counts as a failure. None disables the latency check.
+        window (int): seconds in which the failures are counted.
+        reset_timeout (int): seconds to wait before probing an open breaker.
+        failure_exceptions (tuple[type[Exception]], optional): the exceptions counted as failures.
+            Defaults to the stripe connection, API and rate limit errors. Client errors, like a
+            declined card, doesn't mean stripe is degraded.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_OPTIONS['failure_threshold'],
+        slow_call_threshold: float | None = DEFAULT_OPTIONS['slow_call_threshold'],
+        window: int = DEFAULT_OPTIONS['window'],
+        reset_timeout: int = DEFAULT_OPTIONS['reset_timeout'],
+        failure_exceptions: tuple[type[Exception], ...] | None = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+
+    def _key(self, suffix: str) -> str:
+        return f"circuit_breaker:{self.name}:{suffix}"
+
+    def _opened_at(self) -> float | None:
+        return cache.get(self._key('opened_at'))
+
+    def state(self) -> str:
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return self.CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_after(self) -> int:
+        """seconds until the next probe of an open breaker"""
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return 0
+        return max(0, int(opened_at + self.reset_timeout - time.time()) + 1)
+
+    def allow_request(self) -> bool:
+        """return if the call can be made. Only one call, across all the workers, is allowed
+        while the breaker is half-open."""
+        state = self.state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        return cache.add(self._key('probe'), True, self.reset_timeout)
+
+    def open(self) -> None:
+        cache.set(self._key('opened_at'), time.time(), None)
+        cache.delete(self._key('probe'))
+        logger.warning(f"circuit breaker {self.name} opened")
+
+    def close(self) -> None:
+        cache.delete_many([self._key('opened_at'), self._key('probe'), self._key('failures')])
+        logger.info(f"circuit breaker {self.name} closed")
+
+    def record_success(self, duration: float = 0.0) -> None:
+        if self.slow_call_threshold is not None and duration >= self.slow_call_threshold:
+            logger.warning(f"slow call on {self.name}: {duration:.2f}s")
+            self.record_failure()
+        elif self.state() == self.HALF_OPEN:  # the probe succeeded
+            self.close()
+
+    def record_failure(self) -> None:
+        state = self.state()
+        if state == self.OPEN:
+            # a call started before the breaker opened, reopening would push the probe away
+            return
+        if state == self.HALF_OPEN:  # the probe failed
+            self.open()
+            return
+
+        key = self._key('failures')
+        cache.add(key, 0, self.window)
+        try:
+            failures = cache.incr(key)
+        except ValueError:  # expired between the add and the incr
+            cache.set(key, 1, self.window)
+            failures = 1
+
+        if failures >= self.failure_threshold:
+            self.open()
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """call the function through the breaker.
+
+        Raises:
+            CircuitOpenError: if the breaker is open.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(self)
+
+        start = time.monotonic()
+        failure_exceptions = self.failure_exceptions or (
+            stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError
+        )
+        try:
+            result = func(*args, **kwargs)
+        except failure_exceptions:
+            self.record_failure()
+            raise
+        except DeadlineExceeded:
+            # skipped by the request budget, it says nothing about stripe
+            cache.delete(self._key('probe'))
+            raise
+        except Exception:
+            # client errors prove stripe is responding
+            self.record_success(time.monotonic() - start)
+            raise
+
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def status(self) -> dict[str, Any]:
+        """return the breaker state to monitoring"""
+        return {
+            'name': self.name,
+            'state': self.state(),
+            'failures': cache.get(self._key('failures'), 0),
+            'retry_after': self.retry_after(),
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """return the circuit breaker of the operation, configured by the `STRIPE_CIRCUIT_BREAKERS`
+    setting: a dict of options by operation name, where the `default` key applies to all."""
+    if name not in _breakers:
+        config = getattr(settings, 'STRIPE_CIRCUIT_BREAKERS', {})
+        options = {**DEFAULT_OPTIONS, **config.get('default', {}), **config.get(name, {})}
+        _breakers[name] = CircuitBreaker(name, **options)
+    return _breakers[name]
+
+
+def breakers_status() -> list[dict[str, Any]]:
+    """return the status of the configured breakers and the ones used by this process"""
+    names = set(getattr(settings, 'STRIPE_CIRCUIT_BREAKERS', {})) - {'default'}
+    names.update(_breakers)
+    return [get_breaker(name).status() for name in sorted(names)]
@@ -0,0 +1,135 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator
+
+from django.conf import settings
+
+logger = logging.getLogger("djangoStripe")
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """raised instead of starting a call that doesn't fit in what is left of the request deadline"""
+
+
+def remaining() -> float | None:
+    """return the seconds left until the deadline of the current request, or None if it has none"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """set the deadline of the code inside the block. A deadline already set is only shortened,
+    never extended."""
+    if seconds is None:
+        yield
+        return
+
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def request_deadline(seconds: float) -> Callable:
+    """decorator to views that need a shorter deadline than `REQUEST_DEADLINE_SECONDS`"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(*args, **kwargs):
+            with deadline(seconds):
+                return view_func(*args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+class DeadlineMiddleware:
+    """set the deadline of each request to `REQUEST_DEADLINE_SECONDS` from its start. Must be
+    placed near the top of the middleware list, to count the time spent on the next ones."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline(getattr(settings, 'REQUEST_DEADLINE_SECONDS', None)):
+            return self.get_response(request)
+
+
+def call_timeout(default: float) -> float:
+    """return the timeout of the next outgoing call: the default timeout, reduced to what is
+    left of the request deadline.
+
+    Raises:
+        DeadlineExceeded: if less than `STRIPE_MIN_CALL_TIMEOUT` seconds are left.
+    """
+    left = remaining()
+    if left is None:
+        return default
+
+    minimum = getattr(settings, 'STRIPE_MIN_CALL_TIMEOUT', 0.5)
+    if left < minimum:
+        raise DeadlineExceeded(f"only {max(left, 0):.3f}s left of the request deadline")
+    return min(default, left)
+
+
+_hedge_executor: ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        # the concurrent first calls would each create an executor, leaking their threads
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'STRIPE_HEDGE_MAX_WORKERS', 8),
+                    thread_name_prefix='stripe-hedge',
+                )
+    return _hedge_executor
+
+
+def hedged_call(func: Callable, *args, hedge_after: float | None = None, **kwargs) -> Any:
+    """call the function and, if it hasn't returned after `hedge_after` seconds, call it again
+    concurrently, returning the first result. Must only be used with idempotent reads.
+
+    Args:
+        func (Callable): the function called.
+        hedge_after (float, optional): seconds before the hedged call. None disables the hedging.
+    """
+    left = remaining()
+    if hedge_after is None or (left is not None and left <= hedge_after):
+        return func(*args, **kwargs)
+
+    executor = _get_hedge_executor()
+
+    def submit():
+        # the copied context keeps the request deadline inside the worker thread
+        context = contextvars.copy_context()
+        return executor.submit(context.run, func, *args, **kwargs)
+
+    first = submit()
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    logger.info(f"hedging the call to {getattr(func, '__qualname__', func)}")
+    pending = {first, submit()}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
@@ -0,0 +1,85 @@
+"""Streaming of query rows as CSV or JSON lines, optionally gzipped, at constant memory: the
+rows are read by chunks from a server side cursor and encoded as they go."""
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+
+# bytes accumulated before each yield, so the response isn't sent a row at a time
+BUFFER_SIZE = 64 * 1024
+
+
+class _LineBuffer:
+    """file-like object collecting the lines written by `csv.writer`"""
+    def __init__(self):
+        self.lines: list[str] = []
+
+    def write(self, line: str) -> None:
+        self.lines.append(line)
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool, dict, list)):
+        return value
+    return str(value)  # phone numbers, decimals, uuids
+
+
+def encode_rows(rows: Iterable[dict[str, Any]], fields: list[str], fmt: str) -> Iterator[str]:
+    """encode the rows in the format, one string per row (the csv header first)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format `{fmt}`, use one of {FORMATS}")
+
+    if fmt == JSONL:
+        for row in rows:
+            yield json.dumps({field: _plain(row[field]) for field in fields}) + '\n'
+        return
+
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([
+            json.dumps(value) if isinstance(value, (dict, list)) else value
+            for value in (_plain(row[field]) for field in fields)
+        ])
+        yield from buffer.lines
+        buffer.lines.clear()
+    yield from buffer.lines
+
+
+def stream_rows(rows: Iterable[dict[str, Any]], fields: list[str], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """encode the rows and yield them in chunks of about `BUFFER_SIZE` bytes, gzipped if
+    `compress`"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # 31: gzip container
+    chunk: list[bytes] = []
+    size = 0
+    for line in encode_rows(rows, fields, fmt):
+        data = line.encode()
+        chunk.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            data = b''.join(chunk)
+            chunk, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    data = b''.join(chunk)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def filename(name: str, fmt: str, compress: bool) -> str:
+    return f"{name}.{fmt}" + ('.gz' if compress else '')
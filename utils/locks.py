@@ -0,0 +1,35 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+class LockNotAcquired(Exception):
+    """raised when the lock is still held by someone else after the wait time"""
+
+
+@contextmanager
+def cache_lock(key: str, timeout: float = 30, wait: float = 10, interval: float = 0.05) -> Iterator[None]:
+    """lock shared by all the processes using the same cache backend.
+
+    Args:
+        key (str): the lock name.
+        timeout (float): seconds after which the lock expires, if the holder never releases it.
+        wait (float): seconds waiting for the lock before raising `LockNotAcquired`.
+        interval (float): seconds between the tries to acquire the lock.
+    """
+    token = uuid4().hex
+    give_up_at = time.monotonic() + wait
+    while not cache.add(key, token, timeout):
+        if time.monotonic() >= give_up_at:
+            raise LockNotAcquired(key)
+        time.sleep(interval)
+
+    try:
+        yield
+    finally:
+        # only release the lock if it didn't expire and was taken by someone else
+        if cache.get(key) == token:
+            cache.delete(key)
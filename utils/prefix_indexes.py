@@ -0,0 +1,44 @@
+"""Indexes of the admin `^` (prefix) searches. The admin runs them as
+`UPPER(column) LIKE UPPER('prefix%')`, which postgres only serves from an index on the same
+expression with the pattern operator class. The other databases don't get them.
+
+The prefix searches only match the start of the fields: searching `mail.com` no longer finds
+the users by the domain of their email, like the default substring search did.
+
+The indexes are built `CONCURRENTLY`, without locking the writes of the large tables, so the
+migrations using them must be `atomic = False`."""
+from django.db import migrations
+
+
+def add_prefix_indexes(indexes: dict[str, tuple[str, str]]) -> migrations.RunPython:
+    """return the migration operation creating the prefix indexes, dropped when reverted
+
+    Args:
+        indexes (dict): the table and column of each index, by index name.
+    """
+    def create_indexes(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for name, (table, column) in indexes.items():
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.relname = %s AND NOT i.indisvalid",
+                    [name],
+                )
+                invalid = cursor.fetchone() is not None
+            if invalid:
+                # left by an interrupted concurrent build, `IF NOT EXISTS` would keep it
+                schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+                f'ON "{table}" (UPPER("{column}"::text) text_pattern_ops)'
+            )
+
+    def drop_indexes(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for name in indexes:
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+    return migrations.RunPython(create_indexes, drop_indexes)
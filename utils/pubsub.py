@@ -0,0 +1,100 @@
+"""Lightweight publish/subscribe of the latest message of each channel, shared by all the
+workers through the django cache.
+
+The publishers store the message of the channel in the cache. Each worker process polls the
+channels its subscribers listen to, in a single `get_many` per interval whatever the number of
+subscribers, and fans the new messages out to them. Use a cache shared by the workers (like
+redis or memcached) for the messages to cross processes."""
+import asyncio
+import uuid
+from typing import Any, AsyncIterator
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _cache_key(channel: str) -> str:
+    return f"pubsub:{channel}"
+
+
+def publish(channel: str, message: Any) -> None:
+    """replace the message of the channel, delivered to its subscribers on their next poll"""
+    cache.set(
+        _cache_key(channel),
+        {'version': uuid.uuid4().hex, 'message': message},
+        getattr(settings, 'PUBSUB_MESSAGE_TIMEOUT', 60 * 60),
+    )
+
+
+def last_message(channel: str) -> Any:
+    stored = cache.get(_cache_key(channel))
+    return stored['message'] if stored else None
+
+
+class Broker:
+    """delivers the messages of the cache to the subscribers of an event loop, with a single
+    polling task while there are subscribers"""
+    def __init__(self, poll_interval: float | None = None):
+        self.poll_interval = poll_interval or getattr(settings, 'PUBSUB_POLL_INTERVAL', 0.5)
+        self._queues: dict[str, set[asyncio.Queue]] = {}
+        self._versions: dict[str, str | None] = {}
+        self._task: asyncio.Task | None = None
+
+    async def _poll(self) -> None:
+        while self._queues:
+            channels = list(self._queues)
+            stored = await cache.aget_many([_cache_key(channel) for channel in channels])
+            for channel in channels:
+                value = stored.get(_cache_key(channel))
+                if value is None or value['version'] == self._versions.get(channel):
+                    continue
+                self._versions[channel] = value['version']
+                for queue in self._queues.get(channel, ()):
+                    queue.put_nowait(value['message'])
+            await asyncio.sleep(self.poll_interval)
+        self._task = None
+
+    async def subscribe(self, channel: str, timeout: float | None = None) -> AsyncIterator[Any]:
+        """yield the current message of the channel, if any, and the next ones. Yields None
+        when `timeout` seconds pass without messages, so the caller can send a keep alive."""
+        queue: asyncio.Queue = asyncio.Queue()
+        stored = await cache.aget(_cache_key(channel))
+        if stored is not None:
+            queue.put_nowait(stored['message'])
+            self._versions.setdefault(channel, stored['version'])
+
+        self._queues.setdefault(channel, set()).add(queue)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            subscribers = self._queues.get(channel, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                self._queues.pop(channel, None)
+                self._versions.pop(channel, None)
+
+
+_brokers: dict[int, Broker] = {}
+
+
+def get_broker() -> Broker:
+    """return the broker of the running event loop"""
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(id(loop))
+    if broker is None:
+        # drops the brokers of the closed loops (each test or `async_to_sync` call has its own)
+        for key in [key for key, value in _brokers.items() if value._task is None]:
+            del _brokers[key]
+        broker = _brokers[id(loop)] = Broker()
+    return broker
+
+
+async def subscribe(channel: str, timeout: float | None = None) -> AsyncIterator[Any]:
+    async for message in get_broker().subscribe(channel, timeout):
+        yield message
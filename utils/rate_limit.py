@@ -0,0 +1,106 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """Thread safe token bucket limiting the rate of the outgoing calls of a process.
+
+    Args:
+        rate (float): tokens added per second, the sustained calls per second.
+        burst (int, optional): the maximum of tokens saved, the calls allowed at once. Defaults
+            to the rate.
+    """
+    def __init__(self, rate: float, burst: int | None = None):
+        if rate <= 0:
+            raise ValueError("the rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """take a token if available, returning 0, otherwise the seconds until the next token"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """wait for a token"""
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+
+def _incr(key: str, timeout: float) -> int:
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:  # expired between the add and the incr
+        cache.set(key, 1, timeout)
+        return 1
+
+
+class SlidingWindowLimiter:
+    """Limit of hits per key in a sliding window, shared by the workers through the django cache.
+
+    The window is approximated by the counts of the current and previous fixed windows, the
+    previous one weighted by how much of it is still inside the sliding window. The rejected
+    hits aren't counted, so they don't extend the block.
+
+    Args:
+        limit (int): the hits allowed in the window.
+        window (int): the window in seconds.
+    """
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+
+    def hit(self, key: str) -> int:
+        """count a hit of the key if allowed.
+
+        Returns:
+            int: 0 if the hit was allowed, otherwise the seconds until the key is allowed again.
+        """
+        now = time.time()
+        current = int(now // self.window)
+        elapsed = now - current * self.window
+        current_key = f"ratelimit:{key}:{current}"
+        previous_key = f"ratelimit:{key}:{current - 1}"
+
+        counts = cache.get_many([current_key, previous_key])
+        current_count = counts.get(current_key, 0)
+        previous_count = counts.get(previous_key, 0)
+        previous_weight = (self.window - elapsed) / self.window
+        if previous_count * previous_weight + current_count + 1 > self.limit:
+            if current_count + 1 > self.limit or not previous_count:
+                retry_after = self.window - elapsed
+            else:
+                # time until the previous window weight leaves room to one more hit
+                retry_after = (self.window - elapsed) - (self.limit - 1 - current_count) * self.window / previous_count
+            return max(1, math.ceil(retry_after))
+
+        _incr(current_key, self.window * 2)
+        return 0
+
+
+def count_rejection(scope: str) -> None:
+    _incr(f"ratelimit:rejections:{scope}", getattr(settings, 'RATE_LIMIT_REJECTIONS_TIMEOUT', 60 * 60 * 24))
+
+
+def rejections(scopes: list[str]) -> dict[str, int]:
+    """return the rejections of the scopes counted in the last day (by default)"""
+    counts = cache.get_many([f"ratelimit:rejections:{scope}" for scope in scopes])
+    return {scope: counts.get(f"ratelimit:rejections:{scope}", 0) for scope in scopes}
@@ -0,0 +1,129 @@
+"""Time spent per category (stripe calls, database queries, template rendering) by each
+request, sent back in the `Server-Timing` header so the browser devtools and the APM show
+the breakdown of slow requests."""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Iterator
+
+from django.conf import settings
+from django.db import connections
+from django.shortcuts import render
+
+logger = logging.getLogger("djangoStripe")
+
+STRIPE = 'stripe'
+DB = 'db'
+TEMPLATE = 'tpl'
+
+DESCRIPTIONS = {STRIPE: 'Stripe API', DB: 'Database', TEMPLATE: 'Templates'}
+
+
+class Timings:
+    """totals, in seconds, and counts by category. Shared with the threads started with a
+    copy of the request context (like the hedged stripe calls), so the updates are locked."""
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, category: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[category] = self.totals.get(category, 0.0) + seconds
+            self.counts[category] = self.counts.get(category, 0) + 1
+
+    def as_dict(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                category: {'ms': round(total * 1000, 2), 'count': self.counts[category]}
+                for category, total in self.totals.items()
+            }
+
+
+_timings: contextvars.ContextVar[Timings | None] = contextvars.ContextVar('server_timings', default=None)
+
+
+def current_timings() -> Timings | None:
+    return _timings.get()
+
+
+@contextmanager
+def timed(category: str) -> Iterator[None]:
+    """add the time spent in the block to the category of the current request. Does nothing
+    outside of a request measured by `ServerTimingMiddleware`."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(category, time.perf_counter() - start)
+
+
+def timed_render(request, template_name, context=None, *args, **kwargs):
+    """`django.shortcuts.render` counting the rendering time in the `tpl` category"""
+    with timed(TEMPLATE):
+        return render(request, template_name, context, *args, **kwargs)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    with timed(DB):
+        return execute(sql, params, many, context)
+
+
+def header_value(timings: Timings, total: float) -> str:
+    """format the timings as the `Server-Timing` header, the time of each category is the sum
+    of its calls"""
+    metrics = [
+        f'{category};dur={values["ms"]};desc="{DESCRIPTIONS.get(category, category)} ({values["count"]})"'
+        for category, values in timings.as_dict().items()
+    ]
+    metrics.append(f'total;dur={round(total * 1000, 2)}')
+    return ', '.join(metrics)
+
+
+class ServerTimingMiddleware:
+    """measure the stripe, database and template time of each request and add the
+    `Server-Timing` header to the response.
+
+    Must be the first middleware, to count the time of the others in the total. The
+    `SERVER_TIMING_LOG_SAMPLE_RATE` setting (0 to 1, 0 by default) logs the timings of that
+    fraction of the requests. Disabled by `SERVER_TIMING_ENABLED = False`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SERVER_TIMING_ENABLED', True):
+            return self.get_response(request)
+
+        timings = Timings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_db_wrapper))
+                response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        total = time.perf_counter() - start
+
+        value = header_value(timings, total)
+        if response.has_header('Server-Timing'):
+            value = f"{response['Server-Timing']}, {value}"
+        response['Server-Timing'] = value
+
+        sample_rate = getattr(settings, 'SERVER_TIMING_LOG_SAMPLE_RATE', 0)
+        if sample_rate and random.random() < sample_rate:
+            logger.info(
+                f"timings of {request.method} {request.path} ({response.status_code}): "
+                f"total {round(total * 1000, 2)}ms {timings.as_dict()}"
+            )
+        return response
@@ -0,0 +1,210 @@
+"""Read-through cache of the stripe objects, with a small LRU in each process (L1) in front of
+the django cache (L2), shared by the workers.
+
+Each object type lives for its own time (`STRIPE_READ_CACHE_TTLS`), the webhooks invalidate
+the objects they carry, and the concurrent misses of the same object in a process wait for a
+single call to stripe. The other processes only see the invalidations through the L2, so the
+L1 entries live at most `STRIPE_READ_CACHE_L1_TTL` seconds.
+
+The cached objects are shared by the callers, don't change them. Prefer caching the small and
+immutable `utils.stripe_snapshots` to the full stripe objects."""
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stripe_clients import current_account
+
+# seconds each object type is cached, by the `object` value of stripe. The types without a
+# time to live aren't cached
+DEFAULT_TTLS = {
+    'checkout.session': 10,
+    'payment_intent': 10,
+    'customer': 5 * 60,
+}
+
+
+def _variant(params: dict[str, Any] | None) -> str:
+    """the key of the retrieve params (like `expand`), each one is cached apart"""
+    return json.dumps(params, sort_keys=True) if params else ''
+
+
+class LRUCache:
+    """thread safe LRU of the process, expiring each entry after its time to live"""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """return if the key was found and its value"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class StripeReadCache:
+    """two tier cache of the stripe objects retrieved by id.
+
+    The L2 keeps one entry per object, with the variants retrieved with different params, so
+    the invalidation of an object is a single cache write. The invalidation is stored in the
+    entry, so a retrieve started before it doesn't cache the stale object after it.
+
+    Args:
+        maxsize (int, optional): entries of the L1, by default the `STRIPE_READ_CACHE_L1_SIZE`
+            setting or 1024.
+    """
+    def __init__(self, maxsize: int | None = None):
+        self.local = LRUCache(maxsize or getattr(settings, 'STRIPE_READ_CACHE_L1_SIZE', 1024))
+        self.stats: Counter[str] = Counter()
+        self._flights: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ttls() -> dict[str, int]:
+        return {**DEFAULT_TTLS, **getattr(settings, 'STRIPE_READ_CACHE_TTLS', {})}
+
+    def ttl(self, object_type: str) -> int:
+        return self.ttls().get(object_type) or 0
+
+    @staticmethod
+    def _key(object_id: str, account: str | None) -> str:
+        return f"stripe:read:{account or current_account()}:{object_id}"
+
+    def get(
+        self,
+        object_type: str,
+        object_id: str,
+        fetch: Callable[[], Any],
+        params: dict[str, Any] | None = None,
+        account: str | None = None,
+    ) -> Any:
+        """return the object from the L1, the L2 or, on a miss, from `fetch`, called once for
+        all the concurrent misses of the process. The errors of `fetch` are raised to all of
+        them and aren't cached.
+
+        Args:
+            object_type (str): the stripe object type, like `checkout.session`, selecting the
+                time to live.
+            object_id (str): the stripe object id.
+            fetch (Callable): retrieves the object from stripe, called without arguments.
+            params (dict, optional): the retrieve params passed to `fetch`, part of the key.
+            account (str, optional): the stripe account of the object, by default the account
+                of the current request.
+        """
+        ttl = self.ttl(object_type)
+        if not ttl or not getattr(settings, 'STRIPE_READ_CACHE_ENABLED', True):
+            return fetch()
+
+        key = self._key(object_id, account)
+        local_key = f"{key}|{_variant(params)}"
+        found, obj = self.local.get(local_key)
+        if found:
+            self.stats['l1'] += 1
+            return obj
+
+        with self._lock:
+            flight = self._flights.get(local_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[local_key] = Future()
+        if not leader:
+            self.stats['coalesced'] += 1
+            return flight.result()
+
+        try:
+            obj = self._load(key, local_key, _variant(params), ttl, fetch)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(obj)
+        finally:
+            with self._lock:
+                del self._flights[local_key]
+        return obj
+
+    def _load(self, key: str, local_key: str, variant: str, ttl: int, fetch: Callable[[], Any]) -> Any:
+        local_ttl = min(ttl, getattr(settings, 'STRIPE_READ_CACHE_L1_TTL', 2))
+        entry = cache.get(key)
+        if entry is not None and variant in entry['variants']:
+            expires_at, obj = entry['variants'][variant]
+            if expires_at > time.time():
+                self.stats['l2'] += 1
+                self.local.set(local_key, obj, local_ttl)
+                return obj
+
+        self.stats['miss'] += 1
+        started_at = time.time()
+        obj = fetch()
+
+        # read again, the entry may be invalidated or have new variants since the first read
+        entry = cache.get(key) or {'invalidated_at': 0, 'variants': {}}
+        if entry['invalidated_at'] >= started_at:
+            return obj
+        now = time.time()
+        variants = {
+            name: value for name, value in entry['variants'].items() if value[0] > now
+        }
+        variants[variant] = (now + ttl, obj)
+        cache.set(key, {'invalidated_at': entry['invalidated_at'], 'variants': variants}, ttl)
+        self.local.set(local_key, obj, local_ttl)
+        return obj
+
+    def invalidate(self, object_id: str, account: str | None = None) -> None:
+        """drop the object from the caches, all the variants"""
+        key = self._key(object_id, account)
+        self.local.delete_prefix(f"{key}|")
+        # kept while a variant cached before the invalidation could be retrieved
+        ttl = max(self.ttls().values(), default=0) or 1
+        cache.set(key, {'invalidated_at': time.time(), 'variants': {}}, ttl)
+
+    def clear(self) -> None:
+        """drop the L1 of the process and the stats, the L2 entries expire by themselves"""
+        self.local.clear()
+        self.stats.clear()
+
+
+read_cache = StripeReadCache()
+
+
+def cached_retrieve(
+    object_type: str,
+    object_id: str,
+    fetch: Callable[[], Any],
+    params: dict[str, Any] | None = None,
+    account: str | None = None,
+) -> Any:
+    """`StripeReadCache.get` of the process cache"""
+    return read_cache.get(object_type, object_id, fetch, params, account)
+
+
+def invalidate(object_id: str, account: str | None = None) -> None:
+    read_cache.invalidate(object_id, account)
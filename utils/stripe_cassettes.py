@@ -0,0 +1,160 @@
+"""Record and replay of the stripe API calls, so the tests calling stripe run offline and
+deterministically. Imports the stripe package, so it must only be imported when the SDK is
+loaded (see `utils.stripe_sdk`)."""
+import io
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import parse_qsl, urlsplit
+
+import stripe
+
+from .stripe_clients import reset_clients
+from .stripe_sdk import stripe as lazy_stripe
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# the response headers kept in the cassettes, the others are irrelevant to the SDK
+KEPT_HEADERS = ('content-type', 'request-id', 'idempotency-key', 'idempotent-replayed', 'stripe-version')
+
+
+class CassetteError(Exception):
+    """raised when a call doesn't match the cassette being replayed"""
+
+
+class CassetteHTTPClient(stripe.HTTPClient):
+    """stripe http client which records the calls to a cassette file, through the real client,
+    or replays the recorded responses without touching the network.
+
+    The calls are matched by method, path (query included) and form body in the recorded
+    order, so the same test can call the same endpoint many times. The streamed responses are
+    recorded and replayed whole.
+
+    Args:
+        path (Path | str): the cassette file, a json with the recorded interactions.
+        mode (str): `record` to call stripe and save the cassette, `replay` to answer from it.
+        inner (stripe.HTTPClient, optional): the client calling stripe when recording.
+    """
+    name = 'cassette'
+
+    def __init__(self, path: Path | str, mode: str = REPLAY, inner: Any = None):
+        super().__init__()
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"unknown cassette mode `{mode}`")
+
+        self.path = Path(path)
+        self.mode = mode
+        self.inner = inner
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            if not self.path.exists():
+                raise CassetteError(
+                    f"the cassette {self.path} doesn't exist, record it with STRIPE_CASSETTE_MODE=record"
+                )
+            self.interactions = json.loads(self.path.read_text())['interactions']
+        else:
+            self.interactions = []
+        self._played = [False] * len(self.interactions)
+
+    @staticmethod
+    def _target(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+    @staticmethod
+    def _body(post_data: str | bytes | None) -> dict[str, str] | None:
+        """the form encoded body as a dict, so the order of the params doesn't matter"""
+        if isinstance(post_data, bytes):
+            post_data = post_data.decode()
+        return dict(parse_qsl(post_data, keep_blank_values=True)) if post_data else None
+
+    def request(self, method, url, headers, post_data=None, *, _usage=None):
+        target = self._target(url)
+        if self.mode == RECORD:
+            return self._record(method, url, target, headers, post_data)
+        return self._replay(method, target, self._body(post_data))
+
+    def _record(self, method, url, target, headers, post_data):
+        content, status, response_headers = self.inner.request(method, url, headers, post_data)
+        body = content.decode() if isinstance(content, bytes) else content
+        with self._lock:
+            self.interactions.append({
+                'request': {
+                    'method': method,
+                    'target': target,
+                    'body': self._body(post_data),
+                },
+                'response': {
+                    'status': status,
+                    'headers': {
+                        key.lower(): value for key, value in response_headers.items()
+                        if key.lower() in KEPT_HEADERS
+                    },
+                    'body': json.loads(body) if body else None,
+                },
+            })
+        return content, status, response_headers
+
+    def _replay(self, method, target, body):
+        with self._lock:
+            for i, interaction in enumerate(self.interactions):
+                request = interaction['request']
+                recorded = (request['method'], request['target'], request['body'])
+                if not self._played[i] and recorded == (method, target, body):
+                    self._played[i] = True
+                    break
+            else:
+                raise CassetteError(
+                    f"no recorded call left to {method.upper()} {target} with the body {body} in {self.path}"
+                )
+
+        response = interaction['response']
+        body = json.dumps(response['body']) if response['body'] is not None else ''
+        return body, response['status'], dict(response['headers'])
+
+    def request_stream(self, method, url, headers, post_data=None, *, _usage=None):
+        content, status, response_headers = self.request(method, url, headers, post_data)
+        if isinstance(content, str):
+            content = content.encode()
+        return io.BytesIO(content), status, response_headers
+
+    def unplayed(self) -> list[str]:
+        """the recorded calls not made by the replay"""
+        return [
+            f"{interaction['request']['method'].upper()} {interaction['request']['target']}"
+            for interaction, played in zip(self.interactions, self._played) if not played
+        ]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps({'interactions': self.interactions}, indent=2) + '\n')
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+@contextmanager
+def use_cassette(path: Path | str, mode: str = REPLAY) -> Iterator[CassetteHTTPClient]:
+    """make all the stripe clients use a `CassetteHTTPClient` inside the block. When recording
+    the cassette is saved at the end, when replaying the block must make all the recorded calls.
+    """
+    # installs the default http client first, so loading the SDK later doesn't replace the cassette
+    lazy_stripe.load()
+    previous = stripe.default_http_client
+    cassette = CassetteHTTPClient(path, mode, inner=previous)
+    stripe.default_http_client = cassette
+    reset_clients()
+    try:
+        yield cassette
+    finally:
+        stripe.default_http_client = previous
+        reset_clients()
+
+    if mode == RECORD:
+        cassette.save()
+    elif unplayed := cassette.unplayed():
+        raise CassetteError(f"recorded calls not made by the test: {', '.join(unplayed)}")
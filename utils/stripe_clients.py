@@ -0,0 +1,129 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .stripe_sdk import stripe
+
+DEFAULT_ACCOUNT = 'default'
+
+_current_account: contextvars.ContextVar[str] = contextvars.ContextVar('stripe_account', default=DEFAULT_ACCOUNT)
+_clients: dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_accounts() -> dict[str, dict[str, Any]]:
+    """return the stripe accounts configuration, by account name.
+
+    The accounts are configured by the `STRIPE_ACCOUNTS` setting, with the keys `secret_key`,
+    `public_key`, `webhook_secret` and the optional `stripe_account` (to act as a connected
+    account) and `api_base`. Without the setting, the `default` account is made from the
+    `STRIPE_SECRET_KEY`, `STRIPE_PUBLIC_KEY` and `STRIPE_WEBHOOK_SECRET` settings.
+    """
+    accounts = getattr(settings, 'STRIPE_ACCOUNTS', None)
+    if accounts:
+        return accounts
+    return {
+        DEFAULT_ACCOUNT: {
+            'secret_key': settings.STRIPE_SECRET_KEY,
+            'public_key': settings.STRIPE_PUBLIC_KEY,
+            'webhook_secret': settings.STRIPE_WEBHOOK_SECRET,
+        }
+    }
+
+
+def get_account_config(name: str | None = None) -> dict[str, Any]:
+    name = name or _current_account.get()
+    try:
+        return get_accounts()[name]
+    except KeyError:
+        raise ValueError(f"the stripe account `{name}` is not configured") from None
+
+
+def get_client(name: str | None = None) -> "stripe.StripeClient":
+    """return the stripe client of the account, by default the account of the current request.
+
+    The clients are built once per process and are safe to share between threads, since
+    they don't use the `stripe.api_key` global.
+    """
+    name = name or _current_account.get()
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        if name not in _clients:
+            config = get_account_config(name)
+            _clients[name] = stripe.StripeClient(
+                config['secret_key'],
+                stripe_account=config.get('stripe_account'),
+                base_addresses={'api': config['api_base']} if config.get('api_base') else {},
+                http_client=stripe.default_http_client,
+            )
+        return _clients[name]
+
+
+def reset_clients() -> None:
+    """discard the built clients, they are built again with the current settings"""
+    with _lock:
+        _clients.clear()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    if setting in ('STRIPE_ACCOUNTS', 'STRIPE_SECRET_KEY'):
+        reset_clients()
+
+
+def current_account() -> str:
+    return _current_account.get()
+
+
+@contextmanager
+def use_account(name: str) -> Iterator[None]:
+    """select the stripe account used by `get_client` inside the block, outside of a request"""
+    token = _current_account.set(name)
+    try:
+        yield
+    finally:
+        _current_account.reset(token)
+
+
+def resolve_account(request) -> str:
+    """return the name of the account used by the request.
+
+    The `STRIPE_ACCOUNT_RESOLVER` setting can point to a function receiving the request (to
+    select by tenant, user, etc). Otherwise the account is selected by the request host, with
+    the `STRIPE_ACCOUNT_HOSTS` setting, falling back to the `default` account.
+    """
+    resolver = getattr(settings, 'STRIPE_ACCOUNT_RESOLVER', None)
+    if resolver is not None:
+        return import_string(resolver)(request)
+
+    host = request.get_host().split(':')[0]
+    return getattr(settings, 'STRIPE_ACCOUNT_HOSTS', {}).get(host, DEFAULT_ACCOUNT)
+
+
+def get_request_client(request) -> "stripe.StripeClient":
+    """return the stripe client of the account selected to the request"""
+    return get_client(getattr(request, 'stripe_account', None) or resolve_account(request))
+
+
+class StripeAccountMiddleware:
+    """select the stripe account of each request, available as `request.stripe_account` and
+    used by `get_client` when called without an account name"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.stripe_account = resolve_account(request)
+        token = _current_account.set(request.stripe_account)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_account.reset(token)
@@ -0,0 +1,53 @@
+"""Stripe http client used by the SDK. Imports the stripe package, so it must only be
+imported when the SDK is loaded (see `utils.stripe_sdk`)."""
+import requests
+import stripe
+from django.conf import settings
+
+from .deadlines import DeadlineExceeded, call_timeout, remaining
+from .server_timing import STRIPE, timed
+
+
+class DeadlineRequestsClient(stripe.RequestsClient):
+    """stripe http client which sizes the timeout of each request, retries included, by the
+    deadline of the current request"""
+    @property
+    def _timeout(self) -> float:
+        return call_timeout(self._default_timeout)
+
+    @_timeout.setter
+    def _timeout(self, value: float) -> None:
+        self._default_timeout = value
+
+    def request(self, *args, **kwargs):
+        # fails fast, before opening the connection, if there is no time left
+        call_timeout(self._default_timeout)
+        try:
+            with timed(STRIPE):
+                return super().request(*args, **kwargs)
+        except stripe.APIConnectionError as e:
+            # a timeout caused by the budget of the request is not a stripe failure
+            left = remaining()
+            if left is not None and left < getattr(settings, 'STRIPE_MIN_CALL_TIMEOUT', 0.5):
+                raise DeadlineExceeded("the request deadline expired during the call") from e
+            raise
+
+
+def shared_session() -> requests.Session:
+    """requests session whose connection pool is shared by all the threads, keeping up to
+    `STRIPE_HTTP_POOL_SIZE` (10 by default) connections open. By default the SDK client opens a
+    session in each thread, so a connection opened by one thread isn't reused by the others."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=getattr(settings, 'STRIPE_HTTP_POOL_SIZE', 10))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def install_http_client() -> None:
+    """make the stripe SDK use `DeadlineRequestsClient` on a session shared by the threads,
+    keeping `STRIPE_TIMEOUT` (80s by default) as the timeout of the calls made without a
+    deadline"""
+    stripe.default_http_client = DeadlineRequestsClient(
+        timeout=getattr(settings, 'STRIPE_TIMEOUT', 80), session=shared_session()
+    )
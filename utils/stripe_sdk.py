@@ -0,0 +1,87 @@
+import importlib
+import logging
+import threading
+from types import ModuleType
+from typing import Any
+
+from django.conf import settings
+
+logger = logging.getLogger("djangoStripe")
+
+
+class LazyStripe:
+    """Proxy to the `stripe` package which only imports it on the first attribute access.
+
+    Importing the SDK takes a good part of the process startup, so the modules use this proxy
+    instead of `import stripe`, and the commands and workers that never call stripe don't pay
+    for it. The SDK http client is configured when loaded, the api keys are given by the
+    clients of `utils.stripe_clients`.
+    """
+    def __init__(self):
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def load(self) -> ModuleType:
+        """import and configure the stripe package, if not done yet, and return it"""
+        if self._module is not None:
+            return self._module
+
+        with self._lock:
+            if self._module is None:
+                module = importlib.import_module('stripe')
+
+                from .stripe_http import install_http_client
+
+                install_http_client()
+                object.__setattr__(self, '_module', module)
+                logger.debug("stripe SDK loaded")
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.load(), name, value)
+
+
+stripe = LazyStripe()
+
+
+def warm_up() -> None:
+    """load the stripe SDK, the checkout templates and open the connection to the stripe API,
+    so the first requests of a worker don't pay for them"""
+    from django.template.loader import get_template
+
+    stripe.load()
+    for template in getattr(settings, 'STRIPE_WARMUP_TEMPLATES', []):
+        get_template(template)
+    warm_up_connection()
+
+
+def warm_up_connection() -> None:
+    """open a connection to the stripe API, kept in the pool of the http client for the next
+    calls. The pool is shared by the threads (see `utils.stripe_http.shared_session`), the
+    connections beyond the first one are still opened by the requests needing them. The
+    response status doesn't matter."""
+    try:
+        stripe.default_http_client.request('get', stripe.api_base, {})
+    except Exception as e:
+        logger.warning(f"stripe connection warm up failed: {str(e)}")
+
+
+def reset_after_fork() -> None:
+    """give the forked worker its own http client, so it doesn't share the connections
+    inherited from the parent process, and warm it up again"""
+    if not stripe.loaded:
+        return
+
+    from .stripe_clients import reset_clients
+    from .stripe_http import install_http_client
+
+    install_http_client()
+    reset_clients()
+    warm_up_connection()
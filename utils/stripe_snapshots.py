@@ -0,0 +1,148 @@
+"""Small immutable copies of the stripe objects, with only the fields the pages, caches and
+ledgers use, instead of the full `StripeObject` trees.
+
+The snapshots are built from the API responses or the webhook payloads, read like the stripe
+objects (`snapshot.status` or `snapshot['status']`), pickle as a plain tuple and serialize to
+a compact json array (`dumps` / `loads`)."""
+import json
+from dataclasses import dataclass, fields
+from functools import cache
+from typing import Any, ClassVar
+
+
+def _id(value: Any) -> str | None:
+    """the id of a field which may be expanded"""
+    if value is None or isinstance(value, str):
+        return value
+    return value['id']
+
+
+@cache
+def _field_names(cls: type) -> tuple[str, ...]:
+    return tuple(field.name for field in fields(cls))
+
+
+@dataclass(frozen=True, slots=True)
+class StripeSnapshot:
+    object_type: ClassVar[str]
+
+    id: str
+
+    def values(self) -> tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in _field_names(type(self)))
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'object':
+            return self.object_type
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __reduce__(self):
+        # the field values only, without their names
+        return type(self), self.values()
+
+
+@dataclass(frozen=True, slots=True)
+class CheckoutSessionSnapshot(StripeSnapshot):
+    object_type: ClassVar[str] = 'checkout.session'
+
+    status: str | None
+    payment_status: str | None
+    amount_total: int | None
+    currency: str | None
+    customer_id: str | None
+    customer_email: str | None
+    payment_intent_id: str | None
+
+    @classmethod
+    def from_stripe(cls, session: Any) -> "CheckoutSessionSnapshot":
+        return cls(
+            session['id'],
+            session.get('status'),
+            session.get('payment_status'),
+            session.get('amount_total'),
+            session.get('currency'),
+            _id(session.get('customer')),
+            session.get('customer_email'),
+            _id(session.get('payment_intent')),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class PaymentIntentSnapshot(StripeSnapshot):
+    object_type: ClassVar[str] = 'payment_intent'
+
+    status: str
+    amount: int
+    amount_received: int
+    currency: str
+    capture_method: str | None
+    customer_id: str | None
+    customer_email: str | None
+    created: int | None
+
+    @classmethod
+    def from_stripe(cls, intent: Any) -> "PaymentIntentSnapshot":
+        customer = intent.get('customer')
+        # the email is only known when the customer is expanded
+        email = customer.get('email') if customer is not None and not isinstance(customer, str) else None
+        return cls(
+            intent['id'],
+            intent['status'],
+            intent['amount'],
+            intent.get('amount_received') or 0,
+            intent['currency'],
+            intent.get('capture_method'),
+            _id(customer),
+            email,
+            intent.get('created'),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class CustomerSnapshot(StripeSnapshot):
+    object_type: ClassVar[str] = 'customer'
+
+    email: str | None
+    name: str | None
+    deleted: bool
+
+    @classmethod
+    def from_stripe(cls, customer: Any) -> "CustomerSnapshot":
+        return cls(customer['id'], customer.get('email'), customer.get('name'), bool(customer.get('deleted')))
+
+
+SNAPSHOT_TYPES: dict[str, type[StripeSnapshot]] = {
+    cls.object_type: cls for cls in (CheckoutSessionSnapshot, PaymentIntentSnapshot, CustomerSnapshot)
+}
+
+
+def snapshot(obj: Any) -> StripeSnapshot:
+    """return the snapshot of a stripe object, by its `object` type
+
+    Raises:
+        ValueError: if the object type has no snapshot.
+    """
+    try:
+        cls = SNAPSHOT_TYPES[obj['object']]
+    except KeyError:
+        raise ValueError(f"no snapshot of the stripe object type `{obj.get('object')}`") from None
+    return cls.from_stripe(obj)
+
+
+def dumps(snap: StripeSnapshot) -> str:
+    """serialize the snapshot as a json array of its type and field values"""
+    return json.dumps([snap.object_type, *snap.values()], separators=(',', ':'))
+
+
+def loads(data: str | bytes) -> StripeSnapshot:
+    object_type, *values = json.loads(data)
+    return SNAPSHOT_TYPES[object_type](*values)
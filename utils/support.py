@@ -7,3 +7,11 @@ def get_user_lang(request, default: str | None = None):
     
     elif default is not None:
         return default
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]